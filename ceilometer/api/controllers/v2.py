@@ -22,6 +22,11 @@
 # [GET ] / -- information about this version of the API
 #
 # [GET   ] /resources -- list the resources
+#
+# The listings accept a limit and return a Link header with rel="next"
+# pointing to the following page when the limit is reached. The
+# samples and resources listings accept a comma separated list of
+# the fields to return.
 # [GET   ] /resources/<resource> -- information about the resource
 # [GET   ] /meters -- list the meters
 # [POST  ] /meters -- insert a new sample (and meter/resource if needed)
@@ -29,8 +34,11 @@
 # [PUT   ] /meters/<meter> -- update the meter (not the samples)
 # [DELETE] /meters/<meter> -- delete the meter and samples
 #
+import base64
 import datetime
 import inspect
+import urllib
+
 import pecan
 from pecan import request
 from pecan.rest import RestController
@@ -39,6 +47,7 @@ import wsme
 import wsmeext.pecan as wsme_pecan
 from wsme.types import Base, text, Enum
 
+from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import log as logging
 from ceilometer.openstack.common import timeutils
 from ceilometer import storage
@@ -71,8 +80,10 @@ class Query(Base):
 def _query_to_kwargs(query, db_func):
     # TODO(dhellmann): This function needs tests of its own.
     valid_keys = inspect.getargspec(db_func)[0]
-    if 'self' in valid_keys:
-        valid_keys.remove('self')
+    # The pagination and projection arguments are not query fields.
+    for key in ('self', 'limit', 'marker', 'fields'):
+        if key in valid_keys:
+            valid_keys.remove(key)
     translation = {'user_id': 'user',
                    'project_id': 'project',
                    'resource_id': 'resource'}
@@ -130,6 +141,62 @@ def _query_to_kwargs(query, db_func):
     return kwargs
 
 
+def _check_limit(limit):
+    if limit is not None and limit <= 0:
+        raise wsme.exc.InvalidInput('limit', limit,
+                                    'must be a positive number')
+
+
+def _encode_marker(key):
+    """Return the opaque marker for the item with the given sort key.
+    """
+    return base64.urlsafe_b64encode(jsonutils.dumps(key))
+
+
+def _decode_marker(marker, size=None):
+    """Return the sort key held by a marker built by _encode_marker().
+
+    :param size: Number of values expected in the key, when it is a list.
+    """
+    if marker is None:
+        return None
+    try:
+        key = jsonutils.loads(base64.urlsafe_b64decode(str(marker)))
+    except (TypeError, ValueError):
+        key = None
+    if size is None:
+        valid = isinstance(key, basestring)
+    else:
+        valid = isinstance(key, list) and len(key) == size
+    if not valid:
+        raise wsme.exc.InvalidInput('marker', marker, 'not a valid marker')
+    return key
+
+
+def _parse_fields(fields, valid):
+    """Return the list of field names held by the comma separated
+    `fields` argument, or None when it is not given.
+    """
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    for name in names:
+        if name not in valid:
+            raise wsme.exc.InvalidInput('fields', fields,
+                                        'unknown field %r' % name)
+    return names
+
+
+def _set_next_link(key):
+    """Point the client to the page following the item with the
+    given sort key, using a Link header.
+    """
+    params = [(k, v) for k, v in request.GET.items() if k != 'marker']
+    params.append(('marker', _encode_marker(key)))
+    url = '%s?%s' % (request.path_url, urllib.urlencode(params))
+    pecan.response.headers['Link'] = '<%s>; rel="next"' % url
+
+
 def _get_query_timestamps(args={}):
     """Return any optional timestamp information in the request.
 
@@ -196,13 +263,13 @@ class Sample(Base):
     resource_metadata = {text: text}
     message_id = text
 
-    def __init__(self, counter_volume=None, resource_metadata={}, **kwds):
+    def __init__(self, counter_volume=None, resource_metadata=None, **kwds):
+        # The fields left out of the query are left unset.
         if counter_volume is not None:
-            counter_volume = float(counter_volume)
-        resource_metadata = _flatten_metadata(resource_metadata)
-        super(Sample, self).__init__(counter_volume=counter_volume,
-                                     resource_metadata=resource_metadata,
-                                     **kwds)
+            kwds['counter_volume'] = float(counter_volume)
+        if resource_metadata is not None:
+            kwds['resource_metadata'] = _flatten_metadata(resource_metadata)
+        super(Sample, self).__init__(**kwds)
 
 
 class Statistics(Base):
@@ -214,6 +281,9 @@ class Statistics(Base):
     duration = float
     duration_start = datetime.datetime
     duration_end = datetime.datetime
+    period = int
+    period_start = datetime.datetime
+    period_end = datetime.datetime
 
     def __init__(self, start_timestamp=None, end_timestamp=None, **kwds):
         super(Statistics, self).__init__(**kwds)
@@ -265,25 +335,59 @@ class MeterController(RestController):
         request.context['meter_id'] = meter_id
         self._id = meter_id
 
-    @wsme_pecan.wsexpose([Sample], [Query])
-    def get_all(self, q=[]):
+    @wsme_pecan.wsexpose([Sample], [Query], int, text, text)
+    def get_all(self, q=[], limit=None, marker=None, fields=None):
         """Return all events for the meter.
+
+        :param q: Filter rules for the events.
+        :param limit: Maximum number of events to return.
+        :param marker: Opaque marker of the last event of the previous
+                       page, as found in the next link of the response.
+        :param fields: Comma separated names of the fields to return.
         """
+        _check_limit(limit)
+        fields = _parse_fields(fields, storage.EVENT_FIELDS)
         kwargs = _query_to_kwargs(q, storage.EventFilter.__init__)
         kwargs['meter'] = self._id
+        kwargs['limit'] = limit
+        key = _decode_marker(marker, 2)
+        if key is not None:
+            try:
+                kwargs['marker'] = (timeutils.parse_strtime(key[0]), key[1])
+            except (TypeError, ValueError):
+                raise wsme.exc.InvalidInput('marker', marker,
+                                            'not a valid marker')
         f = storage.EventFilter(**kwargs)
-        return [Sample(**e)
-                for e in request.storage_conn.get_raw_events(f)
-                ]
-
-    @wsme_pecan.wsexpose(Statistics, [Query])
-    def statistics(self, q=[]):
+        read = fields
+        if fields is not None and limit:
+            # The next link needs the sort key of the last event.
+            read = list(set(fields) | set(['timestamp', 'message_id']))
+        events = list(request.storage_conn.get_raw_events(f, fields=read))
+        if limit and len(events) == limit:
+            last = events[-1]
+            _set_next_link([timeutils.strtime(last['timestamp']),
+                            last['message_id']])
+        if read is not fields:
+            events = [dict((k, e[k]) for k in fields if k in e)
+                      for e in events]
+        return [Sample(**e) for e in events]
+
+    @wsme_pecan.wsexpose([Statistics], [Query], int)
+    def statistics(self, q=[], period=None):
         """Computes the statistics of the meter events in the time range given.
+
+        :param q: Filter rules for the events.
+        :param period: Returned result will be an array of statistics for
+                       each period of this many seconds, instead of a
+                       single statistics for the whole range.
         """
+        if period is not None and period <= 0:
+            raise wsme.exc.InvalidInput('period', period,
+                                        'must be a positive number')
         kwargs = _query_to_kwargs(q, storage.EventFilter.__init__)
         kwargs['meter'] = self._id
         f = storage.EventFilter(**kwargs)
-        computed = request.storage_conn.get_meter_statistics(f)
+        computed = request.storage_conn.get_meter_statistics(f, period)
         # Find the original timestamp in the query to use for clamping
         # the duration returned in the statistics.
         start = end = None
@@ -292,10 +396,10 @@ class MeterController(RestController):
                 end = timeutils.parse_isotime(i.value).replace(tzinfo=None)
             elif i.field == 'timestamp' and i.op in ('gt', 'ge'):
                 start = timeutils.parse_isotime(i.value).replace(tzinfo=None)
-        stat = Statistics(start_timestamp=start,
-                          end_timestamp=end,
-                          **computed)
-        return stat
+        return [Statistics(start_timestamp=start,
+                           end_timestamp=end,
+                           **c)
+                for c in computed]
 
 
 class Meter(Base):
@@ -314,11 +418,17 @@ class MetersController(RestController):
     def _lookup(self, meter_id, *remainder):
         return MeterController(meter_id), remainder
 
-    @wsme_pecan.wsexpose([Meter], [Query])
-    def get_all(self, q=[]):
+    @wsme_pecan.wsexpose([Meter], [Query], int, text)
+    def get_all(self, q=[], limit=None, marker=None):
+        _check_limit(limit)
         kwargs = _query_to_kwargs(q, request.storage_conn.get_meters)
-        return [Meter(**m)
-                for m in request.storage_conn.get_meters(**kwargs)]
+        meters = list(request.storage_conn.get_meters(
+            limit=limit, marker=_decode_marker(marker, 4), **kwargs))
+        if limit and len(meters) == limit:
+            last = meters[-1]
+            _set_next_link([last['resource_id'], last['name'],
+                            last['type'], last['unit']])
+        return [Meter(**m) for m in meters]
 
 
 class Resource(Base):
@@ -326,11 +436,14 @@ class Resource(Base):
     project_id = text
     user_id = text
     timestamp = datetime.datetime
+    first_sample_timestamp = datetime.datetime
+    last_sample_timestamp = datetime.datetime
     metadata = {text: text}
 
-    def __init__(self, metadata={}, **kwds):
-        metadata = _flatten_metadata(metadata)
-        super(Resource, self).__init__(metadata=metadata, **kwds)
+    def __init__(self, metadata=None, **kwds):
+        if metadata is not None:
+            kwds['metadata'] = _flatten_metadata(metadata)
+        super(Resource, self).__init__(**kwds)
 
 
 class ResourceController(RestController):
@@ -354,13 +467,17 @@ class ResourcesController(RestController):
     def _lookup(self, resource_id, *remainder):
         return ResourceController(resource_id), remainder
 
-    @wsme_pecan.wsexpose([Resource], [Query])
-    def get_all(self, q=[]):
+    @wsme_pecan.wsexpose([Resource], [Query], int, text, text)
+    def get_all(self, q=[], limit=None, marker=None, fields=None):
+        _check_limit(limit)
+        fields = _parse_fields(fields, storage.RESOURCE_FIELDS)
         kwargs = _query_to_kwargs(q, request.storage_conn.get_resources)
-        resources = [
-            Resource(**r)
-            for r in request.storage_conn.get_resources(**kwargs)]
-        return resources
+        resources = list(request.storage_conn.get_resources(
+            limit=limit, marker=_decode_marker(marker), fields=fields,
+            **kwargs))
+        if limit and len(resources) == limit:
+            _set_next_link(resources[-1]['resource_id'])
+        return [Resource(**r) for r in resources]
 
 
 class V2Controller(object):
@@ -32,13 +32,20 @@ class ConfigHook(hooks.PecanHook):
 
 
 class DBHook(hooks.PecanHook):
+    """Attach the storage connection shared by the process to the
+    request.
+    """
+
+    def __init__(self):
+        # Open the connection when the application is set up, instead
+        # of during the first request.
+        storage.get_shared_connection(cfg.CONF)
 
     def before(self, state):
-        storage_engine = storage.get_engine(state.request.cfg)
-        state.request.storage_engine = storage_engine
-        state.request.storage_conn = storage_engine.get_connection(
+        state.request.storage_conn = storage.get_shared_connection(
             state.request.cfg)
 
-    # def after(self, state):
-    #     print 'method:', state.request.method
-    #     print 'response:', state.response.status
+    def after(self, state):
+        conn = getattr(state.request, 'storage_conn', None)
+        if conn is not None:
+            conn.close_session()
@@ -48,10 +48,14 @@ def make_app(enable_acl=True, attach_storage=True):
     if attach_storage:
         @app.before_request
         def attach_storage():
-            storage_engine = storage.get_engine(cfg.CONF)
-            flask.request.storage_engine = storage_engine
             flask.request.storage_conn = \
-                storage_engine.get_connection(cfg.CONF)
+                storage.get_shared_connection(cfg.CONF)
+
+        @app.teardown_request
+        def close_storage_session(exc):
+            conn = getattr(flask.request, 'storage_conn', None)
+            if conn is not None:
+                conn.close_session()
 
     # Install the middleware wrapper
     if enable_acl:
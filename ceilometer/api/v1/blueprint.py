@@ -80,6 +80,7 @@ import datetime
 
 import flask
 
+from ceilometer.openstack.common import jsonutils
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import timeutils
 
@@ -93,6 +94,9 @@ LOG = log.getLogger(__name__)
 
 blueprint = flask.Blueprint('v1', __name__)
 
+# Minimum number of bytes sent at once by the streamed responses.
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 def request_wants_html():
     best = flask.request.accept_mimetypes \
@@ -102,6 +106,32 @@ def request_wants_html():
         flask.request.accept_mimetypes['application/json']
 
 
+def _stream_json(key, items):
+    """Return a response holding the JSON document {key: [items]}.
+
+    The items are encoded as they are read from the iterable and sent
+    in chunks of about STREAM_CHUNK_SIZE bytes, so the whole list is
+    never held in memory.
+    """
+    def generate():
+        chunk = ['{%s: [' % jsonutils.dumps(key)]
+        size = 0
+        separator = ''
+        for item in items:
+            encoded = jsonutils.dumps(item)
+            chunk.append(separator)
+            chunk.append(encoded)
+            separator = ', '
+            size += len(encoded)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        chunk.append(']}')
+        yield ''.join(chunk)
+    return flask.Response(generate(), mimetype='application/json')
+
+
 def _get_metaquery(args):
     return dict((k, v)
                 for (k, v) in args.iteritems()
@@ -381,9 +411,9 @@ def _list_events(meter,
         end=q_ts['end_timestamp'],
         metaquery=_get_metaquery(flask.request.args),
     )
-    events = list(flask.request.storage_conn.get_raw_events(f))
-    jsonified = flask.jsonify(events=events)
+    events = flask.request.storage_conn.get_raw_events(f)
     if request_wants_html():
+        jsonified = flask.jsonify(events=list(events))
         return flask.templating.render_template('list_event.html',
                                                 user=user,
                                                 project=project,
@@ -391,7 +421,7 @@ def _list_events(meter,
                                                 meter=meter,
                                                 resource=resource,
                                                 events=jsonified)
-    return jsonified
+    return _stream_json('events', events)
 
 
 @blueprint.route('/projects/<project>/meters/<meter>')
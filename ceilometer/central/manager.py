@@ -45,28 +45,37 @@ class AgentManager(object):
         )
 
     @staticmethod
-    def publish_counters_from_one_pollster(ext, manager, context):
+    def get_counters_from_one_pollster(ext, manager, context):
         """Used to invoke the plugins loaded by the ExtensionManager.
         """
         try:
             LOG.info('polling %s', ext.name)
-            for c in ext.obj.get_counters(manager, context):
+            counters = list(ext.obj.get_counters(manager, context))
+            for c in counters:
                 LOG.info('COUNTER: %s', c)
-                publish.publish_counter(context=context,
-                                        counter=c,
-                                        topic=cfg.CONF.metering_topic,
-                                        secret=cfg.CONF.metering_secret,
-                                        source=cfg.CONF.counter_source,
-                                        )
+            return counters
         except Exception as err:
             LOG.warning('Continuing after error from %s: %s',
                         ext.name, err)
             LOG.exception(err)
+            return []
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
-        self.ext_manager.map(self.publish_counters_from_one_pollster,
-                             manager=self,
-                             context=context,
-                             )
-        return
+        counters = []
+        for result in self.ext_manager.map(
+                self.get_counters_from_one_pollster,
+                manager=self,
+                context=context):
+            counters.extend(result)
+        try:
+            publish.publish_counters(context=context,
+                                     counters=counters,
+                                     topic=cfg.CONF.metering_topic,
+                                     secret=cfg.CONF.metering_secret,
+                                     source=cfg.CONF.counter_source,
+                                     )
+        except Exception as err:
+            LOG.warning('Continuing after error publishing %d counters: %s',
+                        len(counters), err)
+            LOG.exception(err)
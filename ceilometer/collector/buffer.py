@@ -0,0 +1,301 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Buffer metering samples so they can be stored in batches, or by a
+pool of concurrent writers.
+"""
+
+import collections
+import time
+
+import eventlet
+from eventlet import event
+from eventlet import queue
+
+from ceilometer.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+
+class SampleBuffer(object):
+    """Collect samples and hand them to a writer in batches.
+
+    The buffer is flushed when it holds `size` samples or when its
+    oldest sample has waited `interval` seconds, whichever comes
+    first. Callers of add() block until the batch holding their
+    sample has been written.
+
+    When writing a batch fails and `single_writer` is given, the
+    samples are written again one at a time so that only the ones
+    the storage rejects are lost. Callers of add() get the exception
+    raised while writing their sample.
+
+    :param writer: callable receiving the list of samples to store
+    :param size: maximum number of samples per batch
+    :param interval: maximum number of seconds a sample is buffered
+    :param single_writer: callable receiving one sample to store
+    """
+
+    def __init__(self, writer, size, interval, single_writer=None):
+        self.writer = writer
+        self.single_writer = single_writer
+        self.size = size
+        self.interval = interval
+        self._samples = []
+        self._flushed = event.Event()
+        self._timer = None
+        self.flush_count = 0
+        self.last_flush_size = 0
+        self.last_flush_latency = 0.0
+        self.lost_count = 0
+
+    @property
+    def depth(self):
+        """Number of samples waiting to be written."""
+        return len(self._samples)
+
+    def add(self, sample):
+        """Buffer a sample and wait until it has been written.
+        """
+        self._samples.append(sample)
+        flushed = self._flushed
+        if len(self._samples) >= self.size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = eventlet.spawn_after(self.interval, self.flush)
+        # The flush reports the errors by sample, the samples being
+        # kept alive until then.
+        error = flushed.wait().get(id(sample))
+        if error is not None:
+            raise error
+
+    def flush(self):
+        """Write all of the buffered samples.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        samples, self._samples = self._samples, []
+        flushed, self._flushed = self._flushed, event.Event()
+        if not samples:
+            return
+        start = time.time()
+        errors = {}
+        try:
+            self.writer(samples)
+        except Exception as err:
+            LOG.error('Failed to record %d samples: %s', len(samples), err)
+            LOG.exception(err)
+            errors = self._write_one_by_one(samples, err)
+            self.lost_count += len(errors)
+        finally:
+            self.flush_count += 1
+            self.last_flush_size = len(samples)
+            self.last_flush_latency = time.time() - start
+            LOG.debug('flushed %d samples in %.3f seconds',
+                      self.last_flush_size, self.last_flush_latency)
+            flushed.send(errors)
+
+    def _write_one_by_one(self, samples, batch_error):
+        """Write the samples of a failed batch separately, returning
+        the errors by sample id.
+        """
+        if self.single_writer is None:
+            return dict((id(sample), batch_error) for sample in samples)
+        errors = {}
+        for sample in samples:
+            try:
+                self.single_writer(sample)
+            except Exception as err:
+                LOG.error('Failed to record metering data: %s', err)
+                LOG.exception(err)
+                errors[id(sample)] = err
+        return errors
+
+    def stats(self):
+        """Return a dictionary describing the state of the buffer.
+
+        { 'depth': number of samples waiting to be written,
+          'flush_count': number of batches written,
+          'flush_size': number of samples in the last batch,
+          'flush_latency': seconds spent writing the last batch,
+          'lost_count': number of samples that could not be written,
+          }
+        """
+        return {'depth': self.depth,
+                'flush_count': self.flush_count,
+                'flush_size': self.last_flush_size,
+                'flush_latency': self.last_flush_latency,
+                'lost_count': self.lost_count,
+                }
+
+
+class _Slots(object):
+    """Count the free places of a queue, handing them to the blocked
+    callers in the order they arrived.
+
+    eventlet's Queue and Semaphore wake their waiters in no particular
+    order, which would reorder the samples of a resource.
+    """
+
+    def __init__(self, count):
+        self.free = count
+        self._waiters = collections.deque()
+
+    def acquire(self):
+        if self.free > 0 and not self._waiters:
+            self.free -= 1
+            return
+        waiter = event.Event()
+        self._waiters.append(waiter)
+        waiter.wait()
+
+    def release(self):
+        if self._waiters:
+            # The place goes straight to the oldest waiter, so a new
+            # caller cannot take it first.
+            self._waiters.popleft().send()
+        else:
+            self.free += 1
+
+
+class WriterPool(object):
+    """Write samples from a pool of greenthreads.
+
+    Each worker owns a bounded queue and samples are assigned to a
+    worker by hashing their resource id, so the samples of a resource
+    are written in the order they were received while a slow write
+    only holds up the resources of one worker. Callers of put() block
+    while the queue of their worker is full and then until their
+    sample has been written, and get the exception raised by the
+    writer if it failed.
+
+    The RPC layer acknowledges a message before dispatching it, so
+    this does not protect a message from being lost when the collector
+    dies. Blocking the callers only gives backpressure: once all the
+    rpc_thread_pool_size greenthreads are waiting on the pool the
+    collector stops taking messages until the storage catches up.
+
+    A worker hands everything waiting in its queue, up to `batch_size`
+    samples, to the writer in one call.
+
+    :param writer: callable receiving the list of samples to store
+    :param workers: number of writer greenthreads
+    :param queue_size: maximum number of samples waiting per worker
+    :param batch_size: maximum number of samples per write
+    """
+
+    def __init__(self, writer, workers, queue_size, batch_size=1):
+        self.writer = writer
+        self.batch_size = max(batch_size, 1)
+        # The queues are unbounded, their size being limited by the
+        # slots so the blocked callers resume in order.
+        self._queues = [queue.LightQueue() for i in range(workers)]
+        self._slots = dict((q, _Slots(max(queue_size, 1)))
+                           for q in self._queues)
+        self._threads = [eventlet.spawn(self._run, q) for q in self._queues]
+        self.write_count = 0
+        self.sample_count = 0
+        self.error_count = 0
+
+    def _get_queue(self, sample):
+        key = sample.get('resource_id')
+        return self._queues[hash(key) % len(self._queues)]
+
+    def put(self, sample):
+        """Queue a sample and wait until it has been written.
+        """
+        self.put_many([sample])
+
+    def put_many(self, samples):
+        """Queue samples, in order, and wait until they have all been
+        written.
+
+        If some of the writes failed, the first exception is raised
+        once all of the samples have been handled.
+        """
+        pending = []
+        for sample in samples:
+            written = event.Event()
+            q = self._get_queue(sample)
+            self._slots[q].acquire()
+            q.put((sample, written))
+            pending.append(written)
+        error = None
+        for written in pending:
+            try:
+                written.wait()
+            except Exception as err:
+                error = error or err
+        if error is not None:
+            raise error
+
+    def _run(self, q):
+        slots = self._slots[q]
+        while True:
+            items = [q.get()]
+            while items[-1] is not None and len(items) < self.batch_size:
+                try:
+                    items.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = items[-1] is None
+            if stop:
+                items.pop()
+            for item in items:
+                slots.release()
+            if items:
+                self._write(items)
+            if stop:
+                return
+
+    def _write(self, items):
+        samples = [sample for sample, written in items]
+        try:
+            self.writer(samples)
+        except Exception as err:
+            self.error_count += 1
+            LOG.error('Failed to record %d samples: %s', len(samples), err)
+            LOG.exception(err)
+            for sample, written in items:
+                written.send_exception(err)
+        else:
+            for sample, written in items:
+                written.send()
+        finally:
+            self.write_count += 1
+            self.sample_count += len(samples)
+
+    def stop(self):
+        """Write the queued samples and stop the workers.
+        """
+        for q in self._queues:
+            q.put(None)
+        for t in self._threads:
+            t.wait()
+        self._threads = []
+
+    def stats(self):
+        """Return a dictionary describing the state of the pool.
+
+        { 'depths': number of samples waiting for each worker,
+          'write_count': number of writes,
+          'sample_count': number of samples written,
+          'error_count': number of failed writes,
+          }
+        """
+        return {'depths': [q.qsize() for q in self._queues],
+                'write_count': self.write_count,
+                'sample_count': self.sample_count,
+                'error_count': self.error_count,
+                }
@@ -0,0 +1,73 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Find the notification handlers interested in an event type.
+"""
+
+import fnmatch
+
+
+def is_pattern(event_type):
+    """Return True if the event type holds shell-style wildcards.
+    """
+    return any(c in event_type for c in '*?[')
+
+
+class EventTypeIndex(object):
+    """Map event types to the handlers accepting them.
+
+    The event types of the handlers are read once, when the index is
+    built. Those holding shell-style wildcards, such as
+    'compute.instance.*', are matched with fnmatch. The handlers found
+    for an event type are remembered, so dispatching a notification
+    costs a dictionary lookup.
+
+    :param extensions: the extensions of the handlers, in the order
+                       they are given the notifications
+    """
+
+    # Number of event types whose handlers are remembered.
+    CACHE_SIZE = 1000
+
+    def __init__(self, extensions):
+        self._exact = {}
+        self._patterns = []
+        for position, ext in enumerate(extensions):
+            for event_type in ext.obj.get_event_types():
+                if is_pattern(event_type):
+                    self._patterns.append((event_type, position, ext))
+                else:
+                    self._exact.setdefault(event_type, []).append(
+                        (position, ext))
+        self._cache = {}
+
+    def get_handlers(self, event_type):
+        """Return the list of the extensions accepting the event type.
+        """
+        handlers = self._cache.get(event_type)
+        if handlers is None:
+            handlers = self._find_handlers(event_type)
+            if len(self._cache) >= self.CACHE_SIZE:
+                # Event types are a small set, unless the messages
+                # are garbage: start over rather than grow.
+                self._cache.clear()
+            self._cache[event_type] = handlers
+        return handlers
+
+    def _find_handlers(self, event_type):
+        found = dict(self._exact.get(event_type, []))
+        if event_type is not None:
+            for pattern, position, ext in self._patterns:
+                if fnmatch.fnmatchcase(event_type, pattern):
+                    found[position] = ext
+        return [found[position] for position in sorted(found)]
@@ -56,17 +56,67 @@ def recursive_keypairs(d):
             yield name, value
 
 
+_DIGESTS = {}
+
+
+def _get_digest(secret):
+    """Return a new hmac object for the secret.
+
+    Creating an hmac object pads and hashes the key, so one is kept
+    per secret and copied.
+    """
+    digest = _DIGESTS.get(secret)
+    if digest is None:
+        digest = _DIGESTS[secret] = hmac.new(secret, '', hashlib.sha256)
+    return digest.copy()
+
+
 def compute_signature(message, secret):
     """Return the signature for a message dictionary.
+
+    The keys and values are signed in the order of
+    recursive_keypairs(), but are joined into a single buffer before
+    being handed to hmac, which gives the same digest as feeding them
+    one at a time for a fraction of the cost.
     """
-    digest_maker = hmac.new(secret, '', hashlib.sha256)
-    for name, value in recursive_keypairs(message):
-        if name == 'message_signature':
-            # Skip any existing signature value, which would not have
-            # been part of the original message.
-            continue
-        digest_maker.update(name)
-        digest_maker.update(unicode(value).encode('utf-8'))
+    parts = []
+    append = parts.append
+    # Byte strings are signed as they are, but unicode() would have
+    # rejected the ones that are not ascii, so they are checked
+    # together at the end.
+    texts = []
+    # Walk the nested dictionaries without recursing. Each entry holds
+    # the prefix of the keys of a dictionary and an iterator over its
+    # sorted items, which is resumed once the nested dictionary that
+    # interrupted it has been walked.
+    stack = [(None, iter(sorted(message.iteritems())))]
+    while stack:
+        prefix, items = stack[-1]
+        for name, value in items:
+            if prefix is not None:
+                name = '%s:%s' % (prefix, name)
+            if isinstance(value, dict):
+                stack.append((name, iter(sorted(value.iteritems()))))
+                break
+            if name == 'message_signature':
+                # Skip any existing signature value, which would not
+                # have been part of the original message.
+                continue
+            # hmac reads unicode keys as ascii.
+            append(name.encode('ascii')
+                   if isinstance(name, unicode) else name)
+            if value.__class__ is str:
+                append(value)
+                texts.append(value)
+            elif value.__class__ is unicode:
+                append(value.encode('utf-8'))
+            else:
+                append(unicode(value).encode('utf-8'))
+        else:
+            stack.pop()
+    ''.join(texts).decode('ascii')
+    digest_maker = _get_digest(secret)
+    digest_maker.update(''.join(parts))
     return digest_maker.hexdigest()
 
 
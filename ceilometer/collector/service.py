@@ -16,8 +16,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+
 from stevedore import extension
 
+from ceilometer.collector import buffer
+from ceilometer.collector import dispatch
 from ceilometer.collector import meter
 from ceilometer import extension_manager
 from ceilometer import publish
@@ -35,6 +39,26 @@ OPTS = [
                 default=[],
                 help='list of listener plugins to disable',
                 ),
+    cfg.IntOpt('collector_batch_size',
+               default=1,
+               help='maximum number of metering messages written to the '
+               'storage in one batch (1 disables batching)',
+               ),
+    cfg.IntOpt('collector_batch_timeout',
+               default=100,
+               help='maximum time in milliseconds a metering message waits '
+               'for its batch to fill before being written',
+               ),
+    cfg.IntOpt('collector_writers',
+               default=0,
+               help='number of greenthreads writing metering messages to '
+               'the storage (0 writes them from the RPC thread)',
+               ),
+    cfg.IntOpt('collector_writer_queue_size',
+               default=100,
+               help='maximum number of metering messages waiting for each '
+               'writer before the collector stops taking new ones',
+               ),
 ]
 
 cfg.CONF.register_opts(OPTS)
@@ -47,12 +71,61 @@ class CollectorService(service.PeriodicService):
 
     COLLECTOR_NAMESPACE = 'ceilometer.collector'
 
+    # Version 1.1 adds record_metering_data_batch.
+    RPC_API_VERSION = '1.1'
+
+    def __init__(self, host, topic, manager=None):
+        super(CollectorService, self).__init__(host, topic, manager)
+        self.sample_count = 0
+        self.invalid_count = 0
+        self.error_count = 0
+        self.notification_count = 0
+
     def start(self):
         super(CollectorService, self).start()
 
         storage.register_opts(cfg.CONF)
         self.storage_engine = storage.get_engine(cfg.CONF)
         self.storage_conn = self.storage_engine.get_connection(cfg.CONF)
+        self.sample_buffer = buffer.SampleBuffer(
+            self.storage_conn.record_metering_data_batch,
+            cfg.CONF.collector_batch_size,
+            cfg.CONF.collector_batch_timeout / 1000.0,
+            self.storage_conn.record_metering_data,
+        )
+        self.writer_pool = None
+        if cfg.CONF.collector_writers > 0:
+            self.writer_pool = buffer.WriterPool(
+                self.storage_conn.record_metering_data_batch,
+                cfg.CONF.collector_writers,
+                cfg.CONF.collector_writer_queue_size,
+                cfg.CONF.collector_batch_size,
+            )
+        # Write what the storage connection holds back even when no
+        # more samples come in.
+        if self.storage_conn.flush_interval:
+            self.tg.add_timer(self.storage_conn.flush_interval,
+                              self.flush_storage)
+
+    def stop(self):
+        # Write whatever is still waiting in the buffer before the
+        # connection goes away.
+        if getattr(self, 'writer_pool', None) is not None:
+            self.writer_pool.stop()
+        if getattr(self, 'sample_buffer', None) is not None:
+            self.sample_buffer.flush()
+        if getattr(self, 'storage_conn', None) is not None:
+            self.flush_storage()
+        super(CollectorService, self).stop()
+
+    def flush_storage(self):
+        """Write the data held back by the storage connection.
+        """
+        try:
+            self.storage_conn.flush()
+        except Exception as err:
+            LOG.error('Failed to flush the storage connection: %s', err)
+            LOG.exception(err)
 
     def initialize_service_hook(self, service):
         '''Consumers must be declared before consume_thread start.'''
@@ -66,6 +139,7 @@ class CollectorService(service.PeriodicService):
                         self.COLLECTOR_NAMESPACE)
 
         self.ext_manager.map(self._setup_subscription)
+        self.event_index = dispatch.EventTypeIndex(self.ext_manager)
 
         # Set ourselves up as a separate worker for the metering data,
         # since the default for service is to use create_consumer().
@@ -93,19 +167,23 @@ class CollectorService(service.PeriodicService):
                 )
 
     def process_notification(self, notification):
-        """Make a notification processed by an handler."""
-        LOG.debug('notification %r', notification.get('event_type'))
-        self.ext_manager.map(self._process_notification_for_ext,
-                             notification=notification,
-                             )
+        """Make a notification processed by the handlers accepting
+        its event type."""
+        event_type = notification.get('event_type')
+        LOG.debug('notification %r', event_type)
+        self.notification_count += 1
+        for ext in self.event_index.get_handlers(event_type):
+            try:
+                self._process_notification_for_ext(ext, notification)
+            except Exception as err:
+                LOG.error('error calling %r: %s', ext.name, err)
+                LOG.exception(err)
 
     def _process_notification_for_ext(self, ext, notification):
-        handler = ext.obj
-        if notification['event_type'] in handler.get_event_types():
-            for c in handler.process_notification(notification):
-                LOG.info('COUNTER: %s', c)
-                # FIXME(dhellmann): Spawn green thread?
-                self.publish_counter(c)
+        for c in ext.obj.process_notification(notification):
+            LOG.info('COUNTER: %s', c)
+            # FIXME(dhellmann): Spawn green thread?
+            self.publish_counter(c)
 
     @staticmethod
     def publish_counter(counter):
@@ -116,11 +194,10 @@ class CollectorService(service.PeriodicService):
                                 cfg.CONF.metering_secret,
                                 cfg.CONF.counter_source)
 
-    def record_metering_data(self, context, data):
-        """This method is triggered when metering data is
-        cast from an agent.
+    def _prepare_metering_data(self, data):
+        """Check the signature of a metering message and convert its
+        timestamp, returning False if the message must be discarded.
         """
-        #LOG.info('metering data: %r', data)
         LOG.info('metering data %s for %s @ %s: %s',
                  data['counter_name'],
                  data['resource_id'],
@@ -129,18 +206,91 @@ class CollectorService(service.PeriodicService):
         if not meter.verify_signature(data, cfg.CONF.metering_secret):
             LOG.warning('message signature invalid, discarding message: %r',
                         data)
-        else:
-            try:
-                # Convert the timestamp to a datetime instance.
-                # Storage engines are responsible for converting
-                # that value to something they can store.
-                if data.get('timestamp'):
-                    ts = timeutils.parse_isotime(data['timestamp'])
-                    data['timestamp'] = timeutils.normalize_time(ts)
+            self.invalid_count += 1
+            return False
+        # Convert the timestamp to a datetime instance.
+        # Storage engines are responsible for converting
+        # that value to something they can store.
+        if data.get('timestamp'):
+            ts = timeutils.parse_isotime(data['timestamp'])
+            data['timestamp'] = timeutils.normalize_time(ts)
+        return True
+
+    def record_metering_data(self, context, data):
+        """This method is triggered when metering data is
+        cast from an agent.
+        """
+        #LOG.info('metering data: %r', data)
+        try:
+            if not self._prepare_metering_data(data):
+                return
+            if getattr(self, 'writer_pool', None) is not None:
+                self.writer_pool.put(data)
+            elif cfg.CONF.collector_batch_size > 1:
+                self.sample_buffer.add(data)
+            else:
                 self.storage_conn.record_metering_data(data)
+            self.sample_count += 1
+        except Exception as err:
+            self.error_count += 1
+            LOG.error('Failed to record metering data: %s', err)
+            LOG.exception(err)
+
+    def record_metering_data_batch(self, context, data):
+        """This method is triggered when a list of metering data is
+        cast from an agent.
+
+        Each sample is verified on its own and the invalid ones are
+        discarded. The others are written in one batch, since the
+        message already carries many of them.
+        """
+        samples = []
+        for sample in data:
+            try:
+                if self._prepare_metering_data(sample):
+                    samples.append(sample)
             except Exception as err:
+                self.error_count += 1
                 LOG.error('Failed to record metering data: %s', err)
                 LOG.exception(err)
+        if not samples:
+            return
+        try:
+            if getattr(self, 'writer_pool', None) is not None:
+                self.writer_pool.put_many(samples)
+            else:
+                self.storage_conn.record_metering_data_batch(samples)
+            self.sample_count += len(samples)
+        except Exception as err:
+            self.error_count += len(samples)
+            LOG.error('Failed to record %d samples: %s', len(samples), err)
+            LOG.exception(err)
+
+    def stats(self):
+        """Return a dictionary describing the work done by this
+        collector process.
+
+        { 'pid': process id, to tell the workers apart,
+          'samples': number of metering messages handled,
+          'invalid': number of messages with a bad signature,
+          'errors': number of messages that could not be recorded,
+          'notifications': number of notifications received,
+          'writer_pool': statistics of the writer pool, if enabled,
+          'sample_buffer': statistics of the sample buffer, if enabled,
+          }
+        """
+        stats = {'pid': os.getpid(),
+                 'samples': self.sample_count,
+                 'invalid': self.invalid_count,
+                 'errors': self.error_count,
+                 'notifications': self.notification_count,
+                 }
+        if getattr(self, 'writer_pool', None) is not None:
+            stats['writer_pool'] = self.writer_pool.stats()
+        elif cfg.CONF.collector_batch_size > 1:
+            stats['sample_buffer'] = self.sample_buffer.stats()
+        return stats
 
     def periodic_tasks(self, context):
-        pass
+        self.flush_storage()
+        LOG.info('collector statistics: %s', self.stats())
@@ -67,37 +67,59 @@ class AgentManager(object):
         return
 
     @staticmethod
-    def publish_counters_from_one_pollster(ext, manager, context, instance):
+    def get_counters_from_one_pollster(ext, manager, instance):
         """Used to invoke the plugins loaded by the ExtensionManager.
         """
         try:
             LOG.info('polling %s', ext.name)
-            for c in ext.obj.get_counters(manager, instance):
+            counters = list(ext.obj.get_counters(manager, instance))
+            for c in counters:
                 LOG.info('COUNTER: %s', c)
-                publish.publish_counter(context, c,
-                                        cfg.CONF.metering_topic,
-                                        cfg.CONF.metering_secret,
-                                        cfg.CONF.counter_source,
-                                        )
+            return counters
         except Exception as err:
             LOG.warning('Continuing after error from %s for %s: %s',
                         ext.name, instance.id, err)
             LOG.exception(err)
+            return []
+
+    def get_instance_counters(self, instance):
+        """Return the counters of all of the pollsters for one instance.
+        """
+        counters = []
+        for result in self.ext_manager.map(
+                self.get_counters_from_one_pollster,
+                manager=self,
+                instance=instance):
+            counters.extend(result)
+        return counters
+
+    @staticmethod
+    def publish_counters(context, counters):
+        try:
+            publish.publish_counters(context, counters,
+                                     cfg.CONF.metering_topic,
+                                     cfg.CONF.metering_secret,
+                                     cfg.CONF.counter_source,
+                                     )
+        except Exception as err:
+            LOG.warning('Continuing after error publishing %d counters: %s',
+                        len(counters), err)
+            LOG.exception(err)
 
     def poll_instance(self, context, instance):
         """Poll one instance."""
-        self.ext_manager.map(self.publish_counters_from_one_pollster,
-                             manager=self,
-                             context=context,
-                             instance=instance,
-                             )
+        self.publish_counters(context, self.get_instance_counters(instance))
 
     def periodic_tasks(self, context, raise_on_error=False):
         """Tasks to be run at a periodic interval."""
+        # The counters of all of the instances are published together,
+        # so they can be batched.
         nv = nova_client.Client()
+        counters = []
         for instance in nv.instance_get_all_by_host(cfg.CONF.host):
             if getattr(instance, 'OS-EXT-STS:vm_state', None) != 'error':
-                self.poll_instance(context, instance)
+                counters.extend(self.get_instance_counters(instance))
+        self.publish_counters(context, counters)
 
     @property
     def inspector(self):
@@ -15,7 +15,7 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
-"""Publish a counter using the preferred RPC mechanism.
+"""Publish counters using the preferred RPC mechanism.
 """
 
 from ceilometer.collector import meter
@@ -30,6 +30,12 @@ PUBLISH_OPTS = [
                default='metering',
                help='the topic ceilometer uses for metering messages',
                ),
+    cfg.IntOpt('publish_batch_size',
+               default=100,
+               help='maximum number of samples in one message cast to the '
+               'metering topics (1 casts a message per sample, as the '
+               'collectors older than RPC API 1.1 expect)',
+               ),
 ]
 
 
@@ -49,14 +55,63 @@ def publish_counter(context, counter, topic, secret, source):
     :param counter: ceilometer.counter.Counter instance
     :param source: counter source
     """
-    msg = {
-        'method': 'record_metering_data',
-        'version': '1.0',
-        'args': {'data': meter.meter_message_from_counter(counter,
-                                                          secret,
-                                                          source),
-                 },
-    }
+    msg = _message(meter.meter_message_from_counter(counter, secret, source))
     LOG.debug('PUBLISH: %s', str(msg))
     rpc.cast(context, topic, msg)
     rpc.cast(context, topic + '.' + counter.name, msg)
+
+
+def publish_counters(context, counters, topic, secret, source):
+    """Send the metering messages for several counters.
+
+    When publish_batch_size is greater than 1, the samples are cast in
+    record_metering_data_batch messages of at most that many samples,
+    which need a collector supporting RPC API 1.1. The consumers of
+    topic.<counter name> get batches holding only the samples of that
+    counter. Each sample is signed on its own, as it is by
+    publish_counter().
+
+    :param context: Execution context from the service or RPC call
+    :param counters: list of ceilometer.counter.Counter instances
+    :param source: counter source
+    """
+    batch_size = cfg.CONF.publish_batch_size
+    if batch_size <= 1:
+        for c in counters:
+            publish_counter(context, c, topic, secret, source)
+        return
+    samples = [meter.meter_message_from_counter(c, secret, source)
+               for c in counters]
+    LOG.debug('PUBLISH: %d samples', len(samples))
+    _cast_batches(context, topic, samples, batch_size)
+    names = []
+    by_name = {}
+    for sample in samples:
+        name = sample['counter_name']
+        if name not in by_name:
+            names.append(name)
+            by_name[name] = []
+        by_name[name].append(sample)
+    for name in names:
+        _cast_batches(context, topic + '.' + name, by_name[name], batch_size)
+
+
+def _cast_batches(context, topic, samples, batch_size):
+    for i in range(0, len(samples), batch_size):
+        rpc.cast(context, topic, _batch_message(samples[i:i + batch_size]))
+
+
+def _message(sample):
+    return {
+        'method': 'record_metering_data',
+        'version': '1.0',
+        'args': {'data': sample},
+    }
+
+
+def _batch_message(samples):
+    return {
+        'method': 'record_metering_data_batch',
+        'version': '1.1',
+        'args': {'data': samples},
+    }
@@ -18,6 +18,9 @@
 """Storage backend management
 """
 
+import threading
+import time
+
 from stevedore import driver
 from datetime import datetime
 
@@ -36,6 +39,26 @@ STORAGE_OPTS = [
                default='mongodb://localhost:27017/ceilometer',
                help='Database connection string',
                ),
+    cfg.IntOpt('database_health_check_interval',
+               default=10,
+               help='seconds between checks that a shared database '
+               'connection is still alive',
+               ),
+    cfg.BoolOpt('enable_rollups',
+                default=False,
+                help='maintain hourly and daily aggregates of the samples '
+                'as they are recorded, and answer the statistics, sum and '
+                'max queries from them; the samples older than the hour '
+                'after the aggregates were first written are read from '
+                'the raw data',
+                ),
+    cfg.IntOpt('time_to_live',
+               default=-1,
+               help='number of seconds the samples are kept in the '
+               'database, by ceilometer-expirer and the MongoDB TTL index '
+               'that ceilometer-dbsync and ceilometer-expirer maintain '
+               '(<= 0 keeps them forever)',
+               ),
 ]
 
 
@@ -70,6 +93,67 @@ def get_connection(conf):
     return db
 
 
+# Shared connections, by database_connection, with the time of their
+# last health check.
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
+
+def get_shared_connection(conf):
+    """Return the connection to the database shared by the process.
+
+    The connection is opened the first time it is requested for a
+    given database_connection and reused afterwards. At most once
+    every database_health_check_interval seconds it is checked, and
+    replaced by a new connection if it is no longer alive.
+    """
+    url = conf.database_connection
+    with _CONNECTIONS_LOCK:
+        db, checked_at = _CONNECTIONS.get(url, (None, 0))
+        if db is not None:
+            now = time.time()
+            if now - checked_at < conf.database_health_check_interval:
+                return db
+            # Only this caller checks the connection, the others keep
+            # using it until the check is over.
+            _CONNECTIONS[url] = (db, now)
+    # The check can wait for the server to time out, so it is not
+    # made while holding the lock.
+    if db is not None:
+        if db.is_alive():
+            return db
+        LOG.warning('lost connection to %s, reconnecting', url)
+    with _CONNECTIONS_LOCK:
+        current = _CONNECTIONS.get(url)
+        if current is not None and current[0] is not db:
+            # Another caller opened the connection in the meantime.
+            return current[0]
+        db = get_connection(conf)
+        _CONNECTIONS[url] = (db, time.time())
+        return db
+
+
+def clear_shared_connections():
+    """Forget the shared connections, so new ones are opened.
+    """
+    with _CONNECTIONS_LOCK:
+        _CONNECTIONS.clear()
+
+
+# Keys of the dictionaries returned by get_raw_events(), which can be
+# selected with its fields argument.
+EVENT_FIELDS = ('source', 'counter_name', 'counter_type', 'counter_unit',
+                'counter_volume', 'user_id', 'project_id', 'resource_id',
+                'timestamp', 'resource_metadata', 'message_id',
+                'message_signature')
+
+# Keys of the dictionaries returned by get_resources(), which can be
+# selected with its fields argument.
+RESOURCE_FIELDS = ('resource_id', 'project_id', 'user_id', 'timestamp',
+                   'first_sample_timestamp', 'last_sample_timestamp',
+                   'metadata', 'meter')
+
+
 class EventFilter(object):
     """Holds the properties for building a query to filter events.
 
@@ -81,9 +165,17 @@ class EventFilter(object):
     :param meter: Optional filter for meter type using the meter name.
     :param source: Optional source filter.
     :param metaquery: Optional filter on the metadata
+    :param limit: Optional maximum number of events to return.
+    :param marker: Optional (timestamp, message_id) of the last event
+                   of the previous page. Only the events sorted after
+                   it are returned.
+
+    When a limit or a marker is given, the events are sorted by
+    timestamp and then by message_id.
     """
     def __init__(self, user=None, project=None, start=None, end=None,
-                 resource=None, meter=None, source=None, metaquery={}):
+                 resource=None, meter=None, source=None, metaquery={},
+                 limit=None, marker=None):
         self.user = user
         self.project = project
         self.start = self._sanitize_timestamp(start)
@@ -92,6 +184,8 @@ class EventFilter(object):
         self.meter = meter
         self.source = source
         self.metaquery = metaquery
+        self.limit = limit
+        self.marker = marker
 
     def _sanitize_timestamp(self, timestamp):
         """Return a naive utc datetime object"""
@@ -19,11 +19,150 @@
 """
 
 import abc
+import copy
+import datetime
 
 from ceilometer.openstack.common import log
+from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def get_period_origin(event_filter):
+    """Return the timestamp the statistics periods are counted from.
+
+    Periods start at the beginning of the filter time range when there
+    is one, and are aligned on the epoch otherwise.
+    """
+    if event_filter.start:
+        return event_filter.start.replace(microsecond=0)
+    return EPOCH
+
+
+# Length in seconds of the buckets of the rollups kept by the drivers
+# supporting them, longest first.
+ROLLUP_PERIODS = (24 * 60 * 60, 60 * 60)
+
+
+def get_rollup_bucket(timestamp, period):
+    """Return the start of the `period` seconds long rollup bucket
+    holding `timestamp`.
+    """
+    seconds = utils.dt_to_epoch(timestamp)
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % period)
+
+
+def merge_summaries(a, b):
+    """Return the summary of the events summarized by `a` and `b`.
+
+    A summary is a dictionary such as:
+
+    { 'count': number of events,
+      'sum': sum of the volumes,
+      'min': minimum volume,
+      'max': maximum volume,
+      'first': timestamp of the first event,
+      'last': timestamp of the last event,
+      }
+
+    Either summary may be None.
+    """
+    if a is None or not a['count']:
+        return b
+    if b is None or not b['count']:
+        return a
+    return {'count': a['count'] + b['count'],
+            'sum': a['sum'] + b['sum'],
+            'min': min(a['min'], b['min']),
+            'max': max(a['max'], b['max']),
+            'first': min(a['first'], b['first']),
+            'last': max(a['last'], b['last']),
+            }
+
+
+def make_rollup_deltas(samples):
+    """Return the changes the samples bring to the rollups.
+
+    The result maps (period, bucket, counter_name, resource_id,
+    project_id) keys to the summary of the samples falling in each
+    bucket. Missing resource and project ids are replaced by empty
+    strings, so they can be compared.
+    """
+    deltas = {}
+    for data in samples:
+        timestamp = data.get('timestamp')
+        if not timestamp:
+            continue
+        volume = data['counter_volume']
+        summary = {'count': 1,
+                   'sum': volume,
+                   'min': volume,
+                   'max': volume,
+                   'first': timestamp,
+                   'last': timestamp,
+                   }
+        for period in ROLLUP_PERIODS:
+            key = (period,
+                   get_rollup_bucket(timestamp, period),
+                   data['counter_name'],
+                   data['resource_id'] or '',
+                   data['project_id'] or '',
+                   )
+            deltas[key] = merge_summaries(deltas.get(key), summary)
+    return deltas
+
+
+def get_rollups_start(now):
+    """Return the time from which the rollups started at `now` hold
+    every sample: the start of the next hour, since the samples of the
+    current one may have been written before.
+    """
+    period = min(ROLLUP_PERIODS)
+    return (get_rollup_bucket(now, period) +
+            datetime.timedelta(seconds=period))
+
+
+def split_rollup_range(start, end, periods=ROLLUP_PERIODS):
+    """Split the [start, end) time range into whole rollup buckets
+    and ragged edges.
+
+    Returns a tuple (buckets, edges), where buckets is a list of
+    (period, start, end) tuples covering whole buckets of `period`
+    seconds and edges is a list of (start, end) tuples covering the
+    rest of the range.
+    """
+    if start >= end:
+        return [], []
+    if not periods:
+        return [], [(start, end)]
+    period = periods[0]
+    first = get_rollup_bucket(start, period)
+    if first < start:
+        first += datetime.timedelta(seconds=period)
+    last = get_rollup_bucket(end, period)
+    if first >= last:
+        return split_rollup_range(start, end, periods[1:])
+    before_buckets, before_edges = split_rollup_range(start, first,
+                                                      periods[1:])
+    after_buckets, after_edges = split_rollup_range(last, end, periods[1:])
+    return (before_buckets + [(period, first, last)] + after_buckets,
+            before_edges + after_edges)
+
+
+def rollups_cover(event_filter):
+    """Return True if the events selected by the filter can be
+    summarized from the rollups, which are kept by meter, resource and
+    project.
+    """
+    return bool(event_filter.meter
+                and event_filter.start
+                and event_filter.end
+                and event_filter.user is None
+                and event_filter.source is None
+                and not event_filter.metaquery)
+
 
 class StorageEngine(object):
     """Base class for storage engines.
@@ -56,6 +195,17 @@ class Connection(object):
     def upgrade(self, version=None):
         """Migrate the database to `version` or the most recent version."""
 
+    def is_alive(self):
+        """Return False if the connection to the database is known to
+        be broken and should be replaced.
+        """
+        return True
+
+    def close_session(self):
+        """Release what the calling thread holds on the connection,
+        such as its database session, at the end of a request.
+        """
+
     @abc.abstractmethod
     def record_metering_data(self, data):
         """Write the data to the backend storage system.
@@ -66,6 +216,151 @@ class Connection(object):
         All timestamps must be naive utc datetime object.
         """
 
+    # Number of seconds between the calls to flush() needed by a
+    # connection holding back some of the data it is given, or None.
+    flush_interval = None
+
+    def flush(self):
+        """Write the data the connection holds back in memory, if any.
+        """
+
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+
+        Drivers that can write several samples in fewer round trips
+        should override this. The default implementation records the
+        samples one at a time, in order.
+        """
+        for data in samples:
+            self.record_metering_data(data)
+
+    @abc.abstractmethod
+    def clear_expired_metering_data(self, ttl):
+        """Clear expired data from the backend storage system according
+        to the time-to-live.
+
+        The samples older than `ttl` seconds are deleted, along with
+        the resources left without samples. The rollups are kept.
+
+        :param ttl: Number of seconds to keep the samples.
+        """
+
+    # Whether the driver maintains rollups and answers the queries
+    # they cover from them. Drivers supporting rollups set it from
+    # the enable_rollups option, and implement _get_rollups(),
+    # _summarize_events(), _read_rollups_start() and _start_rollups().
+    _rollups_enabled = False
+
+    # Time from which the rollups hold every sample, once known.
+    _rollups_start = None
+
+    def _read_rollups_start(self):
+        """Return the stored time from which the rollups hold every
+        sample, or None if they have never been maintained.
+        """
+        raise NotImplementedError('rollups not implemented')
+
+    def _start_rollups(self):
+        """Store the time from which the rollups hold every sample,
+        unless another writer already did, and return it.
+        """
+        raise NotImplementedError('rollups not implemented')
+
+    def _ensure_rollups_start(self):
+        """Make sure the time from which the rollups hold every
+        sample is stored before they are first updated.
+        """
+        if self._rollups_start is None:
+            self._rollups_start = self._start_rollups()
+
+    def _get_rollups_start(self):
+        """Return the time from which the rollups hold every sample,
+        or None if they have never been maintained.
+        """
+        if self._rollups_start is None:
+            self._rollups_start = self._read_rollups_start()
+        return self._rollups_start
+
+    def _use_rollups(self, event_filter):
+        """Return True if the rollups should be used to answer a
+        query on the events selected by the filter.
+
+        The samples recorded before the rollups were enabled are not
+        in them, so the range must end after the rollups start.
+        """
+        if not (self._rollups_enabled and rollups_cover(event_filter)):
+            return False
+        start = self._get_rollups_start()
+        return start is not None and event_filter.end > start
+
+    def _get_rollups(self, event_filter, period, start, end):
+        """Return an iterable of (resource_id, summary) tuples read
+        from the `period` seconds long rollup buckets between `start`
+        and `end`, for the meter, resource and project of the filter.
+        """
+        raise NotImplementedError('rollups not implemented')
+
+    def _summarize_events(self, event_filter):
+        """Return an iterable of (resource_id, summary) tuples
+        computed from the raw events selected by the filter.
+        """
+        raise NotImplementedError('rollups not implemented')
+
+    def _summarize_by_resource(self, event_filter):
+        """Return a dictionary mapping resource ids to the summary of
+        their events selected by the filter.
+
+        The whole buckets of the time range are read from the rollups,
+        and only the ragged edges are computed from the raw events,
+        along with the part of the range before the rollups start.
+        """
+        rollups_start = max(event_filter.start, self._get_rollups_start())
+        buckets, edges = split_rollup_range(rollups_start,
+                                            event_filter.end)
+        if event_filter.start < rollups_start:
+            edges.append((event_filter.start, rollups_start))
+        parts = []
+        for period, start, end in buckets:
+            parts.extend(self._get_rollups(event_filter, period, start, end))
+        for start, end in edges:
+            edge_filter = copy.copy(event_filter)
+            edge_filter.start = start
+            edge_filter.end = end
+            parts.extend(self._summarize_events(edge_filter))
+        summaries = {}
+        for resource_id, summary in parts:
+            resource_id = resource_id or None
+            summaries[resource_id] = merge_summaries(
+                summaries.get(resource_id), summary)
+        return summaries
+
+    def _get_rollup_statistics(self, event_filter):
+        """Return the statistics of get_meter_statistics() without a
+        period, computed with _summarize_by_resource().
+        """
+        summary = None
+        for s in self._summarize_by_resource(event_filter).itervalues():
+            summary = merge_summaries(summary, s)
+        if summary is None:
+            summary = {'count': 0, 'sum': None, 'min': None, 'max': None,
+                       'first': None, 'last': None}
+        count = summary['count']
+        return [{'min': summary['min'],
+                 'max': summary['max'],
+                 'avg': (float(summary['sum']) / count) if count else None,
+                 'sum': summary['sum'],
+                 'count': count,
+                 'duration': None,
+                 'duration_start': summary['first'],
+                 'duration_end': summary['last'],
+                 'period': 0,
+                 'period_start': event_filter.start,
+                 'period_end': event_filter.end,
+                 }]
+
     @abc.abstractmethod
     def get_users(self, source=None):
         """Return an iterable of user id strings.
@@ -83,7 +378,8 @@ class Connection(object):
     @abc.abstractmethod
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, end_timestamp=None,
-                      metaquery={}, resource=None):
+                      metaquery={}, resource=None, limit=None, marker=None,
+                      fields=None):
         """Return an iterable of dictionaries containing resource information.
 
         { 'resource_id': UUID of the resource,
@@ -101,11 +397,21 @@ class Connection(object):
         :param end_timestamp: Optional modified timestamp end range.
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
+        :param limit: Optional maximum number of resources to return.
+        :param marker: Optional ID of the last resource of the previous
+                       page. Only the resources sorted after it are
+                       returned.
+        :param fields: Optional list of the keys of
+                       ceilometer.storage.RESOURCE_FIELDS to return.
+                       The resource_id is always returned.
+
+        When a limit or a marker is given, the resources are sorted by
+        ID.
         """
 
     @abc.abstractmethod
     def get_meters(self, user=None, project=None, resource=None, source=None,
-                   metaquery={}):
+                   metaquery={}, limit=None, marker=None):
         """Return an iterable of dictionaries containing meter information.
 
         { 'name': name of the meter,
@@ -121,12 +427,27 @@ class Connection(object):
         :param resource: Optional resource filter.
         :param source: Optional source filter.
         :param metaquery: Optional dict with metadata to match on.
+        :param limit: Optional maximum number of meters to return.
+        :param marker: Optional (resource_id, name, type, unit) of the
+                       last meter of the previous page. Only the meters
+                       sorted after it are returned.
+
+        When a limit or a marker is given, the meters are sorted by
+        resource_id, name, type and unit, a missing value sorting as
+        an empty string.
         """
 
     @abc.abstractmethod
-    def get_raw_events(self, event_filter):
+    def get_raw_events(self, event_filter, fields=None):
         """Return an iterable of raw event data as created by
         :func:`ceilometer.meter.meter_message_from_counter`.
+
+        The limit and marker of the filter are honoured.
+
+        :param event_filter: EventFilter instance
+        :param fields: Optional list of the keys of
+                       ceilometer.storage.EVENT_FIELDS to return,
+                       instead of all of them.
         """
 
     @abc.abstractmethod
@@ -162,8 +483,8 @@ class Connection(object):
         """
 
     @abc.abstractmethod
-    def get_meter_statistics(self, event_filter):
-        """Return a dictionary containing meter statistics.
+    def get_meter_statistics(self, event_filter, period=None):
+        """Return a list of dictionaries containing meter statistics
         described by the query parameters.
 
         The filter must have a meter value set.
@@ -176,6 +497,16 @@ class Connection(object):
           'duration':
           'duration_start':
           'duration_end':
+          'period':
+          'period_start':
+          'period_end':
           }
 
+        :param event_filter: EventFilter instance
+        :param period: Optional length of the periods, in seconds. When
+                       set, there is one dictionary for each period
+                       holding events, in chronological order, with the
+                       periods counted from get_period_origin(). When
+                       not set, a single dictionary covers all of the
+                       events.
         """
@@ -59,6 +59,14 @@ class Connection(base.Connection):
                  data['resource_id'],
                  data['counter_volume'])
 
+    def clear_expired_metering_data(self, ttl):
+        """Clear expired data from the backend storage system according
+        to the time-to-live.
+
+        :param ttl: Number of seconds to keep the samples.
+        """
+        LOG.info('Dropping data with TTL %d', ttl)
+
     def get_users(self, source=None):
         """Return an iterable of user id strings.
 
@@ -73,7 +81,8 @@ class Connection(base.Connection):
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, end_timestamp=None,
-                      metaquery={}, resource=None):
+                      metaquery={}, resource=None, limit=None, marker=None,
+                      fields=None):
         """Return an iterable of dictionaries containing resource information.
 
         { 'resource_id': UUID of the resource,
@@ -91,10 +100,13 @@ class Connection(base.Connection):
         :param end_timestamp: Optional modified timestamp end range.
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
+        :param limit: Optional maximum number of resources to return.
+        :param marker: Optional ID of the last resource already seen.
+        :param fields: Optional list of the keys to return.
         """
 
     def get_meters(self, user=None, project=None, resource=None, source=None,
-                   metaquery={}):
+                   metaquery={}, limit=None, marker=None):
         """Return an iterable of dictionaries containing meter information.
 
         { 'name': name of the meter,
@@ -109,9 +121,11 @@ class Connection(base.Connection):
         :param resource: Optional resource filter.
         :param source: Optional source filter.
         :param metaquery: Optional dict with metadata to match on.
+        :param limit: Optional maximum number of meters to return.
+        :param marker: Optional key of the last meter already seen.
         """
 
-    def get_raw_events(self, event_filter):
+    def get_raw_events(self, event_filter, fields=None):
         """Return an iterable of raw event data as created by
         :func:`ceilometer.meter.meter_message_from_counter`.
         """
@@ -131,8 +145,8 @@ class Connection(base.Connection):
         matching the event_filter.
         """
 
-    def get_meter_statistics(self, event_filter):
-        """Return a dictionary containing meter statistics.
+    def get_meter_statistics(self, event_filter, period=None):
+        """Return a list of dictionaries containing meter statistics
         described by the query parameters.
 
         The filter must have a meter value set.
@@ -145,6 +159,9 @@ class Connection(base.Connection):
           'duration':
           'duration_start':
           'duration_end':
+          'period':
+          'period_start':
+          'period_end':
           }
 
         """
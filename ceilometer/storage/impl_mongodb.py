@@ -20,9 +20,14 @@
 
 import copy
 import datetime
+import hashlib
+import time
 
+from ceilometer.openstack.common import cfg
 from ceilometer.openstack.common import log
+from ceilometer.openstack.common import timeutils
 from ceilometer.storage import base
+from ceilometer import utils
 
 import bson.code
 import pymongo
@@ -32,6 +37,43 @@ from urlparse import urlparse
 
 LOG = log.getLogger(__name__)
 
+MONGODB_OPTS = [
+    cfg.IntOpt('mongodb_key_cache_size',
+               default=10000,
+               help='number of user, project and resource keys remembered '
+               'as already stored, to skip their upserts (0 disables)',
+               ),
+    cfg.IntOpt('mongodb_key_cache_ttl',
+               default=600,
+               help='seconds after which a remembered key is upserted again',
+               ),
+    cfg.IntOpt('mongodb_resource_flush_interval',
+               default=0,
+               help='seconds during which resource updates are coalesced '
+               'in memory before being written by the collector (0 writes '
+               'them immediately)',
+               ),
+    cfg.BoolOpt('mongodb_sharded',
+                default=False,
+                help='shard the meter and resource collections on the '
+                'hashed resource id, when connected to a mongos router',
+                ),
+    cfg.BoolOpt('mongodb_record_metaqueries',
+                default=False,
+                help='count the queries on each set of metadata keys for '
+                'ceilometer-index-advisor, at the cost of a write per '
+                'query',
+                ),
+    cfg.IntOpt('mongodb_max_metadata_indexes',
+               default=0,
+               help='number of indexes ceilometer-index-advisor creates '
+               'for the most queried sets of metadata keys (0 only '
+               'reports them)',
+               ),
+]
+
+cfg.CONF.register_opts(MONGODB_OPTS)
+
 
 class MongoDBStorage(base.StorageEngine):
     """Put the data into a MongoDB database
@@ -53,11 +95,22 @@ class MongoDBStorage(base.StorageEngine):
           - { _id: uuid of resource,
               metadata: metadata dictionaries
               timestamp: datetime of last update
+              first_sample_timestamp: datetime of the first sample
+              last_sample_timestamp: datetime of the last sample
               user_id: uuid
               project_id: uuid
               meter: [ array of {counter_name: string, counter_type: string,
                                  counter_unit: string} ]
             }
+        - metaquery_stats
+          - the sets of metadata keys queried
+          - { _id: collection and keys
+              collection: name of the collection queried
+              keys: [ array of the metadata fields queried ]
+              sample: [ array of [field, value] of the last query ]
+              count: number of queries
+              last_seen: datetime of the last query
+            }
     """
 
     OPTIONS = []
@@ -122,6 +175,36 @@ def make_query_from_filter(event_filter, require_meter=True):
     return q
 
 
+def _add_id_bound(q, operator, value):
+    """Restrict the _id of the documents matched by the query `q`
+    with a comparison `operator`, keeping any _id filter it has.
+    """
+    id_filter = q.get('_id')
+    if id_filter is None:
+        q['_id'] = {operator: value}
+    elif isinstance(id_filter, dict):
+        id_filter[operator] = value
+    else:
+        q['_id'] = {'$in': [id_filter], operator: value}
+
+
+def _make_projection(fields, names={}):
+    """Return the projection document reading only the `fields` of
+    the documents, or None to read them whole when `fields` is None.
+
+    :param names: dict mapping the fields to the names of the
+                  document keys holding them, when they differ
+    """
+    if fields is None:
+        return None
+    # An empty projection would return the whole documents, so the
+    # _id is always included.
+    projection = {'_id': 1}
+    for field in fields:
+        projection[names.get(field, field)] = 1
+    return projection
+
+
 class Connection(base.Connection):
     """MongoDB connection.
     """
@@ -187,6 +270,34 @@ class Connection(base.Connection):
     }
     """)
 
+    # Same as MAP_STATS, but grouping the events by period. The key is
+    # the offset of the period from the origin, in milliseconds.
+    MAP_STATS_PERIOD = bson.code.Code("""
+    function () {
+        var offset = this.timestamp.getTime() - origin;
+        emit(offset - (offset % period),
+             { min : this.counter_volume,
+               max : this.counter_volume,
+               qty : this.counter_volume,
+               count : 1,
+               timestamp_min : this.timestamp,
+               timestamp_max : this.timestamp } )
+    }
+    """)
+
+    # Same as MAP_STATS, but grouping the events by resource.
+    MAP_STATS_RESOURCE = bson.code.Code("""
+    function () {
+        emit(this.resource_id,
+             { min : this.counter_volume,
+               max : this.counter_volume,
+               qty : this.counter_volume,
+               count : 1,
+               timestamp_min : this.timestamp,
+               timestamp_max : this.timestamp } )
+    }
+    """)
+
     REDUCE_STATS = bson.code.Code("""
     function (key, values) {
         var res = values[0];
@@ -206,6 +317,71 @@ class Connection(base.Connection):
     }
     """)
 
+    # $group stages used instead of the map-reduce functions above
+    # when the server supports the aggregation framework.
+    GROUP_COUNTER_VOLUME_SUM = {
+        '_id': '$resource_id',
+        'value': {'$sum': '$counter_volume'},
+    }
+
+    GROUP_COUNTER_VOLUME_MAX = {
+        '_id': '$resource_id',
+        'value': {'$max': '$counter_volume'},
+    }
+
+    GROUP_TIMESTAMP = {
+        '_id': None,
+        'min': {'$min': '$timestamp'},
+        'max': {'$max': '$timestamp'},
+    }
+
+    GROUP_STATS = {
+        '_id': None,
+        'min': {'$min': '$counter_volume'},
+        'max': {'$max': '$counter_volume'},
+        'qty': {'$sum': '$counter_volume'},
+        'count': {'$sum': 1},
+        'timestamp_min': {'$min': '$timestamp'},
+        'timestamp_max': {'$max': '$timestamp'},
+    }
+
+    GROUP_STATS_RESOURCE = dict(GROUP_STATS, _id='$resource_id')
+
+    # Fields identifying a rollup document, in the order of the keys
+    # returned by base.make_rollup_deltas().
+    ROLLUP_KEY = ('period', 'bucket', 'counter_name', 'resource_id',
+                  'project_id')
+
+    # The aggregation framework first shipped with MongoDB 2.2, but
+    # the date arithmetic used to group statistics by period needs 2.4.
+    AGGREGATE_MIN_VERSION = (2, 2)
+    AGGREGATE_PERIOD_MIN_VERSION = (2, 4)
+
+    # The $min and $max update operators first shipped with MongoDB 2.6.
+    MIN_MAX_UPDATE_MIN_VERSION = (2, 6)
+
+    # Number of resource ids looked up by each query for samples in a
+    # time range.
+    SAMPLE_LOOKUP_BATCH_SIZE = 1000
+
+    # Shard key fields of the collections sharded in sharded mode.
+    # Hashing the resource id spreads the writes over the shards, and
+    # the queries for a resource, the most common filter of the API,
+    # are routed to the single shard holding it.
+    SHARD_KEYS = {'meter': 'resource_id',
+                  'resource': '_id',
+                  }
+
+    # Prefix of the metadata fields of the collections queried with
+    # a metaquery.
+    METADATA_FIELDS = {'meter': 'resource_metadata.',
+                       'resource': 'metadata.',
+                       }
+
+    # Prefix of the names of the indexes created for the metadata
+    # keys, to tell them apart from the other indexes.
+    METAQUERY_INDEX_PREFIX = 'metaquery_'
+
     def __init__(self, conf):
         opts = self._parse_connection_url(conf.database_connection)
         LOG.info('connecting to MongoDB on %s:%s', opts['host'], opts['port'])
@@ -233,9 +409,126 @@ class Connection(base.Connection):
                 ('timestamp', pymongo.ASCENDING),
                 ('source', pymongo.ASCENDING),
             ], name='meter_idx')
+        # Find the resources with samples in a time range.
+        self.db.resource.ensure_index([
+            ('last_sample_timestamp', pymongo.ASCENDING),
+            ('first_sample_timestamp', pymongo.ASCENDING),
+        ], name='resource_sample_ts_idx')
+
+        self._sharded = cfg.CONF.mongodb_sharded
+        if self._sharded:
+            self._shard_collections(opts['dbname'])
+
+        self._rollups_enabled = cfg.CONF.enable_rollups
+        if self._rollups_enabled:
+            # The unique index keeps concurrent writers from creating
+            # the same rollup twice, and serves the rollup queries.
+            self.db.meter_rollup.ensure_index([
+                ('counter_name', pymongo.ASCENDING),
+                ('period', pymongo.ASCENDING),
+                ('bucket', pymongo.ASCENDING),
+                ('resource_id', pymongo.ASCENDING),
+                ('project_id', pymongo.ASCENDING),
+            ], name='meter_rollup_idx', unique=True)
+
+        # Keys already written by this connection, and the resource
+        # updates waiting to be written.
+        self._known_keys = utils.LRUCache(cfg.CONF.mongodb_key_cache_size,
+                                          cfg.CONF.mongodb_key_cache_ttl)
+        self._pending_resources = {}
+        self._resources_flushed_at = time.time()
+
+        # Whether the server supports the aggregation framework and
+        # the $min/$max update operators, determined the first time
+        # they are needed.
+        self._aggregate_supported = None
+        self._aggregate_period_supported = None
+        self._min_max_supported = None
 
     def upgrade(self, version=None):
-        pass
+        """Set the range of sample timestamps of the resources
+        recorded before it was maintained, and make the TTL index
+        match time_to_live.
+        """
+        self._ensure_ttl_index(cfg.CONF.time_to_live)
+        for r in self.db.resource.find(
+                {'first_sample_timestamp': {'$exists': False}},
+                fields=['_id']):
+            samples = self.db.meter.find({'resource_id': r['_id']},
+                                         fields=['timestamp'])
+            first = samples.clone().sort('timestamp', pymongo.ASCENDING)
+            last = samples.clone().sort('timestamp', pymongo.DESCENDING)
+            first = list(first.limit(1))
+            last = list(last.limit(1))
+            if first:
+                self._extend_sample_range(r['_id'],
+                                          first[0]['timestamp'],
+                                          last[0]['timestamp'])
+
+    def _ensure_ttl_index(self, ttl):
+        """Make the server expire the samples older than `ttl`
+        seconds in the background, with a TTL index on their
+        timestamp. The index is removed when `ttl` is not positive.
+
+        Rebuilding the index is expensive and a connection configured
+        without a ttl must not remove it, so this is only done by
+        ceilometer-dbsync and ceilometer-expirer, not by every
+        connection.
+        """
+        index = self.db.meter.index_information().get('meter_ttl')
+        if index is not None:
+            if ttl > 0 and index.get('expireAfterSeconds') == ttl:
+                return
+            # The server does not update the options of an existing
+            # index, so it has to be created again.
+            self.db.meter.drop_index('meter_ttl')
+        if ttl > 0:
+            self.db.meter.ensure_index('timestamp',
+                                       name='meter_ttl',
+                                       expireAfterSeconds=ttl)
+
+    def _shard_collections(self, dbname):
+        """Shard the collections listed in SHARD_KEYS on their hashed
+        key, unless they already are.
+
+        The indexes are created in any case, but only a mongos router
+        accepts the sharding commands.
+        """
+        # pymongo only has a HASHED constant from 2.5.
+        for collection, field in self.SHARD_KEYS.iteritems():
+            self.db[collection].ensure_index([(field, 'hashed')],
+                                             name='%s_shard_idx' % collection)
+        # Find the samples of the resources spanning a time range on
+        # the shards holding them, without scanning their whole history.
+        self.db.meter.ensure_index([
+            ('resource_id', pymongo.ASCENDING),
+            ('timestamp', pymongo.ASCENDING),
+        ], name='meter_rid_ts_idx')
+        if self.conn.admin.command('ismaster').get('msg') != 'isdbgrid':
+            LOG.warning('mongodb_sharded is set but %s is not a mongos '
+                        'router, the collections are not sharded', dbname)
+            return
+        config = self.conn.config
+        database = config.databases.find_one({'_id': dbname})
+        if not (database and database.get('partitioned')):
+            self.conn.admin.command('enableSharding', dbname)
+        for collection, field in self.SHARD_KEYS.iteritems():
+            ns = '%s.%s' % (dbname, collection)
+            if config.collections.find_one({'_id': ns,
+                                            'dropped': False}) is None:
+                LOG.info('sharding %s on hashed %s', ns, field)
+                self.conn.admin.command('shardCollection', ns,
+                                        key={field: 'hashed'})
+
+    def is_alive(self):
+        """Return False if the database server cannot be reached.
+        """
+        try:
+            self.db.command('ping')
+        except pymongo.errors.PyMongoError as err:
+            LOG.warning('MongoDB connection check failed: %s', err)
+            return False
+        return True
 
     def _get_connection(self, opts):
         """Return a connection to the database.
@@ -247,6 +540,178 @@ class Connection(base.Connection):
         """
         return pymongo.Connection(opts['host'], opts['port'], safe=True)
 
+    def _get_server_version(self):
+        """Return the (major, minor) version of the server, or an
+        empty tuple when it does not report one.
+        """
+        try:
+            version = self.conn.server_info()['versionArray']
+        except (AttributeError, KeyError, TypeError,
+                pymongo.errors.PyMongoError):
+            # The in-memory implementation used by the tests
+            # does not report a version.
+            version = []
+        return tuple(version[:2])
+
+    def _use_min_max_update(self):
+        """Return True if the range of sample timestamps of the
+        resources can be extended with the $min and $max update
+        operators.
+        """
+        if self._min_max_supported is None:
+            self._min_max_supported = (self._get_server_version() >=
+                                       self.MIN_MAX_UPDATE_MIN_VERSION)
+        return self._min_max_supported
+
+    def _use_aggregate(self, period=False):
+        """Return True if the statistics queries should use the
+        aggregation framework instead of map-reduce, for a query
+        grouping the events by period when `period` is set.
+        """
+        if self._aggregate_supported is None:
+            version = self._get_server_version()
+            self._aggregate_supported = (version >=
+                                         self.AGGREGATE_MIN_VERSION)
+            self._aggregate_period_supported = (
+                version >= self.AGGREGATE_PERIOD_MIN_VERSION)
+            LOG.debug('using %s for statistics queries, %s by period',
+                      'aggregate' if self._aggregate_supported
+                      else 'map-reduce',
+                      'aggregate' if self._aggregate_period_supported
+                      else 'map-reduce')
+        if period:
+            return self._aggregate_period_supported
+        return self._aggregate_supported
+
+    def _aggregate(self, query, group):
+        """Run a $match/$group pipeline on the meter collection and
+        return the list of grouped documents.
+        """
+        results = self.db.meter.aggregate([{'$match': query},
+                                           {'$group': group},
+                                           ])
+        return results['result']
+
+    def _make_query(self, event_filter, require_meter=True):
+        """Return the query document for the filter, after recording
+        the metadata keys it queries.
+        """
+        q = make_query_from_filter(event_filter, require_meter)
+        self._record_metaquery('meter', q)
+        return q
+
+    def _record_metaquery(self, collection, q):
+        """Count the query `q` of `collection` in the statistics of
+        its set of metadata keys, if it queries any and
+        mongodb_record_metaqueries is set.
+        """
+        if not cfg.CONF.mongodb_record_metaqueries:
+            return
+        prefix = self.METADATA_FIELDS[collection]
+        sample = sorted([k, v] for k, v in q.iteritems()
+                        if k.startswith(prefix))
+        if not sample:
+            return
+        keys = [k for k, v in sample]
+        try:
+            self.db.metaquery_stats.update(
+                {'_id': '%s:%s' % (collection, ','.join(keys))},
+                {'$set': {'collection': collection,
+                          'keys': keys,
+                          'sample': sample,
+                          'last_seen': timeutils.utcnow(),
+                          },
+                 '$inc': {'count': 1},
+                 },
+                upsert=True)
+        except pymongo.errors.PyMongoError as err:
+            # The statistics are not worth failing the query.
+            LOG.warning('Failed to record metadata query: %s', err)
+
+    def _get_metaquery_index_name(self, stats):
+        return self.METAQUERY_INDEX_PREFIX + hashlib.md5(
+            stats['_id'].encode('utf-8')).hexdigest()[:16]
+
+    def get_metaquery_report(self):
+        """Return the list of the sets of metadata keys queried, most
+        queried first, as dictionaries.
+
+        { 'collection': name of the collection queried,
+          'keys': list of the metadata fields queried,
+          'count': number of queries,
+          'last_seen': UTC datetime of the last query,
+          'index': name of the index created for the keys, or None,
+          'plan': explain() output for the last query, or None,
+          }
+        """
+        report = []
+        for stats in self.db.metaquery_stats.find().sort(
+                'count', pymongo.DESCENDING):
+            collection = self.db[stats['collection']]
+            index = self._get_metaquery_index_name(stats)
+            if index not in collection.index_information():
+                index = None
+            try:
+                plan = collection.find(dict(stats['sample'])).explain()
+            except (AttributeError, pymongo.errors.PyMongoError):
+                # The in-memory implementation used by the tests
+                # cannot explain queries.
+                plan = None
+            report.append({'collection': stats['collection'],
+                           'keys': stats['keys'],
+                           'count': stats['count'],
+                           'last_seen': stats['last_seen'],
+                           'index': index,
+                           'plan': plan,
+                           })
+        return report
+
+    def ensure_metaquery_indexes(self, max_count):
+        """Index the `max_count` most queried sets of metadata keys,
+        and drop the indexes created for the other ones. Return the
+        names of the indexes created.
+
+        The indexes are sparse, since most metadata keys are only
+        set on some of the samples, and built in the background.
+        """
+        wanted = {}
+        if max_count > 0:
+            for stats in self.db.metaquery_stats.find().sort(
+                    'count', pymongo.DESCENDING).limit(max_count):
+                wanted[self._get_metaquery_index_name(stats)] = stats
+        created = []
+        for name in self.METADATA_FIELDS:
+            collection = self.db[name]
+            existing = collection.index_information()
+            for index in existing:
+                if (index.startswith(self.METAQUERY_INDEX_PREFIX)
+                        and index not in wanted):
+                    LOG.info('dropping index %s of %s', index, name)
+                    collection.drop_index(index)
+            for index, stats in wanted.iteritems():
+                if stats['collection'] != name or index in existing:
+                    continue
+                LOG.info('creating index %s of %s on %s', index, name,
+                         ', '.join(stats['keys']))
+                collection.ensure_index([(k, pymongo.ASCENDING)
+                                         for k in stats['keys']],
+                                        name=index,
+                                        sparse=True,
+                                        background=True)
+                created.append(index)
+        return created
+
+    def _map_reduce(self, query, map_func, reduce_func, **kwargs):
+        """Run an inline map-reduce on the meter collection and
+        return the list of {'_id': key, 'value': value} documents.
+        """
+        results = self.db.meter.map_reduce(map_func,
+                                           reduce_func,
+                                           {'inline': 1},
+                                           query=query,
+                                           **kwargs)
+        return results['results']
+
     def _parse_connection_url(self, url):
         opts = {}
         result = urlparse(url)
@@ -271,50 +736,318 @@ class Connection(base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
-        # Make sure we know about the user and project
-        self.db.user.update(
-            {'_id': data['user_id']},
-            {'$addToSet': {'source': data['source'],
-                           },
-             },
-            upsert=True,
-        )
-        self.db.project.update(
-            {'_id': data['project_id']},
-            {'$addToSet': {'source': data['source'],
-                           },
-             },
-            upsert=True,
-        )
-
-        # Record the updated resource metadata
+        self.record_metering_data_batch([data])
+
+    @staticmethod
+    def _add_to_set(values):
+        """Return the $addToSet argument adding all of the values.
+
+        A single value is added directly so that the common case of a
+        batch of one sample does not depend on $each support.
+        """
+        if len(values) == 1:
+            return values[0]
+        return {'$each': values}
+
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        The user, project and resource updates are folded so that
+        each of them is written once per batch, and the raw samples
+        are stored with a single bulk insert. User, project and
+        resource meter keys this connection has already stored are
+        not written again.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+
+        user_sources = {}
+        project_sources = {}
+        # resource id -> (most recent sample, list of new meters,
+        #                 first and last sample timestamps)
+        resources = {}
+        for data in samples:
+            self._fold_source(user_sources, ('user', data['user_id']),
+                              data['source'])
+            self._fold_source(project_sources,
+                              ('project', data['project_id']),
+                              data['source'])
+            meter = {'counter_name': data['counter_name'],
+                     'counter_type': data['counter_type'],
+                     'counter_unit': data['counter_unit'],
+                     }
+            timestamp = data['timestamp']
+            last, meters, first_ts, last_ts = resources.get(
+                data['resource_id'], (None, [], timestamp, timestamp))
+            key = ('meter', data['resource_id'], data['counter_name'],
+                   data['counter_type'], data['counter_unit'])
+            if key not in self._known_keys and meter not in meters:
+                meters.append(meter)
+            resources[data['resource_id']] = (data, meters,
+                                              min(first_ts, timestamp),
+                                              max(last_ts, timestamp))
+
+        # Make sure we know about the users and projects
+        for collection, folded in [(self.db.user, user_sources),
+                                   (self.db.project, project_sources)]:
+            for (kind, obj_id), sources in folded.iteritems():
+                collection.update(
+                    {'_id': obj_id},
+                    {'$addToSet': {'source': self._add_to_set(sources),
+                                   },
+                     },
+                    upsert=True,
+                )
+                for source in sources:
+                    self._known_keys.add((kind, obj_id, source))
+
+        # Record the updated resource metadata, using the last
+        # sample of the batch for each resource.
         received_timestamp = datetime.datetime.utcnow()
-        self.db.resource.update(
-            {'_id': data['resource_id']},
-            {'$set': {'project_id': data['project_id'],
-                      'user_id': data['user_id'],
-                      # Current metadata being used and when it was
-                      # last updated.
-                      'timestamp': data['timestamp'],
-                      'received_timestamp': received_timestamp,
-                      'metadata': data['resource_metadata'],
-                      'source': data['source'],
-                      },
-             '$addToSet': {'meter': {'counter_name': data['counter_name'],
-                                     'counter_type': data['counter_type'],
-                                     'counter_unit': data['counter_unit'],
-                                     },
-                           },
-             },
-            upsert=True,
-        )
-
-        # Record the raw data for the event. Use a copy so we do not
-        # modify a data structure owned by our caller (the driver adds
+        for resource_id, (data, meters, first, last) in \
+                resources.iteritems():
+            pending = self._pending_resources.get(resource_id)
+            if pending is not None:
+                meters = pending[1] + [m for m in meters
+                                       if m not in pending[1]]
+                first = min(first, pending[3])
+                last = max(last, pending[4])
+            self._pending_resources[resource_id] = (data, meters,
+                                                    received_timestamp,
+                                                    first, last)
+        if (time.time() - self._resources_flushed_at >=
+                cfg.CONF.mongodb_resource_flush_interval):
+            self._flush_resources()
+
+        # Record the raw data for the events. Use copies so we do not
+        # modify data structures owned by our caller (the driver adds
         # a new key '_id').
-        record = copy.copy(data)
-        self.db.meter.insert(record)
-        return
+        self.db.meter.insert([copy.copy(data) for data in samples])
+
+        if self._rollups_enabled:
+            self._ensure_rollups_start()
+            self._update_rollups(samples)
+
+    def clear_expired_metering_data(self, ttl):
+        """Clear expired data from the backend storage system according
+        to the time-to-live.
+
+        The TTL index already removes the samples in the background,
+        but only about once a minute and on MongoDB 2.2 and later, so
+        they are also removed here.
+
+        :param ttl: Number of seconds to keep the samples.
+        """
+        self._ensure_ttl_index(ttl)
+        self._flush_pending_resources()
+        end = timeutils.utcnow() - datetime.timedelta(seconds=ttl)
+        self.db.meter.remove({'timestamp': {'$lt': end}})
+        # The resources whose last sample is older than the limit may
+        # have no samples left.
+        for r in self.db.resource.find({'timestamp': {'$lt': end}},
+                                       fields=['_id']):
+            if self.db.meter.find_one({'resource_id': r['_id']},
+                                      fields=['_id']) is None:
+                self.db.resource.remove({'_id': r['_id']})
+        # The remaining resources have no sample before the limit.
+        self.db.resource.update(
+            {'first_sample_timestamp': {'$lt': end}},
+            {'$set': {'first_sample_timestamp': end}},
+            multi=True)
+        self._known_keys.clear()
+
+    def _read_rollups_start(self):
+        """Return the stored time from which the rollups hold every
+        sample, or None if they have never been maintained.
+        """
+        doc = self.db.meter_rollup_start.find_one({'_id': 1})
+        return doc['timestamp'] if doc else None
+
+    def _start_rollups(self):
+        """Store the time from which the rollups hold every sample,
+        unless another writer already did, and return it.
+        """
+        start = self._read_rollups_start()
+        if start is None:
+            start = base.get_rollups_start(timeutils.utcnow())
+            try:
+                self.db.meter_rollup_start.insert({'_id': 1,
+                                                   'timestamp': start})
+            except pymongo.errors.DuplicateKeyError:
+                start = self._read_rollups_start()
+            LOG.info('rollups hold the samples from %s', start)
+        return start
+
+    def _update_rollups(self, samples):
+        """Add the samples to the hourly and daily rollups.
+
+        The count and sum are incremented atomically. The minimum,
+        maximum, first and last values are then only written when the
+        samples change them, with updates conditioned on the stored
+        value so concurrent writers cannot overwrite a better one.
+        """
+        for key, delta in base.make_rollup_deltas(samples).iteritems():
+            q = dict(zip(self.ROLLUP_KEY, key))
+            update = {'$inc': {'sample_count': delta['count'],
+                               'volume_sum': delta['sum'],
+                               },
+                      }
+            try:
+                rollup = self.db.meter_rollup.find_and_modify(
+                    q, update, upsert=True, new=True)
+            except pymongo.errors.OperationFailure:
+                # Another writer created the rollup first, so it
+                # can now be updated.
+                rollup = self.db.meter_rollup.find_and_modify(
+                    q, update, upsert=True, new=True)
+            for field, operator, best, value in [
+                    ('volume_min', '$gt', min, delta['min']),
+                    ('volume_max', '$lt', max, delta['max']),
+                    ('first_timestamp', '$gt', min, delta['first']),
+                    ('last_timestamp', '$lt', max, delta['last']),
+            ]:
+                current = rollup.get(field)
+                if current is not None and best(current, value) == current:
+                    continue
+                self.db.meter_rollup.update(
+                    dict(q, **{'$or': [{field: {'$exists': False}},
+                                       {field: {operator: value}},
+                                       ]}),
+                    {'$set': {field: value}},
+                )
+
+    def _get_rollups(self, event_filter, period, start, end):
+        """Return an iterable of (resource_id, summary) tuples read
+        from the `period` seconds long rollup buckets between `start`
+        and `end`, for the meter, resource and project of the filter.
+        """
+        q = {'counter_name': event_filter.meter,
+             'period': period,
+             'bucket': {'$gte': start, '$lt': end},
+             }
+        if event_filter.resource is not None:
+            q['resource_id'] = event_filter.resource
+        if event_filter.project is not None:
+            q['project_id'] = event_filter.project
+        for r in self.db.meter_rollup.find(q):
+            yield (r['resource_id'], {'count': r['sample_count'],
+                                      'sum': r['volume_sum'],
+                                      'min': r['volume_min'],
+                                      'max': r['volume_max'],
+                                      'first': r['first_timestamp'],
+                                      'last': r['last_timestamp'],
+                                      })
+
+    def _summarize_events(self, event_filter):
+        """Return an iterable of (resource_id, summary) tuples
+        computed from the raw events selected by the filter.
+        """
+        q = self._make_query(event_filter)
+        if self._use_aggregate():
+            results = [(r['_id'], r)
+                       for r in self._aggregate(q, self.GROUP_STATS_RESOURCE)]
+        else:
+            results = [(r['_id'], r['value']) for r in
+                       self._map_reduce(q, self.MAP_STATS_RESOURCE,
+                                        self.REDUCE_STATS)]
+        for resource_id, r in results:
+            first, last = self._fix_interval_min_max(r['timestamp_min'],
+                                                     r['timestamp_max'])
+            yield (resource_id, {'count': int(r['count']),
+                                 'sum': r['qty'],
+                                 'min': r['min'],
+                                 'max': r['max'],
+                                 'first': first,
+                                 'last': last,
+                                 })
+
+    def _fold_source(self, folded, key, source):
+        """Add the source to the list for the key, unless the
+        (key, source) pair is known to be stored already.
+        """
+        if key + (source,) in self._known_keys:
+            return
+        sources = folded.setdefault(key, [])
+        if source not in sources:
+            sources.append(source)
+
+    @property
+    def flush_interval(self):
+        return cfg.CONF.mongodb_resource_flush_interval or None
+
+    def flush(self):
+        """Write the coalesced resource updates.
+        """
+        self._flush_pending_resources()
+
+    def _flush_pending_resources(self):
+        """Write the coalesced resource updates before reading the
+        resources, so a connection always sees its own writes.
+        """
+        if self._pending_resources:
+            self._flush_resources()
+
+    def _flush_resources(self):
+        """Write the resource updates coalesced in memory.
+        """
+        pending, self._pending_resources = self._pending_resources, {}
+        self._resources_flushed_at = time.time()
+        min_max = self._use_min_max_update()
+        for resource_id, (data, meters, received, first, last) in \
+                pending.iteritems():
+            update = {'$set': {'project_id': data['project_id'],
+                               'user_id': data['user_id'],
+                               # Current metadata being used and when it
+                               # was last updated.
+                               'timestamp': data['timestamp'],
+                               'received_timestamp': received,
+                               'metadata': data['resource_metadata'],
+                               'source': data['source'],
+                               },
+                      }
+            if meters:
+                update['$addToSet'] = {'meter': self._add_to_set(meters)}
+            if min_max:
+                update['$min'] = {'first_sample_timestamp': first}
+                update['$max'] = {'last_sample_timestamp': last}
+            self.db.resource.update({'_id': resource_id}, update,
+                                    upsert=True)
+            if not min_max:
+                self._extend_sample_range(resource_id, first, last)
+            for m in meters:
+                self._known_keys.add(('meter', resource_id,
+                                      m['counter_name'],
+                                      m['counter_type'],
+                                      m['counter_unit']))
+
+    def _extend_sample_range(self, resource_id, first, last):
+        """Extend the range of sample timestamps of the resource to
+        `first` and `last`, for the servers without the $min and $max
+        update operators.
+
+        The updates are conditioned on the stored values, so
+        concurrent writers cannot overwrite a wider range. The bounds
+        this connection already wrote are not written again.
+        """
+        for field, operator, value in [
+                ('first_sample_timestamp', '$gt', first),
+                ('last_sample_timestamp', '$lt', last),
+        ]:
+            key = (field, resource_id, value)
+            if key in self._known_keys:
+                continue
+            self.db.resource.update(
+                {'_id': resource_id,
+                 '$or': [{field: {'$exists': False}},
+                         {field: {operator: value}},
+                         ],
+                 },
+                {'$set': {field: value}},
+            )
+            self._known_keys.add(key)
 
     def get_users(self, source=None):
         """Return an iterable of user id strings.
@@ -338,7 +1071,8 @@ class Connection(base.Connection):
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, end_timestamp=None,
-                      metaquery={}, resource=None):
+                      metaquery={}, resource=None, limit=None, marker=None,
+                      fields=None):
         """Return an iterable of dictionaries containing resource information.
 
         { 'resource_id': UUID of the resource,
@@ -356,7 +1090,12 @@ class Connection(base.Connection):
         :param end_timestamp: Optional modified timestamp end range.
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
+        :param limit: Optional maximum number of resources to return.
+        :param marker: Optional ID of the last resource already seen.
+        :param fields: Optional list of the keys to return. The
+                       resource_id is always returned.
         """
+        self._flush_pending_resources()
         q = {}
         if user is not None:
             q['user_id'] = user
@@ -367,23 +1106,23 @@ class Connection(base.Connection):
         if resource is not None:
             q['_id'] = resource
         q.update(metaquery)
+        self._record_metaquery('resource', q)
 
-        # FIXME(dhellmann): This may not perform very well,
-        # but doing any better will require changing the database
-        # schema and that will need more thought than I have time
-        # to put into it today.
         if start_timestamp or end_timestamp:
-            # Look for resources matching the above criteria and with
-            # events in the time range we care about, then change the
-            # resource query to return just those resources by id.
-            ts_range = make_timestamp_range(start_timestamp, end_timestamp)
-            if ts_range:
-                q['timestamp'] = ts_range
-            resource_ids = self.db.meter.find(q).distinct('resource_id')
+            resource_ids = self._find_resources_in_range(q, start_timestamp,
+                                                         end_timestamp)
             # Overwrite the query to just filter on the ids
             # we have discovered to be interesting.
             q = {'_id': {'$in': resource_ids}}
-        for resource in self.db.resource.find(q):
+        if marker is not None:
+            _add_id_bound(q, '$gt', marker)
+        resources = self.db.resource.find(
+            q, fields=_make_projection(fields, {'resource_id': '_id'}))
+        if limit or marker is not None:
+            resources = resources.sort('_id', pymongo.ASCENDING)
+        if limit:
+            resources = resources.limit(limit)
+        for resource in resources:
             r = {}
             r.update(resource)
             # Replace the '_id' key with 'resource_id' to meet the
@@ -392,8 +1131,42 @@ class Connection(base.Connection):
             del r['_id']
             yield r
 
+    def _find_resources_in_range(self, q, start, end):
+        """Return the ids of the resources matching the query `q`
+        which have samples between `start` and `end`.
+
+        The resources whose range of sample timestamps overlaps the
+        requested one are selected through their index. Those whose
+        first or last sample falls in the requested range match
+        without reading their samples, which are only looked up for
+        the resources reporting both before and after it.
+        """
+        q = dict(q)
+        if start:
+            q['last_sample_timestamp'] = {'$gte': start}
+        if end:
+            q['first_sample_timestamp'] = {'$lt': end}
+        resource_ids = []
+        spanning = []
+        for r in self.db.resource.find(q, fields=['first_sample_timestamp',
+                                                  'last_sample_timestamp']):
+            if (not start or not end
+                    or r['first_sample_timestamp'] >= start
+                    or r['last_sample_timestamp'] < end):
+                resource_ids.append(r['_id'])
+            else:
+                spanning.append(r['_id'])
+        ts_range = make_timestamp_range(start, end)
+        for i in range(0, len(spanning), self.SAMPLE_LOOKUP_BATCH_SIZE):
+            batch = spanning[i:i + self.SAMPLE_LOOKUP_BATCH_SIZE]
+            resource_ids.extend(self.db.meter.find({
+                'resource_id': {'$in': batch},
+                'timestamp': ts_range,
+            }).distinct('resource_id'))
+        return resource_ids
+
     def get_meters(self, user=None, project=None, resource=None, source=None,
-                   metaquery={}):
+                   metaquery={}, limit=None, marker=None):
         """Return an iterable of dictionaries containing meter information.
 
         { 'name': name of the meter,
@@ -409,7 +1182,10 @@ class Connection(base.Connection):
         :param resource: Optional resource filter.
         :param source: Optional source filter.
         :param metaquery: Optional dict with metadata to match on.
+        :param limit: Optional maximum number of meters to return.
+        :param marker: Optional key of the last meter already seen.
         """
+        self._flush_pending_resources()
         q = {}
         if user is not None:
             q['user_id'] = user
@@ -420,33 +1196,78 @@ class Connection(base.Connection):
         if source is not None:
             q['source'] = source
         q.update(metaquery)
+        self._record_metaquery('resource', q)
+
+        if not (limit or marker is not None):
+            for r in self.db.resource.find(q):
+                for r_meter in r['meter']:
+                    yield self._make_meter(r, r_meter)
+            return
+
+        # The meters are embedded in the resources, so paginate on the
+        # resources sorted by id and sort the meters of each resource
+        # here. The pages do not need to hold the meters of whole
+        # resources.
+        if marker is not None:
+            _add_id_bound(q, '$gte', marker[0])
+            marker_key = tuple(v or '' for v in marker[1:])
+        count = 0
+        for r in self.db.resource.find(q).sort('_id', pymongo.ASCENDING):
+            r_meters = sorted(r['meter'], key=self._meter_sort_key)
+            for r_meter in r_meters:
+                if (marker is not None and r['_id'] == marker[0]
+                        and self._meter_sort_key(r_meter) <= marker_key):
+                    continue
+                yield self._make_meter(r, r_meter)
+                count += 1
+                if count == limit:
+                    return
+
+    @staticmethod
+    def _meter_sort_key(r_meter):
+        return (r_meter['counter_name'] or '',
+                r_meter['counter_type'] or '',
+                r_meter['counter_unit'] or '')
+
+    @staticmethod
+    def _make_meter(r, r_meter):
+        return {'name': r_meter['counter_name'],
+                'type': r_meter['counter_type'],
+                'unit': r_meter['counter_unit'],
+                'resource_id': r['_id'],
+                'project_id': r['project_id'],
+                'user_id': r['user_id'],
+                }
 
-        for r in self.db.resource.find(q):
-            for r_meter in r['meter']:
-                m = {}
-                m['name'] = r_meter['counter_name']
-                m['type'] = r_meter['counter_type']
-                m['unit'] = r_meter['counter_unit']
-                m['resource_id'] = r['_id']
-                m['project_id'] = r['project_id']
-                m['user_id'] = r['user_id']
-                yield m
-
-    def get_raw_events(self, event_filter):
+    def get_raw_events(self, event_filter, fields=None):
         """Return an iterable of raw event data as created by
         :func:`ceilometer.meter.meter_message_from_counter`.
+
+        :param event_filter: EventFilter instance
+        :param fields: Optional list of the keys to return, only
+                       these fields are read from the database.
         """
-        q = make_query_from_filter(event_filter, require_meter=False)
-        events = self.db.meter.find(q)
+        q = self._make_query(event_filter, require_meter=False)
+        if event_filter.marker:
+            ts, message_id = event_filter.marker
+            q['$or'] = [{'timestamp': {'$gt': ts}},
+                        {'timestamp': ts, 'message_id': {'$gt': message_id}},
+                        ]
+        events = self.db.meter.find(q, fields=_make_projection(fields))
+        if event_filter.limit or event_filter.marker:
+            events = events.sort([('timestamp', pymongo.ASCENDING),
+                                  ('message_id', pymongo.ASCENDING)])
+        if event_filter.limit:
+            events = events.limit(event_filter.limit)
         for e in events:
             # Remove the ObjectId generated by the database when
             # the event was inserted. It is an implementation
             # detail that should not leak outside of the driver.
-            del e['_id']
+            e.pop('_id', None)
             yield e
 
-    def get_meter_statistics(self, event_filter):
-        """Return a dictionary containing meter statistics.
+    def get_meter_statistics(self, event_filter, period=None):
+        """Return a list of dictionaries containing meter statistics
         described by the query parameters.
 
         The filter must have a meter value set.
@@ -459,67 +1280,118 @@ class Connection(base.Connection):
           'duration':
           'duration_start':
           'duration_end':
+          'period':
+          'period_start':
+          'period_end':
           }
 
         """
-        q = make_query_from_filter(event_filter)
-        results = self.db.meter.map_reduce(self.MAP_STATS,
-                                           self.REDUCE_STATS,
-                                           {'inline': 1},
-                                           query=q,
-                                           )
-        if results['results']:
-            r = results['results'][0]['value']
+        if not period and self._use_rollups(event_filter):
+            return self._get_rollup_statistics(event_filter)
+
+        q = self._make_query(event_filter)
+        if period:
+            origin = base.get_period_origin(event_filter)
+            period_ms = period * 1000
+        if self._use_aggregate(period):
+            group = self.GROUP_STATS
+            if period:
+                # Milliseconds between the origin and the start of
+                # the period holding the event.
+                offset = {'$subtract': ['$timestamp', origin]}
+                group = dict(group,
+                             _id={'$subtract': [offset,
+                                                {'$mod': [offset,
+                                                          period_ms]}]})
+            results = [(r['_id'], r) for r in self._aggregate(q, group)]
+        elif period:
+            scope = {'origin': utils.dt_to_epoch(origin) * 1000,
+                     'period': period_ms}
+            results = [(r['_id'], r['value']) for r in
+                       self._map_reduce(q, self.MAP_STATS_PERIOD,
+                                        self.REDUCE_STATS,
+                                        scope=scope)]
+        else:
+            results = [(r['_id'], r['value']) for r in
+                       self._map_reduce(q, self.MAP_STATS, self.REDUCE_STATS)]
+
+        if not (results or period):
+            return [{'min': None,
+                     'sum': None,
+                     'count': 0,
+                     'avg': None,
+                     'max': None,
+                     'duration': None,
+                     'duration_start': None,
+                     'duration_end': None,
+                     'period': 0,
+                     'period_start': event_filter.start,
+                     'period_end': event_filter.end,
+                     }]
+
+        stats = []
+        for key, r in sorted(results, key=lambda result: result[0]):
             (start, end) = self._fix_interval_min_max(r['timestamp_min'],
                                                       r['timestamp_max'])
-        else:
-            start = None
-            end = None
-            r = {'count': 0,
-                 'min': None,
-                 'max': None,
-                 'avg': None,
-                 'qty': None,
-                 'duration': None,
-                 'duration_start': None,
-                 'duration_end': None,
-                 }
-        count = int(r['count'])
-        return {'min': r['min'],
-                'sum': r['qty'],
-                'count': count,
-                'avg': (r['qty'] / count) if count > 0 else None,
-                'max': r['max'],
-                'duration': 0,
-                'duration_start': start,
-                'duration_end': end,
-                }
+            if period:
+                period_start = origin + datetime.timedelta(
+                    milliseconds=int(key))
+                period_end = period_start + datetime.timedelta(
+                    seconds=period)
+            else:
+                period_start = event_filter.start or start
+                period_end = event_filter.end or end
+            count = int(r['count'])
+            stats.append({'min': r['min'],
+                          'sum': r['qty'],
+                          'count': count,
+                          'avg': (float(r['qty']) / count
+                                  if count > 0 else None),
+                          'max': r['max'],
+                          'duration': 0,
+                          'duration_start': start,
+                          'duration_end': end,
+                          'period': period or 0,
+                          'period_start': period_start,
+                          'period_end': period_end,
+                          })
+        return stats
 
     def get_volume_sum(self, event_filter):
         """Return the sum of the volume field for the events
         described by the query parameters.
         """
-        q = make_query_from_filter(event_filter)
-        results = self.db.meter.map_reduce(self.MAP_COUNTER_VOLUME,
-                                           self.REDUCE_SUM,
-                                           {'inline': 1},
-                                           query=q,
-                                           )
+        if self._use_rollups(event_filter):
+            summaries = self._summarize_by_resource(event_filter)
+            return ({'resource_id': resource_id, 'value': summary['sum']}
+                    for resource_id, summary in summaries.iteritems())
+
+        q = self._make_query(event_filter)
+        if self._use_aggregate():
+            results = self._aggregate(q, self.GROUP_COUNTER_VOLUME_SUM)
+        else:
+            results = self._map_reduce(q, self.MAP_COUNTER_VOLUME,
+                                       self.REDUCE_SUM)
         return ({'resource_id': r['_id'], 'value': r['value']}
-                for r in results['results'])
+                for r in results)
 
     def get_volume_max(self, event_filter):
         """Return the maximum of the volume field for the events
         described by the query parameters.
         """
-        q = make_query_from_filter(event_filter)
-        results = self.db.meter.map_reduce(self.MAP_COUNTER_VOLUME,
-                                           self.REDUCE_MAX,
-                                           {'inline': 1},
-                                           query=q,
-                                           )
+        if self._use_rollups(event_filter):
+            summaries = self._summarize_by_resource(event_filter)
+            return ({'resource_id': resource_id, 'value': summary['max']}
+                    for resource_id, summary in summaries.iteritems())
+
+        q = self._make_query(event_filter)
+        if self._use_aggregate():
+            results = self._aggregate(q, self.GROUP_COUNTER_VOLUME_MAX)
+        else:
+            results = self._map_reduce(q, self.MAP_COUNTER_VOLUME,
+                                       self.REDUCE_MAX)
         return ({'resource_id': r['_id'], 'value': r['value']}
-                for r in results['results'])
+                for r in results)
 
     def _fix_interval_min_max(self, a_min, a_max):
         if hasattr(a_min, 'valueOf') and a_min.valueOf is not None:
@@ -555,13 +1427,14 @@ class Connection(base.Connection):
 
         ( datetime.datetime(), datetime.datetime() )
         """
-        q = make_query_from_filter(event_filter)
-        results = self.db.meter.map_reduce(self.MAP_TIMESTAMP,
-                                           self.REDUCE_MIN_MAX,
-                                           {'inline': 1},
-                                           query=q,
-                                           )
-        if results['results']:
-            answer = results['results'][0]['value']
+        q = self._make_query(event_filter)
+        if self._use_aggregate():
+            results = self._aggregate(q, self.GROUP_TIMESTAMP)
+        else:
+            results = [r['value'] for r in
+                       self._map_reduce(q, self.MAP_TIMESTAMP,
+                                        self.REDUCE_MIN_MAX)]
+        if results:
+            answer = results[0]
             return self._fix_interval_min_max(answer['min'], answer['max'])
         return (None, None)
@@ -16,19 +16,95 @@
 """SQLAlchemy storage backend
 """
 
+from __future__ import absolute_import
+
 import copy
 import datetime
+import operator
+
+from sqlalchemy import and_, bindparam, case, cast, extract, Integer
+from sqlalchemy import DateTime, exc, exists, Float, literal_column
+from sqlalchemy import MetaData, not_, or_, select, union_all
+from sqlalchemy.orm import aliased, scoped_session
 
+from ceilometer.openstack.common import cfg
 from ceilometer.openstack.common import log
+from ceilometer.openstack.common import timeutils
 from ceilometer.storage import base
-from ceilometer.storage.sqlalchemy.models import Meter, Project, Resource
+from ceilometer.storage.sqlalchemy.models import make_partition_table
+from ceilometer.storage.sqlalchemy.models import Meter, MeterPartition
+from ceilometer.storage.sqlalchemy.models import MetaBool, MetaFloat
+from ceilometer.storage.sqlalchemy.models import MetaInt, MetaText
+from ceilometer.storage.sqlalchemy.models import MeterRollup
+from ceilometer.storage.sqlalchemy.models import MeterRollupStart
+from ceilometer.storage.sqlalchemy.models import Project, Resource
 from ceilometer.storage.sqlalchemy.models import Source, User
+from ceilometer.storage.sqlalchemy.models import sourceassoc
 from ceilometer.storage.sqlalchemy.session import func
 import ceilometer.storage.sqlalchemy.session as sqlalchemy_session
 from ceilometer.storage.sqlalchemy import migration
+from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+# Number of rows fetched from the database at a time when streaming
+# query results.
+STREAM_BATCH_SIZE = 1000
+
+# Number of expired samples deleted by each transaction.
+EXPIRE_BATCH_SIZE = 1000
+
+# Number of samples moved to a partition by each transaction.
+PARTITION_BATCH_SIZE = 1000
+
+SQL_OPTS = [
+    cfg.IntOpt('sql_key_cache_size',
+               default=10000,
+               help='number of source, user, project and resource keys '
+               'remembered as already stored, to skip looking them up '
+               '(0 disables)',
+               ),
+    cfg.IntOpt('sql_key_cache_ttl',
+               default=600,
+               help='seconds after which a remembered key is looked up again',
+               ),
+    cfg.StrOpt('sql_partition_period',
+               default=None,
+               help='move the samples of each completed day or month '
+               '(\'day\' or \'month\') to a table of their own with '
+               'ceilometer-partition, and read only the tables a query '
+               'needs; must stay set while partitions exist',
+               ),
+]
+
+cfg.CONF.register_opts(SQL_OPTS)
+
+# Columns identifying a rollup row, in the order of the keys returned
+# by base.make_rollup_deltas().
+ROLLUP_KEY = ('period', 'bucket', 'counter_name', 'resource_id',
+              'project_id')
+
+# Models holding the flattened metadata values of each type. Longer
+# strings and the values of other types are not indexed.
+META_TYPE_MAP = {bool: MetaBool,
+                 str: MetaText,
+                 unicode: MetaText,
+                 int: MetaInt,
+                 long: MetaInt,
+                 float: MetaFloat,
+                 }
+META_MAX_LENGTH = 255
+
+# Resource attributes holding the keys of the resource dictionaries
+# read from the resource table.
+RESOURCE_COLUMNS = {'project_id': 'project_id',
+                    'user_id': 'user_id',
+                    'timestamp': 'timestamp',
+                    'first_sample_timestamp': 'first_sample_timestamp',
+                    'last_sample_timestamp': 'last_sample_timestamp',
+                    'metadata': 'resource_metadata',
+                    }
+
 
 class SQLAlchemyStorage(base.StorageEngine):
     """Put the data into a SQLAlchemy database
@@ -62,6 +138,8 @@ class SQLAlchemyStorage(base.StorageEngine):
               resource_metadata: metadata dictionaries
               received_timestamp: received datetime
               timestamp: datetime
+              first_sample_timestamp: datetime of the first sample
+              last_sample_timestamp: datetime of the last sample
               project_id: project uuid      (->project.id)
               user_id: user uuid            (->user.id)
               }
@@ -73,6 +151,45 @@ class SQLAlchemyStorage(base.StorageEngine):
               user_id: user uuid            (->user.id)
               source_id: source id          (->source.id)
               }
+        - meter_rollup
+          - the hourly and daily aggregates, when enabled
+          - { id: rollup id
+              counter_name: counter name
+              period: length of the bucket in seconds
+              bucket: datetime of the start of the bucket
+              resource_id: resource uuid
+              project_id: project uuid
+              sample_count: number of samples
+              volume_sum: sum of the counter volumes
+              volume_min: minimum counter volume
+              volume_max: maximum counter volume
+              first_timestamp: datetime of the first sample
+              last_timestamp: datetime of the last sample
+              }
+        - meter_rollup_start
+          - the time from which the rollups hold every sample
+          - { id: 1
+              timestamp: start of the hour after the rollups were
+                         first updated
+              }
+        - meter_partition
+          - the partitions of the meter table, when enabled
+          - { name: name of the table holding the samples
+              start_timestamp: datetime of the start of the partition
+              end_timestamp: datetime of the end of the partition
+              }
+        - metadata_text, metadata_int, metadata_float, metadata_bool
+          - the flattened metadata of the samples, by type of value
+          - { id: meter id
+              meta_key: metadata key, nested keys joined by dots
+              value: metadata value
+              }
+        - meter_pYYYYMM or meter_pYYYYMMDD
+          - the samples of a completed month or day, moved out of the
+            meter table by ceilometer-partition
+          - { the columns of meter
+              source_id: source id
+              }
     """
 
     OPTIONS = []
@@ -88,20 +205,48 @@ class SQLAlchemyStorage(base.StorageEngine):
         return Connection(conf)
 
 
-def make_query_from_filter(query, event_filter, require_meter=True):
+def get_partition_range(timestamp, period):
+    """Return the name of the meter partition holding the samples of
+    `timestamp`, and the start and end of its time range.
+
+    :param timestamp: datetime of a sample
+    :param period: 'day' or 'month'
+    """
+    if period == 'day':
+        start = datetime.datetime(timestamp.year, timestamp.month,
+                                  timestamp.day)
+        end = start + datetime.timedelta(days=1)
+        return start.strftime('meter_p%Y%m%d'), start, end
+    if period == 'month':
+        start = datetime.datetime(timestamp.year, timestamp.month, 1)
+        end = (start + datetime.timedelta(days=31)).replace(day=1)
+        return start.strftime('meter_p%Y%m'), start, end
+    raise ValueError('invalid partition period %r' % period)
+
+
+def make_query_from_filter(query, event_filter, require_meter=True,
+                           meters=None):
     """Return a query dictionary based on the settings in the filter.
 
     :param filter: EventFilter instance
     :param require_meter: If true and the filter does not have a meter,
                           raise an error.
+    :param meters: Optional selectable read instead of the meter table,
+                   as returned by Connection._get_meter_union().
     """
 
+    if meters is not None:
+        # The Meter columns of the query are read from the selectable.
+        query = query.select_from(meters)
     if event_filter.meter:
         query = query.filter(Meter.counter_name == event_filter.meter)
     elif require_meter:
         raise RuntimeError('Missing required meter specifier')
     if event_filter.source:
-        query = query.filter(Meter.sources.any(id=event_filter.source))
+        if meters is not None:
+            query = query.filter(meters.c.source_id == event_filter.source)
+        else:
+            query = query.filter(Meter.sources.any(id=event_filter.source))
     if event_filter.start:
         ts_start = event_filter.start
         query = query.filter(Meter.timestamp >= ts_start)
@@ -114,10 +259,34 @@ def make_query_from_filter(query, event_filter, require_meter=True):
         query = query.filter_by(project_id=event_filter.project)
     if event_filter.resource:
         query = query.filter_by(resource_id=event_filter.resource)
+    if event_filter.metaquery:
+        query = apply_metaquery(query, Meter.id, event_filter.metaquery)
 
-    if event_filter.metaquery is not None and len(event_filter.metaquery) > 0:
-        raise NotImplementedError('metaquery not implemented')
+    return query
 
+
+def apply_metaquery(query, meter_id, metaquery):
+    """Join the metadata tables to the query, keeping the samples
+    whose metadata holds all of the values of the metaquery.
+
+    Each key is matched through the index on the key and value of the
+    table of the type of its value.
+
+    :param meter_id: the column holding the ids of the samples
+    :param metaquery: dict mapping 'metadata.' followed by the
+                      flattened metadata keys to the values to match
+    """
+    for key, value in sorted(metaquery.iteritems()):
+        model = META_TYPE_MAP.get(type(value))
+        if model is None:
+            raise NotImplementedError('metaquery on %s values not implemented'
+                                      % type(value).__name__)
+        if key.startswith('metadata.'):
+            key = key[len('metadata.'):]
+        meta = aliased(model)
+        query = query.join(meta, and_(meta.id == meter_id,
+                                      meta.meta_key == key,
+                                      meta.value == value))
     return query
 
 
@@ -128,15 +297,39 @@ class Connection(base.Connection):
     def __init__(self, conf):
         LOG.info('connecting to %s', conf.database_connection)
         self.session = self._get_connection(conf)
+        # Keys of the rows already known to be stored.
+        self._known_keys = utils.LRUCache(cfg.CONF.sql_key_cache_size,
+                                          cfg.CONF.sql_key_cache_ttl)
+        self._rollups_enabled = cfg.CONF.enable_rollups
         return
 
     def upgrade(self, version=None):
         migration.db_sync(self.session.get_bind(), version=version)
 
+    def is_alive(self):
+        """Return False if the database server cannot be reached.
+        """
+        try:
+            self.session.execute(select([literal_column('1')]))
+        except exc.DBAPIError as err:
+            LOG.warning('SQL connection check failed: %s', err)
+            return False
+        return True
+
+    def close_session(self):
+        """Close the session of the calling thread and return its
+        database connection to the pool.
+        """
+        self.session.remove()
+
     def _get_connection(self, conf):
         """Return a connection to the database.
+
+        Each thread (or greenthread, when eventlet has patched the
+        threading module) uses its own session, so the connection can
+        be shared by concurrent API requests.
         """
-        return sqlalchemy_session.get_session()
+        return scoped_session(sqlalchemy_session.get_session)
 
     def record_metering_data(self, data):
         """Write the data to the backend storage system.
@@ -144,61 +337,496 @@ class Connection(base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
-        if data['source']:
-            source = self.session.query(Source).get(data['source'])
-            if not source:
-                source = Source(id=data['source'])
-                self.session.add(source)
-        else:
-            source = None
+        self.record_metering_data_batch([data])
 
-        # create/update user && project, add/update their sources list
-        if data['user_id']:
-            user = self.session.merge(User(id=str(data['user_id'])))
-            if not filter(lambda x: x.id == source.id, user.sources):
-                user.sources.append(source)
-        else:
-            user = None
+    def record_metering_data_batch(self, samples):
+        """Write a list of samples to the backend storage system.
+
+        The samples are written in a single transaction with Core
+        statements: the meter and sourceassoc rows are inserted with
+        executemany, and sources, users, projects and resources are
+        only looked up when they are not already known to exist.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        # The last sample of the batch wins for the resource details,
+        # and the range of the timestamps of its samples is kept.
+        resources = {}
+        for data in samples:
+            if data['resource_id']:
+                rid = _to_id(data['resource_id'])
+                timestamp = data['timestamp']
+                last, first_ts, last_ts = resources.get(
+                    rid, (None, timestamp, timestamp))
+                resources[rid] = (data, min(first_ts, timestamp),
+                                  max(last_ts, timestamp))
+
+        if self._rollups_enabled:
+            self._ensure_rollups_start()
+        # Keys stored by this batch, only remembered once it has been
+        # committed.
+        new_keys = []
+        with self.session.begin():
+            self._ensure_ids(Source.__table__,
+                             set(d['source'] for d in samples),
+                             new_keys)
+            self._ensure_ids(User.__table__,
+                             set(_to_id(d['user_id']) for d in samples),
+                             new_keys)
+            self._ensure_ids(Project.__table__,
+                             set(_to_id(d['project_id']) for d in samples),
+                             new_keys)
+            self._upsert_resources(resources, new_keys)
+            for column in ('user_id', 'project_id', 'resource_id'):
+                self._ensure_sources(column,
+                                     set((_to_id(d[column]), d['source'])
+                                         for d in samples),
+                                     new_keys)
+            self._insert_meters(samples)
+            if self._rollups_enabled:
+                self._update_rollups(samples)
+        for key in new_keys:
+            self._known_keys.add(key)
+
+    def _ensure_ids(self, table, ids, new_keys):
+        """Insert the rows of `table` missing for the ids.
+
+        :param table: the source, user or project table
+        :param ids: set of ids, empty ones are ignored
+        :param new_keys: list collecting the keys to remember
+        """
+        name = table.name
+        ids = set(i for i in ids if i and (name, i) not in self._known_keys)
+        if ids:
+            existing = self.session.execute(
+                select([table.c.id], table.c.id.in_(ids)))
+            missing = ids - set(row[0] for row in existing)
+            if missing:
+                self.session.execute(table.insert(),
+                                     [{'id': i} for i in missing])
+            new_keys.extend((name, i) for i in ids)
+
+    def _ensure_sources(self, column, pairs, new_keys):
+        """Insert the sourceassoc rows missing to link the users,
+        projects or resources to their sources.
+
+        :param column: the sourceassoc column holding the ids
+        :param pairs: set of (id, source id) tuples
+        :param new_keys: list collecting the keys to remember
+        """
+        pairs = set((i, source) for i, source in pairs
+                    if i and source and
+                    (column, i, source) not in self._known_keys)
+        if not pairs:
+            return
+        id_column = sourceassoc.c[column]
+        existing = self.session.execute(
+            select([id_column, sourceassoc.c.source_id],
+                   id_column.in_(set(i for i, source in pairs))))
+        missing = pairs - set((row[0], row[1]) for row in existing)
+        if missing:
+            self.session.execute(sourceassoc.insert(),
+                                 [{column: i, 'source_id': source}
+                                  for i, source in missing])
+        new_keys.extend((column, i, source) for i, source in pairs)
+
+    def _upsert_resources(self, resources, new_keys):
+        """Insert or update the resources with the details of their
+        most recent sample, and extend the range of their sample
+        timestamps.
 
-        if data['project_id']:
-            project = self.session.merge(Project(id=str(data['project_id'])))
-            if not filter(lambda x: x.id == source.id, project.sources):
-                project.sources.append(source)
+        :param resources: dictionary mapping resource ids to a tuple
+                          (most recent sample, first sample timestamp,
+                          last sample timestamp)
+        :param new_keys: list collecting the keys to remember
+        """
+        if not resources:
+            return
+        table = Resource.__table__
+        now = datetime.datetime.utcnow()
+        values = dict((rid, {'id': rid,
+                             'project_id': _to_id(data['project_id']),
+                             'user_id': _to_id(data['user_id']),
+                             'timestamp': data['timestamp'],
+                             'received_timestamp': now,
+                             'resource_metadata':
+                             data['resource_metadata'],
+                             })
+                      for rid, (data, first, last) in resources.iteritems())
+        unknown = set(rid for rid in values
+                      if ('resource', rid) not in self._known_keys)
+        if unknown:
+            existing = self.session.execute(
+                select([table.c.id], table.c.id.in_(unknown)))
+            missing = unknown - set(row[0] for row in existing)
+            if missing:
+                self.session.execute(table.insert(), [
+                    dict(values[rid],
+                         first_sample_timestamp=resources[rid][1],
+                         last_sample_timestamp=resources[rid][2])
+                    for rid in missing])
         else:
-            project = None
-
-        # Record the updated resource metadata
-        rtimestamp = datetime.datetime.utcnow()
-        rmetadata = data['resource_metadata']
-
-        resource = self.session.merge(Resource(id=str(data['resource_id'])))
-        if not filter(lambda x: x.id == source.id, resource.sources):
-            resource.sources.append(source)
-        resource.project = project
-        resource.user = user
-        resource.timestamp = data['timestamp']
-        resource.received_timestamp = rtimestamp
-        # Current metadata being used and when it was last updated.
-        resource.resource_metadata = rmetadata
-        # autoflush didn't catch this one, requires manual flush
-        self.session.flush()
-
-        # Record the raw data for the event.
-        meter = Meter(counter_type=data['counter_type'],
-                      counter_unit=data['counter_unit'],
-                      counter_name=data['counter_name'], resource=resource)
-        self.session.add(meter)
-        if not filter(lambda x: x.id == source.id, meter.sources):
-            meter.sources.append(source)
-        meter.project = project
-        meter.user = user
-        meter.timestamp = data['timestamp']
-        meter.resource_metadata = rmetadata
-        meter.counter_volume = data['counter_volume']
-        meter.message_signature = data['message_signature']
-        meter.message_id = data['message_id']
+            missing = set()
+        updates = [dict(v, rid=rid, first=resources[rid][1],
+                        last=resources[rid][2])
+                   for rid, v in values.iteritems()
+                   if rid not in missing]
+        if updates:
+            update = table.update().where(
+                table.c.id == bindparam('rid')).values(
+                    first_sample_timestamp=_best(
+                        table.c.first_sample_timestamp, operator.gt,
+                        'first', DateTime),
+                    last_sample_timestamp=_best(
+                        table.c.last_sample_timestamp, operator.lt,
+                        'last', DateTime))
+            result = self.session.execute(update, updates)
+            if 0 <= result.rowcount < len(updates):
+                # Some of the remembered resources no longer exist.
+                for v in updates:
+                    self._known_keys.discard(('resource', v['rid']))
+                return self._upsert_resources(resources, new_keys)
+        new_keys.extend(('resource', rid) for rid in values)
 
-        return
+    def _insert_meters(self, samples):
+        """Insert the meter rows for the samples, link them to their
+        source and index their metadata.
+
+        :param samples: list of samples
+        """
+        table = Meter.__table__
+        last_id = self.session.execute(
+            select([func.max(table.c.id)])).scalar() or 0
+        try:
+            with self.session.begin_nested():
+                meter_ids = self._insert_meter_rows(samples, last_id)
+        except _AmbiguousMeterIds:
+            LOG.debug('meter ids of %d samples ambiguous, inserting the '
+                      'rows one at a time', len(samples))
+            meter_ids = [self.session.execute(table.insert(),
+                                              _meter_row(data))
+                         .inserted_primary_key[0]
+                         for data in samples]
+        assoc = []
+        metadata = {}
+        for meter_id, data in zip(meter_ids, samples):
+            if data['source']:
+                assoc.append({'meter_id': meter_id,
+                              'source_id': data['source']})
+            for model, key, value in _flatten_metadata(
+                    data['resource_metadata']):
+                metadata.setdefault(model, []).append(
+                    {'id': meter_id, 'meta_key': key, 'value': value})
+        if assoc:
+            self.session.execute(sourceassoc.insert(), assoc)
+        for model, rows in metadata.iteritems():
+            self.session.execute(model.__table__.insert(), rows)
+
+    def _insert_meter_rows(self, samples, last_id):
+        """Insert the meter rows for the samples in one statement and
+        return their ids, in the order of the samples.
+
+        executemany() does not report the generated ids, so they are
+        found back from the message ids of the rows after `last_id`.
+        That fails with _AmbiguousMeterIds when other rows of the same
+        messages are visible, stored by another writer from a message
+        delivered more than once.
+        """
+        table = Meter.__table__
+        self.session.execute(table.insert(),
+                             [_meter_row(data) for data in samples])
+        inserted = {}
+        for meter_id, message_id in self.session.execute(
+                select([table.c.id, table.c.message_id],
+                       and_(table.c.id > last_id,
+                            table.c.message_id.in_(
+                                set(d['message_id'] for d in samples))))
+                .order_by(table.c.id)):
+            inserted.setdefault(message_id, []).append(meter_id)
+        expected = {}
+        for data in samples:
+            expected[data['message_id']] = expected.get(
+                data['message_id'], 0) + 1
+        for message_id, count in expected.iteritems():
+            if len(inserted.get(message_id, [])) != count:
+                raise _AmbiguousMeterIds(message_id)
+        return [inserted[data['message_id']].pop(0) for data in samples]
+
+    def clear_expired_metering_data(self, ttl):
+        """Clear expired data from the backend storage system according
+        to the time-to-live.
+
+        The partitions entirely older than the limit are dropped.
+        The other samples are deleted EXPIRE_BATCH_SIZE at a time,
+        found through the index on their timestamp, so each
+        transaction stays short. The resources left without samples
+        and their links to sources are deleted afterwards.
+
+        :param ttl: Number of seconds to keep the samples.
+        """
+        end = timeutils.utcnow() - datetime.timedelta(seconds=ttl)
+        partitions = []
+        for partition in self._get_partitions():
+            table = self._get_partition_table(partition.name)
+            if partition.end_timestamp <= end:
+                with self.session.begin():
+                    self._delete_metadata(select([table.c.id]))
+                    self.session.delete(partition)
+                table.drop(self.session.get_bind())
+                LOG.debug('dropped expired partition %s', partition.name)
+                continue
+            if partition.start_timestamp < end:
+                with self.session.begin():
+                    self._delete_metadata(
+                        select([table.c.id], table.c.timestamp < end))
+                    self.session.execute(
+                        table.delete().where(table.c.timestamp < end))
+            partitions.append(table)
+
+        meter = Meter.__table__
+        count = self._delete_in_batches(
+            select([meter.c.id], meter.c.timestamp < end),
+            [(sourceassoc, sourceassoc.c.meter_id)] +
+            [(m.__table__, m.__table__.c.id) for m in _meta_models()] +
+            [(meter, meter.c.id)])
+        LOG.debug('deleted %d expired samples', count)
+
+        # The resources whose last sample is older than the limit may
+        # have no samples left.
+        resource = Resource.__table__
+        orphan = and_(*[not_(exists().where(t.c.resource_id == resource.c.id))
+                        for t in [meter] + partitions])
+        count = self._delete_in_batches(
+            select([resource.c.id], and_(resource.c.timestamp < end, orphan)),
+            [(sourceassoc, sourceassoc.c.resource_id),
+             (resource, resource.c.id)])
+        LOG.debug('deleted %d resources without samples', count)
+        # The remaining resources have no sample before the limit.
+        self.session.execute(resource.update().where(
+            resource.c.first_sample_timestamp < end).values(
+                first_sample_timestamp=end))
+        self._known_keys.clear()
+
+    def _delete_metadata(self, ids):
+        """Delete the metadata of the samples whose ids are returned
+        by the select statement `ids`.
+        """
+        for model in _meta_models():
+            table = model.__table__
+            self.session.execute(table.delete().where(table.c.id.in_(ids)))
+
+    def _delete_in_batches(self, query, targets):
+        """Delete the rows matching the ids returned by `query`,
+        EXPIRE_BATCH_SIZE ids per transaction, and return the number
+        of ids found.
+
+        :param query: select statement returning the ids to delete
+        :param targets: list of (table, column) tuples, the rows of
+                        the table are deleted when the column holds one
+                        of the ids
+        """
+        query = query.limit(EXPIRE_BATCH_SIZE)
+        count = 0
+        while True:
+            with self.session.begin():
+                ids = [row[0] for row in self.session.execute(query)]
+                for table, column in targets:
+                    if ids:
+                        self.session.execute(
+                            table.delete().where(column.in_(ids)))
+            count += len(ids)
+            if len(ids) < EXPIRE_BATCH_SIZE:
+                return count
+
+    def _get_partitions(self, start=None, end=None):
+        """Return the MeterPartition rows ordered by time, limited to
+        the ones overlapping the range between `start` and `end`.
+        """
+        query = self.session.query(MeterPartition)
+        if start:
+            query = query.filter(MeterPartition.end_timestamp > start)
+        if end:
+            query = query.filter(MeterPartition.start_timestamp < end)
+        return query.order_by(MeterPartition.start_timestamp).all()
+
+    @staticmethod
+    def _get_partition_table(name):
+        return make_partition_table(name, MetaData())
+
+    def _get_meter_union(self, start=None, end=None):
+        """Return a selectable standing in for the meter table, made
+        of the meter table and the partitions overlapping the range
+        between `start` and `end`, or None when no partition does.
+
+        The time range is repeated in each part of the union, so the
+        database can use the timestamp indexes of each table.
+        """
+        if not cfg.CONF.sql_partition_period:
+            return None
+        partitions = self._get_partitions(start, end)
+        if not partitions:
+            return None
+        meter = Meter.__table__
+        parts = [(_select_with_source(), meter.c.timestamp)]
+        for partition in partitions:
+            table = self._get_partition_table(partition.name)
+            parts.append((select([table]), table.c.timestamp))
+        selects = []
+        for part, timestamp in parts:
+            if start:
+                part = part.where(timestamp >= start)
+            if end:
+                part = part.where(timestamp < end)
+            selects.append(part)
+        return union_all(*selects).alias('meter')
+
+    def rotate_partitions(self):
+        """Move the samples of the completed days or months, according
+        to sql_partition_period, from the meter table to one partition
+        table per period. Return the names of the partitions written.
+
+        The samples are moved PARTITION_BATCH_SIZE at a time, each
+        batch in one transaction, so they are always in exactly one
+        table. Samples received late for a period already moved are
+        added to its partition.
+        """
+        period = cfg.CONF.sql_partition_period
+        current = get_partition_range(timeutils.utcnow(), period)[1]
+        names = []
+        while True:
+            oldest = self.session.query(func.min(Meter.timestamp)).filter(
+                Meter.timestamp < current).scalar()
+            if oldest is None:
+                return names
+            name, start, end = get_partition_range(oldest, period)
+            table = self._create_partition(name, start, end)
+            count = self._move_to_partition(table, start, end)
+            LOG.info('moved %d samples to %s', count, name)
+            names.append(name)
+
+    def _create_partition(self, name, start, end):
+        """Create the partition table `name` and record its range,
+        unless it already exists, and return the table.
+        """
+        table = self._get_partition_table(name)
+        with self.session.begin():
+            if self.session.query(MeterPartition).get(name) is None:
+                table.create(self.session.get_bind(), checkfirst=True)
+                self.session.add(MeterPartition(name=name,
+                                                start_timestamp=start,
+                                                end_timestamp=end))
+        return table
+
+    def _move_to_partition(self, table, start, end):
+        """Move the samples of the meter table between `start` and
+        `end` to the partition `table`, with their source, and return
+        the number of samples moved.
+        """
+        meter = Meter.__table__
+        query = _select_with_source().where(and_(meter.c.timestamp >= start,
+                                                 meter.c.timestamp < end))
+        query = query.limit(PARTITION_BATCH_SIZE)
+        count = 0
+        while True:
+            with self.session.begin():
+                rows = [dict(row.items())
+                        for row in self.session.execute(query)]
+                if rows:
+                    ids = [row['id'] for row in rows]
+                    self.session.execute(table.insert(), rows)
+                    self.session.execute(sourceassoc.delete().where(
+                        sourceassoc.c.meter_id.in_(ids)))
+                    self.session.execute(meter.delete().where(
+                        meter.c.id.in_(ids)))
+            count += len(rows)
+            if len(rows) < PARTITION_BATCH_SIZE:
+                return count
+
+    def _update_rollups(self, samples):
+        """Add the samples to the hourly and daily rollups.
+
+        The missing rollup rows are created first, with
+        _create_rollups(). All of the rows are
+        then updated by a single executemany statement computing the
+        new aggregates in the database, so concurrent writers do not
+        overwrite each other's changes.
+
+        :param samples: list of samples
+        """
+        deltas = base.make_rollup_deltas(samples)
+        if not deltas:
+            return
+        table = MeterRollup.__table__
+        key_columns = [table.c[name] for name in ROLLUP_KEY]
+        existing = self.session.execute(select(key_columns, and_(
+            table.c.counter_name.in_(set(k[2] for k in deltas)),
+            table.c.bucket.in_(set(k[1] for k in deltas)),
+            table.c.resource_id.in_(set(k[3] for k in deltas)))))
+        self._create_rollups(
+            set(deltas) - set(tuple(row) for row in existing))
+
+        update = table.update().where(and_(*[
+            column == bindparam('key_' + column.name)
+            for column in key_columns
+        ])).values(
+            sample_count=table.c.sample_count + bindparam('count'),
+            volume_sum=table.c.volume_sum + bindparam('sum', type_=Float),
+            volume_min=_best(table.c.volume_min, operator.gt, 'min', Float),
+            volume_max=_best(table.c.volume_max, operator.lt, 'max', Float),
+            first_timestamp=_best(table.c.first_timestamp, operator.gt,
+                                  'first', DateTime),
+            last_timestamp=_best(table.c.last_timestamp, operator.lt,
+                                 'last', DateTime),
+        )
+        params = []
+        for key, delta in deltas.iteritems():
+            p = dict(('key_' + name, value)
+                     for name, value in zip(ROLLUP_KEY, key))
+            p.update(delta)
+            params.append(p)
+        self.session.execute(update, params)
+
+    def _read_rollups_start(self):
+        """Return the stored time from which the rollups hold every
+        sample, or None if they have never been maintained.
+        """
+        row = self.session.query(MeterRollupStart.timestamp).first()
+        return row[0] if row else None
+
+    def _start_rollups(self):
+        """Store the time from which the rollups hold every sample,
+        unless another writer already did, and return it.
+        """
+        start = self._read_rollups_start()
+        if start is None:
+            start = base.get_rollups_start(timeutils.utcnow())
+            try:
+                with self.session.begin():
+                    self.session.execute(MeterRollupStart.__table__.insert(),
+                                         {'id': 1, 'timestamp': start})
+            except exc.IntegrityError:
+                start = self._read_rollups_start()
+            LOG.info('rollups hold the samples from %s', start)
+        return start
+
+    def _create_rollups(self, keys):
+        """Insert empty rollup rows for the keys, skipping the ones
+        created by another writer since they were looked up.
+
+        :param keys: set of keys such as the ones of
+                     base.make_rollup_deltas()
+        """
+        table = MeterRollup.__table__
+        for key in sorted(keys):
+            try:
+                with self.session.begin_nested():
+                    self.session.execute(table.insert(), dict(
+                        zip(ROLLUP_KEY, key), sample_count=0, volume_sum=0))
+            except exc.IntegrityError:
+                LOG.debug('rollup %s already created', key)
 
     def get_users(self, source=None):
         """Return an iterable of user id strings.
@@ -222,7 +850,8 @@ class Connection(base.Connection):
 
     def get_resources(self, user=None, project=None, source=None,
                       start_timestamp=None, end_timestamp=None,
-                      metaquery=None, resource=None):
+                      metaquery=None, resource=None, limit=None,
+                      marker=None, fields=None):
         """Return an iterable of dictionaries containing resource information.
 
         { 'resource_id': UUID of the resource,
@@ -240,26 +869,54 @@ class Connection(base.Connection):
         :param end_timestamp: Optional modified timestamp end range.
         :param metaquery: Optional dict with metadata to match on.
         :param resource: Optional resource filter.
+        :param limit: Optional maximum number of resources to return.
+        :param marker: Optional ID of the last resource already seen.
+        :param fields: Optional list of the keys to return. The
+                       resource_id is always returned, and the meters
+                       are only looked up when requested.
         """
         query = model_query(Resource, session=self.session)
         if user is not None:
             query = query.filter(Resource.user_id == user)
         if source is not None:
             query = query.filter(Resource.sources.any(id=source))
-        if start_timestamp is not None:
-            query = query.filter(Resource.timestamp >= start_timestamp)
-        if end_timestamp:
-            query = query.filter(Resource.timestamp < end_timestamp)
+        if start_timestamp is not None or end_timestamp:
+            query = query.filter(self._sampled_in_range(start_timestamp,
+                                                        end_timestamp))
         if project is not None:
             query = query.filter(Resource.project_id == project)
         if resource is not None:
             query = query.filter(Resource.id == resource)
-        query = query.options(
-            sqlalchemy_session.sqlalchemy.orm.joinedload('meters'))
-        if metaquery is not None:
-            raise NotImplementedError('metaquery not implemented')
+        if metaquery:
+            query = query.filter(Resource.id.in_(
+                self._get_resources_by_metaquery(metaquery)))
+        if marker is not None:
+            query = query.filter(Resource.id > marker)
+        if limit or marker is not None:
+            query = query.order_by(Resource.id)
+        if fields is not None:
+            # Read only the requested columns instead of the instances.
+            names = sorted(set(fields) & set(RESOURCE_COLUMNS))
+            query = query.with_entities(Resource.id, *[
+                getattr(Resource, RESOURCE_COLUMNS[n]) for n in names])
 
-        for resource in query.all():
+        if limit:
+            # MySQL does not support LIMIT in an IN subquery, so look
+            # the meters of the page up by id.
+            resources = query.limit(limit).all()
+            resource_ids = [r.id for r in resources]
+        else:
+            resources = query.all()
+            resource_ids = query.with_entities(Resource.id).subquery()
+        if fields is None or 'meter' in fields:
+            catalog = self._get_meter_catalog(resource_ids)
+        for resource in resources:
+            if fields is not None:
+                r = dict(zip(['resource_id'] + names, resource))
+                if 'meter' in fields:
+                    r['meter'] = catalog.get(r['resource_id'], [])
+                yield r
+                continue
             r = row2dict(resource)
             # Replace the '_id' key with 'resource_id' to meet the
             # caller's expectations.
@@ -268,13 +925,76 @@ class Connection(base.Connection):
             # Replace the 'resource_metadata' with 'metadata'
             r['metadata'] = r['resource_metadata']
             del r['resource_metadata']
-            # Replace the 'meters' with 'meter'
-            r['meter'] = r['meters']
-            del r['meters']
+            r['meter'] = catalog.get(r['resource_id'], [])
             yield r
 
+    def _sampled_in_range(self, start, end):
+        """Return the condition selecting the resources which have
+        samples between `start` and `end`.
+
+        The resources whose range of sample timestamps overlaps the
+        requested one are selected through their index. Those whose
+        first or last sample falls in the requested range match
+        without reading their samples, which are only looked up for
+        the resources reporting both before and after it.
+        """
+        overlap = []
+        if start is not None:
+            overlap.append(Resource.last_sample_timestamp >= start)
+        if end:
+            overlap.append(Resource.first_sample_timestamp < end)
+        if start is None or not end:
+            return and_(*overlap)
+        meters = self._get_meter_union(start, end)
+        if meters is None:
+            meters = Meter.__table__
+        sampled = exists().where(and_(meters.c.resource_id == Resource.id,
+                                      meters.c.timestamp >= start,
+                                      meters.c.timestamp < end))
+        return and_(and_(*overlap),
+                    or_(Resource.first_sample_timestamp >= start,
+                        Resource.last_sample_timestamp < end,
+                        sampled))
+
+    def _get_resources_by_metaquery(self, metaquery):
+        """Return a subquery selecting the ids of the resources with
+        samples whose metadata matches the metaquery.
+        """
+        meters = self._get_meter_union()
+        meter = Meter if meters is None else aliased(Meter, meters)
+        query = self.session.query(meter.resource_id)
+        return apply_metaquery(query, meter.id, metaquery).subquery()
+
+    def _get_meter_catalog(self, resource_ids):
+        """Return a dictionary mapping resource ids to the list of
+        distinct meters reported for the resource.
+
+        The meters are read with a SELECT DISTINCT over the meter
+        table instead of loading every sample of the resources.
+
+        :param resource_ids: List of the resource ids to look up, or
+                             subquery returning them.
+        """
+        query = self.session.query(Meter.resource_id,
+                                   Meter.counter_name,
+                                   Meter.counter_type,
+                                   Meter.counter_unit)
+        meters = self._get_meter_union()
+        if meters is not None:
+            query = query.select_from(meters)
+        query = query.distinct()
+        query = query.filter(Meter.resource_id.in_(resource_ids))
+        catalog = {}
+        for resource_id, name, type, unit in query:
+            catalog.setdefault(resource_id, []).append({
+                'counter_name': name,
+                'counter_type': type,
+                'counter_unit': unit,
+            })
+        return catalog
+
     def get_meters(self, user=None, project=None, resource=None, source=None,
-                   metaquery={}):
+                   metaquery={}, limit=None, marker=None):
         """Return an iterable of dictionaries containing meter information.
 
         { 'name': name of the meter,
@@ -290,8 +1010,18 @@ class Connection(base.Connection):
         :param resource: Optional ID of the resource.
         :param source: Optional source filter.
         :param metaquery: Optional dict with metadata to match on.
+        :param limit: Optional maximum number of meters to return.
+        :param marker: Optional key of the last meter already seen.
         """
-        query = model_query(Resource, session=self.session)
+        meters = self._get_meter_union()
+        meter = Meter if meters is None else aliased(Meter, meters)
+        query = self.session.query(Resource.id,
+                                   Resource.project_id,
+                                   Resource.user_id,
+                                   meter.counter_name,
+                                   meter.counter_type,
+                                   meter.counter_unit).distinct()
+        query = query.join(meter, meter.resource_id == Resource.id)
         if user is not None:
             query = query.filter(Resource.user_id == user)
         if source is not None:
@@ -300,64 +1030,166 @@ class Connection(base.Connection):
             query = query.filter(Resource.id == resource)
         if project is not None:
             query = query.filter(Resource.project_id == project)
-        query = query.options(
-            sqlalchemy_session.sqlalchemy.orm.joinedload('meters'))
-        if len(metaquery) > 0:
-            raise NotImplementedError('metaquery not implemented')
-
-        for resource in query.all():
-            meter_names = set()
-            for meter in resource.meters:
-                if meter.counter_name in meter_names:
-                    continue
-                meter_names.add(meter.counter_name)
-                m = {}
-                m['resource_id'] = resource.id
-                m['project_id'] = resource.project_id
-                m['user_id'] = resource.user_id
-                m['name'] = meter.counter_name
-                m['type'] = meter.counter_type
-                m['unit'] = meter.counter_unit
-                yield m
-
-    def get_raw_events(self, event_filter):
+        if metaquery:
+            query = query.filter(Resource.id.in_(
+                self._get_resources_by_metaquery(metaquery)))
+        if limit or marker is not None:
+            sort_key = [Resource.id,
+                        func.coalesce(meter.counter_name, ''),
+                        func.coalesce(meter.counter_type, ''),
+                        func.coalesce(meter.counter_unit, ''),
+                        ]
+            if marker is not None:
+                query = query.filter(_sorted_after(
+                    sort_key, [v or '' for v in marker]))
+            query = query.order_by(*sort_key)
+        if limit:
+            query = query.limit(limit)
+
+        for row in query:
+            m = {}
+            m['resource_id'] = row[0]
+            m['project_id'] = row[1]
+            m['user_id'] = row[2]
+            m['name'] = row[3]
+            m['type'] = row[4]
+            m['unit'] = row[5]
+            yield m
+
+    def get_raw_events(self, event_filter, fields=None):
         """Return an iterable of raw event data as created by
         :func:`ceilometer.meter.meter_message_from_counter`.
+
+        :param event_filter: EventFilter instance
+        :param fields: Optional list of the keys to return, only
+                       these columns are read from the database.
         """
-        query = model_query(Meter, session=self.session)
+        # Select the columns directly instead of loading Meter
+        # instances, leaving out the id generated by the database
+        # when the event was inserted. It is an implementation detail
+        # that should not leak outside of the driver. Each meter has
+        # one and only one source in the current implementation, so
+        # it is joined in the same query.
+        columns = [getattr(Meter, c.name)
+                   for c in Meter.__table__.columns
+                   if c.name != 'id' and (fields is None or c.name in fields)]
+        meters = self._get_meter_union(event_filter.start, event_filter.end)
+        # The source is only joined in when requested.
+        with_source = fields is None or 'source' in fields
+        if with_source and meters is None:
+            columns.append(sourceassoc.c.source_id.label('source'))
+        elif with_source:
+            columns.append(meters.c.source_id.label('source'))
+        if fields is not None:
+            # filter_by() applies to the entity of the first column,
+            # which has to be selected even when no Meter column is
+            # requested. It is removed from the results.
+            columns.insert(0, Meter.id)
+        query = self.session.query(*columns)
         query = make_query_from_filter(query, event_filter,
-                                       require_meter=False)
-        events = query.all()
-
-        for e in events:
-            # Remove the id generated by the database when
-            # the event was inserted. It is an implementation
-            # detail that should not leak outside of the driver.
-            e = row2dict(e)
-            del e['id']
-            # Replace 'sources' with 'source' to meet the caller's
-            # expectation, Meter.sources contains one and only one
-            # source in the current implementation.
-            e['source'] = e['sources'][0]['id']
-            del e['sources']
-            yield e
+                                       require_meter=False,
+                                       meters=meters)
+        if meters is None and with_source:
+            # Join after filtering, so filter_by() still applies to
+            # Meter.
+            query = query.join(sourceassoc,
+                               sourceassoc.c.meter_id == Meter.id)
+        sort_key = [Meter.timestamp, Meter.message_id]
+        if event_filter.marker:
+            query = query.filter(_sorted_after(sort_key,
+                                               event_filter.marker))
+        if event_filter.limit or event_filter.marker:
+            query = query.order_by(*sort_key)
+        if event_filter.limit:
+            query = query.limit(event_filter.limit)
+
+        # Stream the rows (using a server-side cursor where the
+        # database driver supports one) so memory use does not grow
+        # with the number of matching events.
+        statement = query.statement.execution_options(stream_results=True)
+        results = self.session.execute(statement)
+        try:
+            while True:
+                rows = results.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    event = dict(row.items())
+                    if fields is not None:
+                        del event['id']
+                    yield event
+        finally:
+            results.close()
+
+    def _get_rollups(self, event_filter, period, start, end):
+        """Return an iterable of (resource_id, summary) tuples read
+        from the `period` seconds long rollup buckets between `start`
+        and `end`, for the meter, resource and project of the filter.
+        """
+        query = self.session.query(MeterRollup.resource_id,
+                                   func.sum(MeterRollup.sample_count),
+                                   func.sum(MeterRollup.volume_sum),
+                                   func.min(MeterRollup.volume_min),
+                                   func.max(MeterRollup.volume_max),
+                                   func.min(MeterRollup.first_timestamp),
+                                   func.max(MeterRollup.last_timestamp))
+        query = query.filter(MeterRollup.counter_name == event_filter.meter)
+        query = query.filter(MeterRollup.period == period)
+        query = query.filter(MeterRollup.bucket >= start)
+        query = query.filter(MeterRollup.bucket < end)
+        if event_filter.resource is not None:
+            query = query.filter(
+                MeterRollup.resource_id == event_filter.resource)
+        if event_filter.project is not None:
+            query = query.filter(
+                MeterRollup.project_id == event_filter.project)
+        query = query.group_by(MeterRollup.resource_id)
+        return (_make_summary(row) for row in query)
+
+    def _summarize_events(self, event_filter):
+        """Return an iterable of (resource_id, summary) tuples
+        computed from the raw events selected by the filter.
+        """
+        query = self.session.query(Meter.resource_id,
+                                   func.count(Meter.counter_volume),
+                                   func.sum(Meter.counter_volume),
+                                   func.min(Meter.counter_volume),
+                                   func.max(Meter.counter_volume),
+                                   func.min(Meter.timestamp),
+                                   func.max(Meter.timestamp))
+        query = make_query_from_filter(
+            query, event_filter,
+            meters=self._get_meter_union(event_filter.start,
+                                         event_filter.end))
+        query = query.group_by(Meter.resource_id)
+        return (_make_summary(row) for row in query)
 
     def _make_volume_query(self, event_filter, counter_volume_func):
-        """Returns complex Meter counter_volume query for max and sum"""
-        subq = model_query(Meter.id, session=self.session)
-        subq = make_query_from_filter(subq, event_filter, require_meter=False)
-        subq = subq.subquery()
-        mainq = self.session.query(Resource.id, counter_volume_func)
-        mainq = mainq.join(Meter).group_by(Resource.id)
-        return mainq.filter(Meter.id.in_(subq))
+        """Returns Meter counter_volume query for max and sum, grouped
+        by resource.
+        """
+        query = self.session.query(Meter.resource_id, counter_volume_func)
+        query = make_query_from_filter(
+            query, event_filter, require_meter=False,
+            meters=self._get_meter_union(event_filter.start,
+                                         event_filter.end))
+        return query.group_by(Meter.resource_id)
 
     def get_volume_sum(self, event_filter):
+        if self._use_rollups(event_filter):
+            summaries = self._summarize_by_resource(event_filter)
+            return ({'resource_id': resource_id, 'value': summary['sum']}
+                    for resource_id, summary in summaries.iteritems())
         counter_volume_func = func.sum(Meter.counter_volume)
         query = self._make_volume_query(event_filter, counter_volume_func)
         results = query.all()
         return ({'resource_id': x, 'value': y} for x, y in results)
 
     def get_volume_max(self, event_filter):
+        if self._use_rollups(event_filter):
+            summaries = self._summarize_by_resource(event_filter)
+            return ({'resource_id': resource_id, 'value': summary['max']}
+                    for resource_id, summary in summaries.iteritems())
         counter_volume_func = func.max(Meter.counter_volume)
         query = self._make_volume_query(event_filter, counter_volume_func)
         results = query.all()
@@ -371,13 +1203,37 @@ class Connection(base.Connection):
         """
         query = self.session.query(func.min(Meter.timestamp),
                                    func.max(Meter.timestamp))
-        query = make_query_from_filter(query, event_filter)
+        query = make_query_from_filter(
+            query, event_filter,
+            meters=self._get_meter_union(event_filter.start,
+                                         event_filter.end))
         results = query.all()
         a_min, a_max = results[0]
         return (a_min, a_max)
 
-    def get_meter_statistics(self, event_filter):
-        """Return a dictionary containing meter statistics.
+    def _period_bucket(self, origin, period):
+        """Return an expression numbering the `period` seconds long
+        periods since `origin` that Meter.timestamp falls in.
+        """
+        origin = literal_column(str(utils.dt_to_epoch(origin)))
+        period = literal_column(str(int(period)))
+        dialect = self.session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            seconds = cast(func.strftime('%s', Meter.timestamp), Integer)
+            # Integer division already truncates.
+            return (seconds - origin) / period
+        if dialect == 'mysql':
+            # UNIX_TIMESTAMP() would apply the session time zone to
+            # the naive UTC timestamps.
+            seconds = func.timestampdiff(literal_column('SECOND'),
+                                         base.EPOCH,
+                                         Meter.timestamp)
+        else:
+            seconds = extract('epoch', Meter.timestamp)
+        return func.floor((seconds - origin) / period)
+
+    def get_meter_statistics(self, event_filter, period=None):
+        """Return a list of dictionaries containing meter statistics
         described by the query parameters.
 
         The filter must have a meter value set.
@@ -390,31 +1246,155 @@ class Connection(base.Connection):
           'duration':
           'duration_start':
           'duration_end':
+          'period':
+          'period_start':
+          'period_end':
           }
         """
+        if not period and self._use_rollups(event_filter):
+            return self._get_rollup_statistics(event_filter)
+
         query = self.session.query(func.min(Meter.timestamp),
                                    func.max(Meter.timestamp),
                                    func.sum(Meter.counter_volume),
                                    func.min(Meter.counter_volume),
                                    func.max(Meter.counter_volume),
                                    func.count(Meter.counter_volume))
-        query = make_query_from_filter(query, event_filter)
-        results = query.all()
-        res = results[0]
-        count = int(res[5])
-        return {'count': count,
-                'min': res[3],
-                'max': res[4],
-                'avg': (res[2] / count) if count > 0 else None,
-                'sum': res[2],
-                'duration': None,
-                'duration_start': res[0],
-                'duration_end': res[1],
-                }
+        query = make_query_from_filter(
+            query, event_filter,
+            meters=self._get_meter_union(event_filter.start,
+                                         event_filter.end))
+        if period:
+            origin = base.get_period_origin(event_filter)
+            bucket = self._period_bucket(origin, period)
+            query = query.add_columns(bucket).group_by(bucket).order_by(bucket)
+
+        stats = []
+        for res in query.all():
+            if period:
+                period_start = origin + datetime.timedelta(
+                    seconds=int(res[6]) * period)
+                period_end = period_start + datetime.timedelta(
+                    seconds=period)
+            else:
+                period_start = event_filter.start or res[0]
+                period_end = event_filter.end or res[1]
+            count = int(res[5])
+            stats.append({'count': count,
+                          'min': res[3],
+                          'max': res[4],
+                          'avg': (float(res[2]) / count
+                                  if count > 0 else None),
+                          'sum': res[2],
+                          'duration': None,
+                          'duration_start': res[0],
+                          'duration_end': res[1],
+                          'period': period or 0,
+                          'period_start': period_start,
+                          'period_end': period_end,
+                          })
+        return stats
 
 ############################
 
 
+def _sorted_after(columns, values):
+    """Return the condition selecting the rows sorted after `values`
+    when ordering on `columns`.
+    """
+    condition = None
+    for column, value in reversed(zip(columns, values)):
+        if condition is None:
+            condition = column > value
+        else:
+            condition = or_(column > value,
+                            and_(column == value, condition))
+    return condition
+
+
+def _best(column, compare, name, type_):
+    """Return an expression keeping the value of `column` unless it
+    is NULL or `compare(column, value)` holds, `value` being the bound
+    parameter `name`.
+    """
+    value = bindparam(name, type_=type_)
+    return case([(or_(column.is_(None), compare(column, value)), value)],
+                else_=column)
+
+
+class _AmbiguousMeterIds(Exception):
+    """The ids of inserted meter rows cannot be told apart from the
+    ones of other rows.
+    """
+
+
+def _meter_row(data):
+    """Return the values of the meter row of a sample.
+    """
+    return {'counter_name': data['counter_name'],
+            'counter_type': data['counter_type'],
+            'counter_unit': data['counter_unit'],
+            'counter_volume': data['counter_volume'],
+            'user_id': _to_id(data['user_id']),
+            'project_id': _to_id(data['project_id']),
+            'resource_id': _to_id(data['resource_id']),
+            'timestamp': data['timestamp'],
+            'resource_metadata': data['resource_metadata'],
+            'message_signature': data['message_signature'],
+            'message_id': data['message_id'],
+            }
+
+
+def _select_with_source():
+    """Return a select statement reading the rows of the meter table
+    with the id of their source, in the columns of a partition table.
+    """
+    meter = Meter.__table__
+    return select(list(meter.c) + [sourceassoc.c.source_id],
+                  from_obj=[meter.outerjoin(
+                      sourceassoc, sourceassoc.c.meter_id == meter.c.id)])
+
+
+def _meta_models():
+    return sorted(set(META_TYPE_MAP.itervalues()),
+                  key=lambda m: m.__tablename__)
+
+
+def _flatten_metadata(metadata):
+    """Return the list of (model, key, value) tuples of the
+    flattened metadata values which can be indexed.
+    """
+    if not metadata:
+        return []
+    values = []
+    for key, value in utils.flatten_dict(metadata):
+        model = META_TYPE_MAP.get(type(value))
+        if model is None or len(key) > META_MAX_LENGTH:
+            continue
+        if model is MetaText and len(value) > META_MAX_LENGTH:
+            continue
+        values.append((model, key, value))
+    return values
+
+
+def _make_summary(row):
+    """Return the (resource_id, summary) tuple for a row holding the
+    resource id, count, sum, min, max, first and last timestamps.
+    """
+    return (row[0], {'count': int(row[1]),
+                     'sum': row[2],
+                     'min': row[3],
+                     'max': row[4],
+                     'first': row[5],
+                     'last': row[6],
+                     })
+
+
+def _to_id(value):
+    """Return the id as stored in the database, None if it is empty."""
+    return str(value) if value else None
+
+
 def model_query(*args, **kwargs):
     """Query helper
 
@@ -84,3 +84,8 @@ class TestConnection(impl_mongodb.Connection):
             LOG.debug('Creating a new MIM Connection object')
             TestConnection._mim_instance = mim.Connection()
         return TestConnection._mim_instance
+
+    def is_alive(self):
+        # MIM does not implement the ping command, and is always
+        # there anyway.
+        return True
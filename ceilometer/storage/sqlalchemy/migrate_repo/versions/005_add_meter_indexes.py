@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from sqlalchemy import *
+
+meta = MetaData()
+
+
+def _indexes():
+    meter = Table('meter', meta, autoload=True)
+    sourceassoc = Table('sourceassoc', meta, autoload=True)
+    return [
+        Index('idx_meter_cn_ts',
+              meter.c.counter_name, meter.c.timestamp),
+        Index('idx_meter_rid_cn_ts',
+              meter.c.resource_id, meter.c.counter_name, meter.c.timestamp),
+        Index('idx_meter_pid_cn_ts',
+              meter.c.project_id, meter.c.counter_name, meter.c.timestamp),
+        Index('idx_meter_uid_cn_ts',
+              meter.c.user_id, meter.c.counter_name, meter.c.timestamp),
+        Index('idx_ms',
+              sourceassoc.c.meter_id, sourceassoc.c.source_id),
+    ]
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in _indexes():
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in _indexes():
+        index.drop(migrate_engine)
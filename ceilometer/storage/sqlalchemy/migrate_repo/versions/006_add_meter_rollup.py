@@ -0,0 +1,47 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from sqlalchemy import *
+
+meta = MetaData()
+
+meter_rollup = Table(
+    'meter_rollup', meta,
+    Column('id', Integer, primary_key=True, index=True),
+    Column('counter_name', String(255)),
+    Column('period', Integer),
+    Column('bucket', DateTime(timezone=False)),
+    Column('resource_id', String(255)),
+    Column('project_id', String(255)),
+    Column('sample_count', Integer),
+    Column('volume_sum', Float),
+    Column('volume_min', Float),
+    Column('volume_max', Float),
+    Column('first_timestamp', DateTime(timezone=False)),
+    Column('last_timestamp', DateTime(timezone=False)),
+    UniqueConstraint('counter_name', 'period', 'bucket', 'resource_id',
+                     'project_id', name='uniq_meter_rollup'),
+    mysql_engine='InnoDB',
+    mysql_charset='utf8',
+)
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    meter_rollup.create()
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    meter_rollup.drop()
@@ -0,0 +1,39 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from sqlalchemy import *
+
+meta = MetaData()
+
+meter_partition = Table(
+    'meter_partition', meta,
+    Column('name', String(64), primary_key=True),
+    Column('start_timestamp', DateTime(timezone=False)),
+    Column('end_timestamp', DateTime(timezone=False)),
+    mysql_engine='InnoDB',
+    mysql_charset='utf8',
+)
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    meter_partition.create()
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    # The samples of the partitions are dropped with them.
+    for name, in migrate_engine.execute(select([meter_partition.c.name])):
+        Table(name, meta, autoload=True).drop()
+    meter_partition.drop()
@@ -0,0 +1,71 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+from sqlalchemy import *
+
+meta = MetaData()
+
+
+def _columns():
+    return [Column('first_sample_timestamp', DateTime(timezone=False)),
+            Column('last_sample_timestamp', DateTime(timezone=False))]
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    resource = Table('resource', meta, autoload=True)
+    for column in _columns():
+        resource.create_column(column)
+    Index('idx_resource_sample_ts',
+          resource.c.last_sample_timestamp,
+          resource.c.first_sample_timestamp).create(migrate_engine)
+
+    # Fill the range from the samples already recorded, in the meter
+    # table and in its partitions.
+    partition = Table('meter_partition', meta, autoload=True)
+    tables = [Table('meter', meta, autoload=True)]
+    for name, in migrate_engine.execute(select([partition.c.name])):
+        tables.append(Table(name, meta, autoload=True))
+    ranges = {}
+    for table in tables:
+        query = select([table.c.resource_id,
+                        func.min(table.c.timestamp),
+                        func.max(table.c.timestamp)]).group_by(
+                            table.c.resource_id)
+        for resource_id, first, last in migrate_engine.execute(query):
+            if resource_id is None or first is None:
+                continue
+            if resource_id in ranges:
+                first = min(first, ranges[resource_id][0])
+                last = max(last, ranges[resource_id][1])
+            ranges[resource_id] = (first, last)
+    update = resource.update().where(
+        resource.c.id == bindparam('rid')).values(
+            first_sample_timestamp=bindparam('first'),
+            last_sample_timestamp=bindparam('last'))
+    params = [{'rid': rid, 'first': first, 'last': last}
+              for rid, (first, last) in ranges.iteritems()]
+    if params:
+        migrate_engine.execute(update, params)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    resource = Table('resource', meta, autoload=True)
+    Index('idx_resource_sample_ts',
+          resource.c.last_sample_timestamp,
+          resource.c.first_sample_timestamp).drop(migrate_engine)
+    for column in _columns():
+        resource.drop_column(column)
@@ -0,0 +1,113 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import json
+
+from sqlalchemy import *
+
+meta = MetaData()
+
+# Number of samples read at a time to fill the tables.
+BATCH_SIZE = 1000
+
+tables = {}
+for kind, value_type in [('text', String(255)),
+                         ('int', BigInteger),
+                         ('float', Float),
+                         ('bool', Boolean)]:
+    tables[kind] = Table(
+        'metadata_%s' % kind, meta,
+        Column('id', Integer, primary_key=True),
+        Column('meta_key', String(255), primary_key=True),
+        Column('value', value_type),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+    Index('ix_meta_%s_key' % kind,
+          tables[kind].c.meta_key, tables[kind].c.value)
+
+
+def _flatten_dict(d):
+    """Generate the (key, value) pairs of a nested dictionary, as
+    ceilometer.utils.flatten_dict did when this migration was written.
+    """
+    seen = set()
+    for key, value in _flatten_items(d):
+        if key not in seen:
+            seen.add(key)
+            yield key, value
+
+
+def _flatten_items(d):
+    for name, value in sorted(d.iteritems()):
+        if isinstance(value, dict):
+            for subname, subvalue in _flatten_items(value):
+                yield ('%s.%s' % (name, subname), subvalue)
+        else:
+            yield name, value
+
+
+def _get_kind(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, long)):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, basestring) and len(value) <= 255:
+        return 'text'
+    return None
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for table in tables.itervalues():
+        table.create()
+
+    # Index the metadata of the samples already recorded, in the
+    # meter table and in its partitions.
+    partition = Table('meter_partition', meta, autoload=True)
+    sources = [Table('meter', meta, autoload=True)]
+    for name, in migrate_engine.execute(select([partition.c.name])):
+        sources.append(Table(name, meta, autoload=True))
+    for source in sources:
+        last_id = 0
+        while True:
+            rows = migrate_engine.execute(
+                select([source.c.id, source.c.resource_metadata],
+                       source.c.id > last_id)
+                .order_by(source.c.id).limit(BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            values = dict((kind, []) for kind in tables)
+            for meter_id, metadata in rows:
+                last_id = meter_id
+                if not metadata:
+                    continue
+                for key, value in _flatten_dict(json.loads(metadata)):
+                    kind = _get_kind(value)
+                    if kind is not None and len(key) <= 255:
+                        values[kind].append({'id': meter_id,
+                                             'meta_key': key,
+                                             'value': value})
+            for kind, params in values.iteritems():
+                if params:
+                    migrate_engine.execute(tables[kind].insert(), params)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for table in tables.itervalues():
+        table.drop()
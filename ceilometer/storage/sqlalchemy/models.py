@@ -19,7 +19,8 @@ SQLAlchemy models for nova data.
 """
 
 import json
-from sqlalchemy import Column, Integer, String, Table
+from sqlalchemy import BigInteger, Boolean, Column, Float, Index, Integer
+from sqlalchemy import String, Table, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import ForeignKey, DateTime
 from sqlalchemy.orm import relationship, backref
@@ -135,8 +136,109 @@ class Resource(Base):
     id = Column(String(255), primary_key=True)
     sources = relationship("Source", secondary=lambda: sourceassoc)
     timestamp = Column(DateTime)
+    first_sample_timestamp = Column(DateTime)
+    last_sample_timestamp = Column(DateTime)
     resource_metadata = Column(JSONEncodedDict)
     received_timestamp = Column(DateTime, default=timeutils.utcnow)
     user_id = Column(String(255), ForeignKey('user.id'))
     project_id = Column(String(255), ForeignKey('project.id'))
     meters = relationship("Meter", backref='resource')
+
+
+class MetaBase(object):
+    """Value of a key of the flattened metadata of a sample.
+
+    The key is the path of the value in the nested metadata, with the
+    names joined by dots. The sample is not a foreign key, since its
+    row may be moved to a partition table.
+    """
+    id = Column(Integer, primary_key=True)
+    meta_key = Column(String(255), primary_key=True)
+
+
+class MetaText(MetaBase, Base):
+    __tablename__ = 'metadata_text'
+    value = Column(String(255))
+
+
+class MetaInt(MetaBase, Base):
+    __tablename__ = 'metadata_int'
+    value = Column(BigInteger)
+
+
+class MetaFloat(MetaBase, Base):
+    __tablename__ = 'metadata_float'
+    value = Column(Float)
+
+
+class MetaBool(MetaBase, Base):
+    __tablename__ = 'metadata_bool'
+    value = Column(Boolean)
+
+
+class MeterRollup(Base):
+    """Aggregates of the samples of a meter for a resource and project,
+    over an hour or a day.
+    """
+
+    __tablename__ = 'meter_rollup'
+    __table_args__ = (
+        UniqueConstraint('counter_name', 'period', 'bucket', 'resource_id',
+                         'project_id', name='uniq_meter_rollup'),
+        table_args() or {},
+    )
+    id = Column(Integer, primary_key=True)
+    counter_name = Column(String(255))
+    period = Column(Integer)
+    bucket = Column(DateTime)
+    resource_id = Column(String(255))
+    project_id = Column(String(255))
+    sample_count = Column(Integer)
+    volume_sum = Column(Float)
+    volume_min = Column(Float)
+    volume_max = Column(Float)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+
+
+class MeterRollupStart(Base):
+    """Time from which the rollups hold every sample, in its only row.
+    """
+
+    __tablename__ = 'meter_rollup_start'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    timestamp = Column(DateTime)
+
+
+class MeterPartition(Base):
+    """Range of sample timestamps moved out of the meter table into a
+    partition table of their own.
+    """
+
+    __tablename__ = 'meter_partition'
+    name = Column(String(64), primary_key=True)
+    start_timestamp = Column(DateTime)
+    end_timestamp = Column(DateTime)
+
+
+def make_partition_table(name, metadata):
+    """Return the table holding the samples of the meter partition
+    `name`.
+
+    It has the columns of the meter table, without the foreign keys,
+    plus the source of each sample since the rows of a partition are
+    not linked from sourceassoc. The meter indexes are repeated with
+    the name of the partition as prefix.
+    """
+    columns = [Column(c.name, c.type) for c in Meter.__table__.columns]
+    columns.append(Column('source_id', String(255)))
+    table = Table(name, metadata, *columns, **(table_args() or {}))
+    Index('%s_ts' % name, table.c.timestamp)
+    Index('%s_cn_ts' % name, table.c.counter_name, table.c.timestamp)
+    Index('%s_rid_cn_ts' % name,
+          table.c.resource_id, table.c.counter_name, table.c.timestamp)
+    Index('%s_pid_cn_ts' % name,
+          table.c.project_id, table.c.counter_name, table.c.timestamp)
+    Index('%s_uid_cn_ts' % name,
+          table.c.user_id, table.c.counter_name, table.c.timestamp)
+    return table
@@ -87,6 +87,22 @@ def add_regexp_listener(dbapi_con, con_record):
     dbapi_con.create_function('regexp', 2, regexp)
 
 
+def autocommit_listener(dbapi_con, con_record):
+    """Stop pysqlite from managing the transactions of sqlite
+    connections.
+
+    pysqlite only begins a transaction before a DML statement and
+    commits it before any other one, which loses the savepoints.
+    begin_listener() begins the transactions instead.
+    """
+    dbapi_con.isolation_level = None
+
+
+def begin_listener(conn):
+    """Begin the transactions of sqlite connections."""
+    conn.execute('BEGIN')
+
+
 def ping_listener(dbapi_conn, connection_rec, connection_proxy):
     """
     Ensures that MySQL connections checked out of the
@@ -152,6 +168,8 @@ def get_engine():
                 sqlalchemy.event.listen(_ENGINE, 'connect',
                                         synchronous_switch_listener)
             sqlalchemy.event.listen(_ENGINE, 'connect', add_regexp_listener)
+            sqlalchemy.event.listen(_ENGINE, 'connect', autocommit_listener)
+            sqlalchemy.event.listen(_ENGINE, 'begin', begin_listener)
 
         if (cfg.CONF.sql_connection_trace and
                 _ENGINE.dialect.dbapi.__name__ == 'MySQLdb'):
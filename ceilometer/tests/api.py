@@ -143,6 +143,7 @@ class FunctionalTest(unittest.TestCase):
         self.stubs.SmartUnsetAll()
         self.mox.VerifyAll()
         set_config({}, overwrite=True)
+        storage.clear_shared_connections()
 
     def get_json(self, path, expect_errors=False, headers=None,
                  q=[], **params):
@@ -21,7 +21,9 @@
 """Utilities and helper functions."""
 
 
+import calendar
 import os
+import time
 
 
 def read_cached_file(filename, cache_info, reload_func=None):
@@ -42,3 +44,93 @@ def read_cached_file(filename, cache_info, reload_func=None):
         if reload_func:
             reload_func(cache_info['data'])
     return cache_info['data']
+
+
+def dt_to_epoch(timestamp):
+    """Return the number of seconds between the epoch and a naive UTC
+    datetime.
+    """
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def flatten_dict(d, separator='.'):
+    """Generate the (key, value) pairs of a nested dictionary, the
+    keys of the nested dictionaries being joined with `separator`.
+
+    A key containing the separator can flatten to the same string as
+    a nested one, such as {'a.b': 1, 'a': {'b': 2}}. Only the first of
+    them, in sorted order, is produced so the keys are unique.
+    """
+    seen = set()
+    for key, value in _flatten_dict(d, separator):
+        if key not in seen:
+            seen.add(key)
+            yield key, value
+
+
+def _flatten_dict(d, separator):
+    for name, value in sorted(d.iteritems()):
+        if isinstance(value, dict):
+            for subname, subvalue in _flatten_dict(value, separator):
+                yield ('%s%s%s' % (name, separator, subname), subvalue)
+        else:
+            yield name, value
+
+
+class LRUCache(object):
+    """Remember a bounded number of recently used keys.
+
+    Keys are kept in two generations. When the current generation is
+    full it replaces the previous one, and keys found in the previous
+    generation are promoted back into the current one, so the keys
+    that have not been used for the longest time are forgotten first.
+
+    :param size: maximum number of keys to remember
+    :param ttl: optional number of seconds after which a key is
+                forgotten, counted from when it was added
+    """
+
+    def __init__(self, size, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self._current = {}
+        self._previous = {}
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def __contains__(self, key):
+        added = self._current.get(key)
+        if added is None:
+            added = self._previous.pop(key, None)
+            if added is None:
+                return False
+            self._store(key, added)
+        if self.ttl is not None and time.time() - added > self.ttl:
+            del self._current[key]
+            return False
+        return True
+
+    def _store(self, key, added):
+        if len(self._current) >= max(self.size // 2, 1):
+            self._previous = self._current
+            self._current = {}
+        self._current[key] = added
+
+    def add(self, key):
+        """Remember the key.
+        """
+        if self.size > 0:
+            self._store(key, time.time())
+
+    def discard(self, key):
+        """Forget the key if it is known.
+        """
+        self._current.pop(key, None)
+        self._previous.pop(key, None)
+
+    def clear(self):
+        """Forget all of the keys.
+        """
+        self._current = {}
+        self._previous = {}
@@ -79,7 +79,10 @@ setuptools.setup(
              'bin/ceilometer-agent-central',
              'bin/ceilometer-api',
              'bin/ceilometer-collector',
-             'bin/ceilometer-dbsync'],
+             'bin/ceilometer-dbsync',
+             'bin/ceilometer-expirer',
+             'bin/ceilometer-index-advisor',
+             'bin/ceilometer-partition'],
 
     py_modules=[],
 
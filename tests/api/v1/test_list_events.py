@@ -20,8 +20,10 @@
 """
 
 import datetime
+import json
 import logging
 
+from ceilometer.api.v1 import blueprint
 from ceilometer.collector import meter
 from ceilometer import counter
 from ceilometer.openstack.common import cfg
@@ -203,3 +205,41 @@ class TestListEvents(tests_api.TestBase):
                         headers={"X-Roles": "Member",
                                  "X-Tenant-Id": "project2"})
         self.assertEquals(1, len(data['events']))
+
+    def test_timestamps(self):
+        data = self.get('/sources/source1/meters/instance')
+        timestamps = sorted(e['timestamp'] for e in data['events'])
+        self.assertEquals(['2012-07-02T10:40:00.000000',
+                           '2012-07-02T10:41:00.000000',
+                           '2012-07-02T10:42:00.000000',
+                           ],
+                          timestamps)
+
+
+class TestStreamJSON(tests_api.TestBase):
+
+    def test_chunks(self):
+        self.stubs.Set(blueprint, 'STREAM_CHUNK_SIZE', 10)
+        items = ({'value': i} for i in range(3))
+        response = blueprint._stream_json('events', items)
+        chunks = list(response.response)
+        self.assertEquals(4, len(chunks))
+        self.assertEquals({'events': [{'value': 0},
+                                      {'value': 1},
+                                      {'value': 2},
+                                      ]},
+                          json.loads(''.join(chunks)))
+
+    def test_lazy(self):
+        def items():
+            yield {'value': 0}
+            raise AssertionError('read beyond the first chunk')
+        self.stubs.Set(blueprint, 'STREAM_CHUNK_SIZE', 1)
+        response = blueprint._stream_json('events', items())
+        self.assertEquals('{"events": [{"value": 0}',
+                          iter(response.response).next())
+
+    def test_empty(self):
+        response = blueprint._stream_json('events', iter([]))
+        self.assertEquals({'events': []},
+                          json.loads(''.join(response.response)))
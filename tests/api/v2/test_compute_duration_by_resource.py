@@ -55,18 +55,18 @@ class TestComputeDurationByResource(FunctionalTest):
                        func)
 
     def _set_interval(self, start, end):
-        def get_interval(ignore_self, event_filter):
+        def get_interval(ignore_self, event_filter, period=None):
             assert event_filter.start
             assert event_filter.end
-            return {'count': 0,
-                    'min': None,
-                    'max': None,
-                    'avg': None,
-                    'qty': None,
-                    'duration': None,
-                    'duration_start': start,
-                    'duration_end': end,
-                    }
+            return [{'count': 0,
+                     'min': None,
+                     'max': None,
+                     'avg': None,
+                     'qty': None,
+                     'duration': None,
+                     'duration_start': start,
+                     'duration_end': end,
+                     }]
         self._stub_interval_func(get_interval)
 
     def _invoke_api(self):
@@ -83,9 +83,9 @@ class TestComputeDurationByResource(FunctionalTest):
     def test_before_range(self):
         self._set_interval(self.early1, self.early2)
         data = self._invoke_api()
-        assert data['duration_start'] is None
-        assert data['duration_end'] is None
-        assert data['duration'] is None
+        assert data[0]['duration_start'] is None
+        assert data[0]['duration_end'] is None
+        assert data[0]['duration'] is None
 
     def _assert_times_match(self, actual, expected):
         #import pdb; pdb.set_trace()
@@ -97,49 +97,49 @@ class TestComputeDurationByResource(FunctionalTest):
     def test_overlap_range_start(self):
         self._set_interval(self.early1, self.middle1)
         data = self._invoke_api()
-        self._assert_times_match(data['duration_start'], self.start)
-        self._assert_times_match(data['duration_end'], self.middle1)
-        assert data['duration'] == 8 * 60
+        self._assert_times_match(data[0]['duration_start'], self.start)
+        self._assert_times_match(data[0]['duration_end'], self.middle1)
+        assert data[0]['duration'] == 8 * 60
 
     def test_within_range(self):
         self._set_interval(self.middle1, self.middle2)
         data = self._invoke_api()
-        self._assert_times_match(data['duration_start'], self.middle1)
-        self._assert_times_match(data['duration_end'], self.middle2)
-        assert data['duration'] == 10 * 60
+        self._assert_times_match(data[0]['duration_start'], self.middle1)
+        self._assert_times_match(data[0]['duration_end'], self.middle2)
+        assert data[0]['duration'] == 10 * 60
 
     def test_within_range_zero_duration(self):
         self._set_interval(self.middle1, self.middle1)
         data = self._invoke_api()
-        self._assert_times_match(data['duration_start'], self.middle1)
-        self._assert_times_match(data['duration_end'], self.middle1)
-        assert data['duration'] == 0
+        self._assert_times_match(data[0]['duration_start'], self.middle1)
+        self._assert_times_match(data[0]['duration_end'], self.middle1)
+        assert data[0]['duration'] == 0
 
     def test_overlap_range_end(self):
         self._set_interval(self.middle2, self.late1)
         data = self._invoke_api()
-        self._assert_times_match(data['duration_start'], self.middle2)
-        self._assert_times_match(data['duration_end'], self.end)
-        assert data['duration'] == (6 * 60) - 1
+        self._assert_times_match(data[0]['duration_start'], self.middle2)
+        self._assert_times_match(data[0]['duration_end'], self.end)
+        assert data[0]['duration'] == (6 * 60) - 1
 
     def test_after_range(self):
         self._set_interval(self.late1, self.late2)
         data = self._invoke_api()
-        assert data['duration_start'] is None
-        assert data['duration_end'] is None
-        assert data['duration'] is None
+        assert data[0]['duration_start'] is None
+        assert data[0]['duration_end'] is None
+        assert data[0]['duration'] is None
 
     def test_without_end_timestamp(self):
-        def get_interval(ignore_self, event_filter):
-            return {'count': 0,
-                    'min': None,
-                    'max': None,
-                    'avg': None,
-                    'qty': None,
-                    'duration': None,
-                    'duration_start': self.late1,
-                    'duration_end': self.late2,
-                    }
+        def get_interval(ignore_self, event_filter, period=None):
+            return [{'count': 0,
+                     'min': None,
+                     'max': None,
+                     'avg': None,
+                     'qty': None,
+                     'duration': None,
+                     'duration_start': self.late1,
+                     'duration_end': self.late2,
+                     }]
         self._stub_interval_func(get_interval)
         data = self.get_json('/meters/instance:m1.tiny/statistics',
                              q=[{'field': 'timestamp',
@@ -149,20 +149,20 @@ class TestComputeDurationByResource(FunctionalTest):
                                  'value': 'resource-id'},
                                 {'field': 'search_offset',
                                  'value': 10}])
-        self._assert_times_match(data['duration_start'], self.late1)
-        self._assert_times_match(data['duration_end'], self.late2)
+        self._assert_times_match(data[0]['duration_start'], self.late1)
+        self._assert_times_match(data[0]['duration_end'], self.late2)
 
     def test_without_start_timestamp(self):
-        def get_interval(ignore_self, event_filter):
-            return {'count': 0,
-                    'min': None,
-                    'max': None,
-                    'avg': None,
-                    'qty': None,
-                    'duration': None,
-                    'duration_start': self.early1,
-                    'duration_end': self.early2,
-                    }
+        def get_interval(ignore_self, event_filter, period=None):
+            return [{'count': 0,
+                     'min': None,
+                     'max': None,
+                     'avg': None,
+                     'qty': None,
+                     'duration': None,
+                     'duration_start': self.early1,
+                     'duration_end': self.early2,
+                     }]
             return (self.early1, self.early2)
         self._stub_interval_func(get_interval)
         data = self.get_json('/meters/instance:m1.tiny/statistics',
@@ -173,5 +173,5 @@ class TestComputeDurationByResource(FunctionalTest):
                                  'value': 'resource-id'},
                                 {'field': 'search_offset',
                                  'value': 10}])
-        self._assert_times_match(data['duration_start'], self.early1)
-        self._assert_times_match(data['duration_end'], self.early2)
+        self._assert_times_match(data[0]['duration_start'], self.early1)
+        self._assert_times_match(data[0]['duration_end'], self.early2)
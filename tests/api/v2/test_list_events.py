@@ -146,3 +146,24 @@ class TestListEvents(FunctionalTest):
             [('display_name', 'test-server'),
              ('tag', 'self.counter'),
              ])
+
+    def test_fields(self):
+        data = self.get_json('/meters/instance',
+                             fields='counter_volume,timestamp')
+        self.assertEqual(2, len(data))
+        for sample in data:
+            self.assertEqual(set(sample.keys()),
+                             set(['counter_volume', 'timestamp']))
+
+    def test_fields_with_limit(self):
+        response = self.app.get(self.PATH_PREFIX + '/meters/instance',
+                                params={'limit': 1,
+                                        'fields': 'counter_volume',
+                                        })
+        self.assertEqual(response.json, [{'counter_volume': 1.0}])
+        self.assert_('fields=counter_volume' in response.headers['Link'])
+
+    def test_invalid_fields(self):
+        response = self.get_json('/meters/instance', expect_errors=True,
+                                 fields='counter_volume,no_such_field')
+        self.assertEqual(response.status_int, 400)
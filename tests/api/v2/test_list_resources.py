@@ -244,3 +244,26 @@ class TestListResources(FunctionalTest):
             [('display_name', 'test-server'),
              ('tag', 'self.counter'),
              ])
+
+    def test_fields(self):
+        counter1 = counter.Counter(
+            'instance',
+            'cumulative',
+            '',
+            1,
+            'user-id',
+            'project-id',
+            'resource-id',
+            timestamp=datetime.datetime(2012, 7, 2, 10, 40),
+            resource_metadata={'display_name': 'test-server'},
+        )
+        msg = meter.meter_message_from_counter(counter1,
+                                               cfg.CONF.metering_secret,
+                                               'test',
+                                               )
+        self.conn.record_metering_data(msg)
+
+        data = self.get_json('/resources', fields='project_id')
+        self.assertEqual(data, [{'resource_id': 'resource-id',
+                                 'project_id': 'project-id',
+                                 }])
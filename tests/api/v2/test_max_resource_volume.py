@@ -62,8 +62,8 @@ class TestMaxResourceVolume(FunctionalTest):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
                                             'value': 'resource-id',
                                             }])
-        assert data['max'] == 7
-        assert data['count'] == 3
+        assert data[0]['max'] == 7
+        assert data[0]['count'] == 3
 
     def test_start_timestamp(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -74,8 +74,8 @@ class TestMaxResourceVolume(FunctionalTest):
                                             'value': '2012-09-25T11:30:00',
                                             },
                                            ])
-        assert data['max'] == 7
-        assert data['count'] == 2
+        assert data[0]['max'] == 7
+        assert data[0]['count'] == 2
 
     def test_start_timestamp_after(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -86,8 +86,8 @@ class TestMaxResourceVolume(FunctionalTest):
                                             'value': '2012-09-25T12:34:00',
                                             },
                                            ])
-        assert data['max'] is None
-        assert data['count'] == 0
+        assert data[0]['max'] is None
+        assert data[0]['count'] == 0
 
     def test_end_timestamp(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -98,8 +98,8 @@ class TestMaxResourceVolume(FunctionalTest):
                                             'value': '2012-09-25T11:30:00',
                                             },
                                            ])
-        assert data['max'] == 5
-        assert data['count'] == 1
+        assert data[0]['max'] == 5
+        assert data[0]['count'] == 1
 
     def test_end_timestamp_before(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -110,8 +110,8 @@ class TestMaxResourceVolume(FunctionalTest):
                                             'value': '2012-09-25T09:54:00',
                                             },
                                            ])
-        assert data['max'] is None
-        assert data['count'] == 0
+        assert data[0]['max'] is None
+        assert data[0]['count'] == 0
 
     def test_start_end_timestamp(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -126,5 +126,5 @@ class TestMaxResourceVolume(FunctionalTest):
                                             'value': '2012-09-25T11:32:00',
                                             },
                                            ])
-        assert data['max'] == 6
-        assert data['count'] == 1
+        assert data[0]['max'] == 6
+        assert data[0]['count'] == 1
@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Test paginating the listings with limit and marker.
+"""
+
+import datetime
+import logging
+import re
+
+from ceilometer.collector import meter
+from ceilometer import counter
+from ceilometer.openstack.common import cfg
+
+from .base import FunctionalTest
+
+LOG = logging.getLogger(__name__)
+
+
+class TestPagination(FunctionalTest):
+
+    def setUp(self):
+        super(TestPagination, self).setUp()
+        for i, name in enumerate(['instance', 'instance', 'instance',
+                                  'cpu']):
+            c = counter.Counter(
+                name,
+                'cumulative',
+                '',
+                1,
+                'user-id',
+                'project-id',
+                'resource-id-%d' % (i % 3),
+                timestamp=datetime.datetime(2012, 7, 2, 10, 40 + i),
+                resource_metadata={'display_name': 'test-server'},
+            )
+            msg = meter.meter_message_from_counter(c,
+                                                   cfg.CONF.metering_secret,
+                                                   'test_source',
+                                                   )
+            self.conn.record_metering_data(msg)
+
+    def _get_pages(self, path, limit):
+        """Follow the next links from the first page of path and
+        return the list of the pages.
+        """
+        pages = []
+        url = self.PATH_PREFIX + path + '?limit=%d' % limit
+        while url:
+            response = self.app.get(url)
+            pages.append(response.json)
+            link = response.headers.get('Link')
+            if link is None:
+                break
+            match = re.match(r'<http://[^/]*(.*)>; rel="next"$', link)
+            assert match, link
+            url = match.group(1)
+        return pages
+
+    def test_events(self):
+        pages = self._get_pages('/meters/instance', 2)
+        assert [len(p) for p in pages] == [2, 1]
+        timestamps = [e['timestamp'] for p in pages for e in p]
+        assert timestamps == ['2012-07-02T10:40:00',
+                              '2012-07-02T10:41:00',
+                              '2012-07-02T10:42:00',
+                              ]
+
+    def test_events_keep_query(self):
+        response = self.app.get(self.PATH_PREFIX + '/meters/instance',
+                                params={'limit': 1,
+                                        'q.field': 'resource_id',
+                                        'q.op': 'eq',
+                                        'q.value': 'resource-id-0',
+                                        })
+        assert len(response.json) == 1
+        link = response.headers['Link']
+        assert 'q.field=resource_id' in link
+        assert 'q.value=resource-id-0' in link
+        assert 'limit=1' in link
+
+    def test_meters(self):
+        pages = self._get_pages('/meters', 3)
+        assert [len(p) for p in pages] == [3, 1]
+        meters = [(m['resource_id'], m['name']) for p in pages for m in p]
+        assert meters == [('resource-id-0', 'cpu'),
+                          ('resource-id-0', 'instance'),
+                          ('resource-id-1', 'instance'),
+                          ('resource-id-2', 'instance'),
+                          ]
+
+    def test_resources(self):
+        pages = self._get_pages('/resources', 1)
+        # The last page is empty, as the previous one was full.
+        assert [len(p) for p in pages] == [1, 1, 1, 0]
+        ids = [r['resource_id'] for p in pages for r in p]
+        assert ids == ['resource-id-0', 'resource-id-1', 'resource-id-2']
+
+    def test_no_limit(self):
+        response = self.app.get(self.PATH_PREFIX + '/resources')
+        assert len(response.json) == 3
+        assert 'Link' not in response.headers
+
+    def test_invalid_limit(self):
+        response = self.get_json('/resources', expect_errors=True, limit=0)
+        assert response.status_int == 400
+
+    def test_invalid_marker(self):
+        response = self.get_json('/meters/instance', expect_errors=True,
+                                 limit=1, marker='not-a-marker')
+        assert response.status_int == 400
@@ -0,0 +1,69 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Test the period parameter of the statistics API.
+"""
+
+import datetime
+import logging
+
+from ceilometer.storage import impl_test
+from .base import FunctionalTest
+
+LOG = logging.getLogger(__name__)
+
+
+class TestStatisticsPeriod(FunctionalTest):
+
+    PATH = '/meters/instance/statistics'
+
+    def setUp(self):
+        super(TestStatisticsPeriod, self).setUp()
+        self.periods = []
+
+        def get_statistics(ignore_self, event_filter, period=None):
+            self.periods.append(period)
+            start = datetime.datetime(2012, 8, 28, 0, 0)
+            return [{'count': 1,
+                     'min': i,
+                     'max': i,
+                     'avg': i,
+                     'sum': i,
+                     'duration': None,
+                     'duration_start': start + datetime.timedelta(hours=i),
+                     'duration_end': start + datetime.timedelta(hours=i),
+                     'period': period,
+                     'period_start': start + datetime.timedelta(hours=i),
+                     'period_end': start + datetime.timedelta(hours=i + 1),
+                     }
+                    for i in range(3)]
+        self.stubs.Set(impl_test.TestConnection,
+                       'get_meter_statistics',
+                       get_statistics)
+
+    def test_period(self):
+        data = self.get_json(self.PATH, period=3600)
+        assert self.periods == [3600]
+        assert [d['sum'] for d in data] == [0, 1, 2]
+        assert [d['period'] for d in data] == [3600] * 3
+        assert data[1]['period_start'] == '2012-08-28T01:00:00'
+        assert data[1]['period_end'] == '2012-08-28T02:00:00'
+
+    def test_no_period(self):
+        self.get_json(self.PATH)
+        assert self.periods == [None]
+
+    def test_invalid_period(self):
+        response = self.get_json(self.PATH, expect_errors=True, period=-1)
+        assert response.status_int == 400
+        assert self.periods == []
@@ -62,8 +62,8 @@ class TestSumResourceVolume(FunctionalTest):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
                                             'value': 'resource-id',
                                             }])
-        assert data['sum'] == 5 + 6 + 7
-        assert data['count'] == 3
+        assert data[0]['sum'] == 5 + 6 + 7
+        assert data[0]['count'] == 3
 
     def test_start_timestamp(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -73,8 +73,8 @@ class TestSumResourceVolume(FunctionalTest):
                                             'op': 'ge',
                                             'value': '2012-09-25T11:30:00',
                                             }])
-        assert data['sum'] == 6 + 7
-        assert data['count'] == 2
+        assert data[0]['sum'] == 6 + 7
+        assert data[0]['count'] == 2
 
     def test_start_timestamp_after(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -84,8 +84,8 @@ class TestSumResourceVolume(FunctionalTest):
                                             'op': 'ge',
                                             'value': '2012-09-25T12:34:00',
                                             }])
-        assert data['sum'] is None
-        assert data['count'] == 0
+        assert data[0]['sum'] is None
+        assert data[0]['count'] == 0
 
     def test_end_timestamp(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -95,8 +95,8 @@ class TestSumResourceVolume(FunctionalTest):
                                             'op': 'le',
                                             'value': '2012-09-25T11:30:00',
                                             }])
-        assert data['sum'] == 5
-        assert data['count'] == 1
+        assert data[0]['sum'] == 5
+        assert data[0]['count'] == 1
 
     def test_end_timestamp_before(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -106,8 +106,8 @@ class TestSumResourceVolume(FunctionalTest):
                                             'op': 'le',
                                             'value': '2012-09-25T09:54:00',
                                             }])
-        assert data['sum'] is None
-        assert data['count'] == 0
+        assert data[0]['sum'] is None
+        assert data[0]['count'] == 0
 
     def test_start_end_timestamp(self):
         data = self.get_json(self.PATH, q=[{'field': 'resource_id',
@@ -121,5 +121,5 @@ class TestSumResourceVolume(FunctionalTest):
                                             'op': 'lt',
                                             'value': '2012-09-25T11:32:00',
                                             }])
-        assert data['sum'] == 6
-        assert data['count'] == 1
+        assert data[0]['sum'] == 6
+        assert data[0]['count'] == 1
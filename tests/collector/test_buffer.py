@@ -0,0 +1,209 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/collector/buffer.py
+"""
+
+import eventlet
+from eventlet import event
+
+from ceilometer.collector import buffer
+from ceilometer.tests import base
+
+
+class TestSampleBuffer(base.TestCase):
+
+    def setUp(self):
+        super(TestSampleBuffer, self).setUp()
+        self.batches = []
+
+    def _writer(self, samples):
+        self.batches.append(samples)
+
+    def test_flush_on_size(self):
+        buf = buffer.SampleBuffer(self._writer, 3, 60)
+        waiters = [eventlet.spawn(buf.add, i) for i in range(3)]
+        for w in waiters:
+            w.wait()
+        self.assertEqual(self.batches, [[0, 1, 2]])
+        self.assertEqual(buf.depth, 0)
+
+    def test_add_waits_for_flush(self):
+        buf = buffer.SampleBuffer(self._writer, 3, 60)
+        waiter = eventlet.spawn(buf.add, 'a')
+        eventlet.sleep(0)
+        self.assertEqual(buf.depth, 1)
+        self.assertFalse(waiter.dead)
+        buf.flush()
+        waiter.wait()
+        self.assertEqual(self.batches, [['a']])
+
+    def test_flush_on_interval(self):
+        buf = buffer.SampleBuffer(self._writer, 100, 0.01)
+        buf.add('a')
+        self.assertEqual(self.batches, [['a']])
+
+    def test_flush_empty(self):
+        buf = buffer.SampleBuffer(self._writer, 100, 60)
+        buf.flush()
+        self.assertEqual(self.batches, [])
+        self.assertEqual(buf.flush_count, 0)
+
+    def test_writer_error_raised_to_waiters(self):
+        def writer(samples):
+            raise RuntimeError('storage is down')
+        buf = buffer.SampleBuffer(writer, 1, 60)
+        self.assertRaises(RuntimeError, buf.add, 'a')
+        self.assertEqual(buf.flush_count, 1)
+        self.assertEqual(buf.stats()['lost_count'], 1)
+
+    def test_writer_error_retries_one_by_one(self):
+        def writer(samples):
+            raise RuntimeError('bad batch')
+
+        def single_writer(sample):
+            if sample == 'bad':
+                raise ValueError('bad sample')
+            self.batches.append([sample])
+        buf = buffer.SampleBuffer(writer, 3, 60, single_writer)
+        waiters = [eventlet.spawn(buf.add, s) for s in ['a', 'bad', 'b']]
+        waiters[0].wait()
+        self.assertRaises(ValueError, waiters[1].wait)
+        waiters[2].wait()
+        self.assertEqual(self.batches, [['a'], ['b']])
+        self.assertEqual(buf.stats()['lost_count'], 1)
+
+    def test_stats(self):
+        buf = buffer.SampleBuffer(self._writer, 2, 60)
+        for w in [eventlet.spawn(buf.add, i) for i in range(2)]:
+            w.wait()
+        waiter = eventlet.spawn(buf.add, 2)
+        eventlet.sleep(0)
+        stats = buf.stats()
+        self.assertEqual(stats['depth'], 1)
+        self.assertEqual(stats['flush_count'], 1)
+        self.assertEqual(stats['flush_size'], 2)
+        self.assertTrue(stats['flush_latency'] >= 0)
+        buf.flush()
+        waiter.wait()
+
+
+class TestWriterPool(base.TestCase):
+
+    def setUp(self):
+        super(TestWriterPool, self).setUp()
+        self.batches = []
+
+    def _writer(self, samples):
+        self.batches.append([s['counter_volume'] for s in samples])
+
+    @staticmethod
+    def _sample(resource_id, volume):
+        return {'resource_id': resource_id, 'counter_volume': volume}
+
+    def test_put_waits_for_write(self):
+        pool = buffer.WriterPool(self._writer, 2, 10)
+        self.addCleanup(pool.stop)
+        pool.put(self._sample('a', 1))
+        self.assertEqual(self.batches, [[1]])
+        self.assertEqual(pool.stats()['sample_count'], 1)
+
+    def test_put_many(self):
+        pool = buffer.WriterPool(self._writer, 2, 1, batch_size=10)
+        self.addCleanup(pool.stop)
+        pool.put_many([self._sample('a', i) for i in range(5)])
+        self.assertEqual([v for batch in self.batches for v in batch],
+                         range(5))
+        self.assertEqual(pool.stats()['sample_count'], 5)
+
+    def test_resource_order(self):
+        pool = buffer.WriterPool(self._writer, 4, 10, batch_size=100)
+        self.addCleanup(pool.stop)
+        waiters = [eventlet.spawn(pool.put, self._sample('a', i))
+                   for i in range(20)]
+        for w in waiters:
+            w.wait()
+        written = [v for batch in self.batches for v in batch]
+        self.assertEqual(written, range(20))
+        self.assertTrue(len(self.batches) < 20)
+
+    def test_slow_worker_does_not_block_others(self):
+        pool = buffer.WriterPool(self._writer, 2, 10)
+        self.addCleanup(pool.stop)
+        resources = {}
+        for key in ('a', 'b', 'c', 'd', 'e'):
+            resources.setdefault(pool._get_queue({'resource_id': key}),
+                                 key)
+        slow, fast = resources.values()[:2]
+        blocked = event.Event()
+
+        def writer(samples):
+            if samples[0]['resource_id'] == slow:
+                blocked.wait()
+            self._writer(samples)
+        pool.writer = writer
+
+        waiter = eventlet.spawn(pool.put, self._sample(slow, 1))
+        pool.put(self._sample(fast, 2))
+        self.assertEqual(self.batches, [[2]])
+        blocked.send()
+        waiter.wait()
+        self.assertEqual(self.batches, [[2], [1]])
+
+    def test_backpressure(self):
+        blocked = event.Event()
+
+        def writer(samples):
+            blocked.wait()
+        pool = buffer.WriterPool(writer, 1, 2)
+        self.addCleanup(pool.stop)
+        waiters = [eventlet.spawn(pool.put, self._sample('a', i))
+                   for i in range(4)]
+        eventlet.sleep(0)
+        # One sample is being written and the queue holds two more, so
+        # the last caller is still waiting to hand its sample over.
+        self.assertEqual(pool.stats()['depths'], [2])
+        blocked.send()
+        for w in waiters:
+            w.wait()
+        self.assertEqual(pool.stats()['sample_count'], 4)
+
+    def test_writer_error_raised_to_callers(self):
+        def writer(samples):
+            raise RuntimeError('storage is down')
+        pool = buffer.WriterPool(writer, 1, 10)
+        self.addCleanup(pool.stop)
+        self.assertRaises(RuntimeError, pool.put, self._sample('a', 1))
+        self.assertEqual(pool.stats()['error_count'], 1)
+
+    def test_writer_error_waits_for_all_samples(self):
+        def writer(samples):
+            if samples[0]['resource_id'] == 'a':
+                raise RuntimeError('storage is down')
+            self._writer(samples)
+        pool = buffer.WriterPool(writer, 2, 10)
+        self.addCleanup(pool.stop)
+        samples = [self._sample('a', 1), self._sample('b', 2)]
+        self.assertRaises(RuntimeError, pool.put_many, samples)
+        self.assertEqual(self.batches, [[2]])
+
+    def test_stop_writes_queued_samples(self):
+        pool = buffer.WriterPool(self._writer, 1, 10, batch_size=10)
+        waiters = [eventlet.spawn(pool.put, self._sample('a', i))
+                   for i in range(3)]
+        eventlet.sleep(0)
+        pool.stop()
+        for w in waiters:
+            w.wait()
+        self.assertEqual([v for batch in self.batches for v in batch],
+                         [0, 1, 2])
@@ -0,0 +1,86 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/collector/dispatch.py
+"""
+
+from stevedore import extension
+
+from ceilometer.collector import dispatch
+from ceilometer.tests import base
+
+
+class Handler(object):
+
+    def __init__(self, *event_types):
+        self.event_types = event_types
+        self.calls = 0
+
+    def get_event_types(self):
+        self.calls += 1
+        return list(self.event_types)
+
+
+def make_extension(name, *event_types):
+    return extension.Extension(name, None, None, Handler(*event_types))
+
+
+class TestEventTypeIndex(base.TestCase):
+
+    def setUp(self):
+        super(TestEventTypeIndex, self).setUp()
+        self.extensions = [
+            make_extension('instance', 'compute.instance.create.end',
+                           'compute.instance.exists'),
+            make_extension('compute', 'compute.instance.*'),
+            make_extension('volume', 'volume.exists', 'volume.exists'),
+            make_extension('image', 'image.send'),
+            make_extension('send', 'image.send', 'image.?pload'),
+        ]
+        self.index = dispatch.EventTypeIndex(self.extensions)
+
+    def _get_names(self, event_type):
+        return [ext.name for ext in self.index.get_handlers(event_type)]
+
+    def test_exact(self):
+        self.assertEqual(self._get_names('volume.exists'), ['volume'])
+        self.assertEqual(self._get_names('image.send'), ['image', 'send'])
+
+    def test_pattern(self):
+        self.assertEqual(self._get_names('compute.instance.exists'),
+                         ['instance', 'compute'])
+        self.assertEqual(self._get_names('compute.instance.update'),
+                         ['compute'])
+        self.assertEqual(self._get_names('image.upload'), ['send'])
+
+    def test_no_handler(self):
+        self.assertEqual(self._get_names('network.create.end'), [])
+        self.assertEqual(self._get_names(None), [])
+
+    def test_event_types_read_once(self):
+        for i in range(3):
+            self._get_names('compute.instance.exists')
+        for ext in self.extensions:
+            self.assertEqual(ext.obj.calls, 1)
+
+    def test_cache_bounded(self):
+        self.stubs.Set(dispatch.EventTypeIndex, 'CACHE_SIZE', 2)
+        for i in range(5):
+            self._get_names('unknown.%d' % i)
+        self.assertTrue(len(self.index._cache) <= 2)
+        self.assertEqual(self._get_names('volume.exists'), ['volume'])
+
+    def test_is_pattern(self):
+        self.assertTrue(dispatch.is_pattern('compute.*'))
+        self.assertTrue(dispatch.is_pattern('image.[ud]*'))
+        self.assertFalse(dispatch.is_pattern('compute.instance.exists'))
@@ -19,15 +19,20 @@
 """
 
 from datetime import datetime
+import os
 
+import eventlet
 from mock import patch
 
 from stevedore import extension
 from stevedore.tests import manager as test_manager
 
+from ceilometer.collector import buffer
+from ceilometer.collector import dispatch
 from ceilometer.collector import meter
 from ceilometer.collector import service
 from ceilometer.openstack.common import cfg
+from ceilometer.openstack.common.rpc import dispatcher as rpc_dispatcher
 from ceilometer.storage import base
 from ceilometer.tests import base as tests_base
 from ceilometer.compute import notifications
@@ -137,6 +142,206 @@ class TestCollectorService(tests_base.TestCase):
         assert not self.srv.storage_conn.called, \
             'Should not have called the storage connection'
 
+    def test_batched_messages(self):
+        cfg.CONF.set_override('collector_batch_size', 2)
+        self.addCleanup(cfg.CONF.clear_override, 'collector_batch_size')
+        msgs = []
+        for i in range(2):
+            msg = {'counter_name': 'test',
+                   'resource_id': self.id(),
+                   'counter_volume': i,
+                   }
+            msg['message_signature'] = meter.compute_signature(
+                msg,
+                cfg.CONF.metering_secret,
+            )
+            msgs.append(msg)
+
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.srv.storage_conn.record_metering_data_batch(msgs)
+        self.mox.ReplayAll()
+
+        self.srv.sample_buffer = buffer.SampleBuffer(
+            self.srv.storage_conn.record_metering_data_batch, 2, 60)
+        waiters = [eventlet.spawn(self.srv.record_metering_data,
+                                  self.ctx, msg)
+                   for msg in msgs]
+        for w in waiters:
+            w.wait()
+        self.mox.VerifyAll()
+
+    def test_writer_pool(self):
+        msgs = []
+        for i in range(2):
+            msg = {'counter_name': 'test',
+                   'resource_id': self.id(),
+                   'counter_volume': i,
+                   }
+            msg['message_signature'] = meter.compute_signature(
+                msg,
+                cfg.CONF.metering_secret,
+            )
+            msgs.append(msg)
+
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.srv.storage_conn.record_metering_data_batch([msgs[0]])
+        self.srv.storage_conn.record_metering_data_batch([msgs[1]])
+        self.mox.ReplayAll()
+
+        self.srv.writer_pool = buffer.WriterPool(
+            self.srv.storage_conn.record_metering_data_batch, 2, 10)
+        self.addCleanup(self.srv.writer_pool.stop)
+        for msg in msgs:
+            self.srv.record_metering_data(self.ctx, msg)
+        self.mox.VerifyAll()
+
+    def test_stop_flushes_storage(self):
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.srv.storage_conn.flush()
+        self.mox.ReplayAll()
+
+        self.srv.stop()
+        self.mox.VerifyAll()
+
+    def test_periodic_tasks_flush_storage(self):
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.srv.storage_conn.flush()
+        self.mox.ReplayAll()
+
+        self.srv.periodic_tasks(self.ctx)
+        self.mox.VerifyAll()
+
+    def test_stats(self):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               }
+        msg['message_signature'] = meter.compute_signature(
+            msg,
+            cfg.CONF.metering_secret,
+        )
+        invalid = dict(msg, message_signature='invalid-signature')
+
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.srv.storage_conn.record_metering_data(msg)
+        self.srv.storage_conn.record_metering_data(msg).AndRaise(
+            RuntimeError('storage is down'))
+        self.mox.ReplayAll()
+
+        self.srv.record_metering_data(self.ctx, msg)
+        self.srv.record_metering_data(self.ctx, msg)
+        self.srv.record_metering_data(self.ctx, invalid)
+        stats = self.srv.stats()
+        self.assertEqual(stats['pid'], os.getpid())
+        self.assertEqual(stats['samples'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['invalid'], 1)
+        self.assertEqual(stats['notifications'], 0)
+        self.assertFalse('writer_pool' in stats)
+
+    def test_batch_message(self):
+        msgs = []
+        for i in range(3):
+            msg = {'counter_name': 'test',
+                   'resource_id': self.id(),
+                   'counter_volume': i,
+                   'timestamp': '2012-07-02T13:53:4%dZ' % i,
+                   }
+            msg['message_signature'] = meter.compute_signature(
+                msg,
+                cfg.CONF.metering_secret,
+            )
+            msgs.append(msg)
+        msgs[1]['message_signature'] = 'invalid-signature'
+
+        expected = []
+        for i in (0, 2):
+            e = dict(msgs[i])
+            e['timestamp'] = datetime(2012, 7, 2, 13, 53, 40 + i)
+            expected.append(e)
+
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.srv.storage_conn.record_metering_data_batch(expected)
+        self.mox.ReplayAll()
+
+        self.srv.record_metering_data_batch(self.ctx, msgs)
+        self.mox.VerifyAll()
+        stats = self.srv.stats()
+        self.assertEqual(stats['samples'], 2)
+        self.assertEqual(stats['invalid'], 1)
+
+    def test_batch_message_dispatch(self):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               }
+        msg['message_signature'] = meter.compute_signature(
+            msg,
+            cfg.CONF.metering_secret,
+        )
+
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.srv.storage_conn.record_metering_data_batch([msg])
+        self.mox.ReplayAll()
+
+        dispatcher = rpc_dispatcher.RpcDispatcher([self.srv])
+        dispatcher.dispatch(self.ctx, '1.1', 'record_metering_data_batch',
+                            data=[msg])
+        self.mox.VerifyAll()
+
+    def test_batch_message_all_invalid(self):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               'message_signature': 'invalid-signature',
+               }
+
+        self.srv.storage_conn = self.mox.CreateMock(base.Connection)
+        self.mox.ReplayAll()
+
+        self.srv.record_metering_data_batch(self.ctx, [msg])
+        self.mox.VerifyAll()
+
+    def test_batch_message_writer_pool(self):
+        msgs = []
+        for i in range(3):
+            msg = {'counter_name': 'test',
+                   'resource_id': 'resource-%d' % (i % 2),
+                   'counter_volume': i,
+                   }
+            msg['message_signature'] = meter.compute_signature(
+                msg,
+                cfg.CONF.metering_secret,
+            )
+            msgs.append(msg)
+
+        written = []
+        self.srv.writer_pool = buffer.WriterPool(written.extend, 2, 10)
+        self.addCleanup(self.srv.writer_pool.stop)
+        self.srv.record_metering_data_batch(self.ctx, msgs)
+        self.assertEqual(sorted(m['counter_volume'] for m in written),
+                         [0, 1, 2])
+        self.assertEqual(self.srv.stats()['samples'], 3)
+
+    def test_writer_pool_error(self):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               }
+        msg['message_signature'] = meter.compute_signature(
+            msg,
+            cfg.CONF.metering_secret,
+        )
+
+        def writer(samples):
+            raise RuntimeError('storage is down')
+        self.srv.writer_pool = buffer.WriterPool(writer, 1, 10)
+        self.addCleanup(self.srv.writer_pool.stop)
+        self.srv.record_metering_data(self.ctx, msg)
+        stats = self.srv.stats()
+        self.assertEqual(stats['samples'], 0)
+        self.assertEqual(stats['errors'], 1)
+
     def test_timestamp_conversion(self):
         msg = {'counter_name': 'test',
                'resource_id': self.id(),
@@ -196,5 +401,20 @@ class TestCollectorService(tests_base.TestCase):
                                  notifications.Instance(),
                                  ),
              ])
+        self.srv.event_index = dispatch.EventTypeIndex(self.srv.ext_manager)
         self.srv.process_notification(TEST_NOTICE)
         self.assert_(len(results) >= 1)
+
+    def test_process_notification_ignored(self):
+        with patch('ceilometer.openstack.common.rpc.create_connection'):
+            self.srv.start()
+        results = []
+        self.stubs.Set(self.srv, 'publish_counter', results.append)
+        handler = notifications.Instance()
+        self.stubs.Set(handler, 'process_notification',
+                       lambda message: self.fail('unexpected call'))
+        self.srv.event_index = dispatch.EventTypeIndex(
+            [extension.Extension('test', None, None, handler)])
+        self.srv.process_notification(dict(TEST_NOTICE,
+                                           event_type='compute.other'))
+        self.assertEqual(results, [])
@@ -18,6 +18,10 @@
 """Tests for ceilometer.meter
 """
 
+import hashlib
+import hmac
+import random
+
 from ceilometer.collector import meter
 from ceilometer import counter
 
@@ -99,6 +103,82 @@ def test_verify_signature_nested():
     assert meter.verify_signature(data, 'not-so-secret')
 
 
+def _reference_signature(message, secret):
+    """The signature as computed before the keys and values were
+    joined into one buffer, one hmac update per key and value.
+    """
+    digest_maker = hmac.new(secret, '', hashlib.sha256)
+    for name, value in meter.recursive_keypairs(message):
+        if name == 'message_signature':
+            continue
+        digest_maker.update(name)
+        digest_maker.update(unicode(value).encode('utf-8'))
+    return digest_maker.hexdigest()
+
+
+def _random_key(rand):
+    key = rand.choice(['a', 'b', 'resource_id', 'message_signature',
+                       'counter_volume', 'x:y', '', 'Z'])
+    key += str(rand.randint(0, 3)) if rand.random() < 0.5 else ''
+    return unicode(key) if rand.random() < 0.5 else key
+
+
+def _random_value(rand, depth):
+    kind = rand.randint(0, 9 if depth < 3 else 8)
+    if kind == 9:
+        return _random_message(rand, depth + 1)
+    return [None,
+            True,
+            rand.randint(-2 ** 40, 2 ** 40),
+            rand.random() * 10 ** rand.randint(-5, 20),
+            'ascii text',
+            u'unicod\xe9 \u20ac text',
+            [1, u'\xe9', {'a': 'b'}],
+            {},
+            '',
+            ][kind]
+
+
+def _random_message(rand, depth=0):
+    return dict((_random_key(rand), _random_value(rand, depth))
+                for i in range(rand.randint(0, 8)))
+
+
+def test_compute_signature_compatible():
+    rand = random.Random(1234)
+    for i in range(2000):
+        message = _random_message(rand)
+        assert (meter.compute_signature(message, 'not-so-secret') ==
+                _reference_signature(message, 'not-so-secret')), message
+
+
+def test_compute_signature_compatible_counter():
+    msg = meter.meter_message_from_counter(TEST_COUNTER, 'not-so-secret',
+                                           'src')
+    msg['resource_metadata'] = TEST_NOTICE
+    assert (meter.compute_signature(msg, 'not-so-secret') ==
+            _reference_signature(msg, 'not-so-secret'))
+
+
+def test_compute_signature_non_ascii_bytes():
+    for data in [{'a': 'caf\xc3\xa9'}, {'a': {'b': 'caf\xc3\xa9'}}]:
+        for func in [meter.compute_signature, _reference_signature]:
+            try:
+                func(data, 'not-so-secret')
+            except UnicodeDecodeError:
+                pass
+            else:
+                assert False, 'non-ascii bytes were signed'
+
+
+def test_compute_signature_nested_signature_key():
+    data = {'a': 'A', 'message_signature': {'a': 'A'}}
+    sig1 = meter.compute_signature(data, 'not-so-secret')
+    data['message_signature'] = {'a': 'B'}
+    sig2 = meter.compute_signature(data, 'not-so-secret')
+    assert sig1 != sig2
+
+
 TEST_COUNTER = counter.Counter(name='name',
                                type='typ',
                                unit='',
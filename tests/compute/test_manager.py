@@ -58,13 +58,13 @@ class TestRunTasks(base.TestCase):
             self.counters.append((manager, instance))
             return [self.test_data]
 
-    def faux_notify(self, context, msg, topic, secret, source):
-        self.notifications.append((msg, topic, secret, source))
+    def faux_notify(self, context, counters, topic, secret, source):
+        self.notifications.append((counters, topic, secret, source))
 
     def setUp(self):
         super(TestRunTasks, self).setUp()
         self.notifications = []
-        self.stubs.Set(publish, 'publish_counter', self.faux_notify)
+        self.stubs.Set(publish, 'publish_counters', self.faux_notify)
         self.mgr = manager.AgentManager()
         self.mgr.ext_manager = extension.ExtensionManager('fake',
                                                           invoke_on_load=False,
@@ -97,8 +97,25 @@ class TestRunTasks(base.TestCase):
         assert self.Pollster.counters[0][1] is self.instance
 
     def test_notifications(self):
+        # The counters of the instances are published together.
         actual = self.notifications
-        assert list(actual[0]) == [self.Pollster.test_data,
+        assert len(actual) == 1
+        assert list(actual[0]) == [[self.Pollster.test_data] * 2,
                                    cfg.CONF.metering_topic,
                                    cfg.CONF.metering_secret,
                                    cfg.CONF.counter_source]
+
+    def test_poll_instance(self):
+        self.notifications = []
+        self.mgr.poll_instance(None, self.instance)
+        assert self.notifications == [([self.Pollster.test_data],
+                                       cfg.CONF.metering_topic,
+                                       cfg.CONF.metering_secret,
+                                       cfg.CONF.counter_source)]
+
+    def test_publish_error(self):
+        def fail(*args, **kwds):
+            raise RuntimeError('broken')
+        self.stubs.Set(publish, 'publish_counters', fail)
+        self.mgr.periodic_tasks(None)
+        self.mgr.poll_instance(None, self.instance)
@@ -132,7 +132,7 @@ class TestNovaNotifier(base.TestCase):
                        lambda context, uuid, kwargs: (self.instance,
                                                       self.instance))
 
-        self.stubs.Set(publish, 'publish_counter', self.do_nothing)
+        self.stubs.Set(publish, 'publish_counters', self.do_nothing)
         agent_manager = manager.AgentManager()
         agent_manager.ext_manager = \
             test_manager.TestExtensionManager([
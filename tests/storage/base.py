@@ -27,6 +27,7 @@ from ceilometer.collector import meter
 from ceilometer import counter
 from ceilometer import storage
 from ceilometer.openstack.common import cfg
+from ceilometer.openstack.common import timeutils
 from ceilometer.tests import base as test_base
 
 
@@ -268,6 +269,45 @@ class ResourceTest(DBTestBase):
         resource_ids = [r['resource_id'] for r in resources]
         assert set(resource_ids) == set(['resource-id-2'])
 
+    def test_get_resources_by_resource_and_timestamp(self):
+        start_ts = datetime.datetime(2012, 7, 2, 10, 40)
+        resources = list(self.conn.get_resources(resource='resource-id',
+                                                 start_timestamp=start_ts))
+        assert [r['resource_id'] for r in resources] == ['resource-id']
+        end_ts = datetime.datetime(2012, 7, 2, 10, 42)
+        resources = list(self.conn.get_resources(resource='resource-id-2',
+                                                 end_timestamp=end_ts))
+        assert resources == []
+
+    def test_get_resources_sample_range(self):
+        late = dict(self.msg1,
+                    timestamp=datetime.datetime(2012, 7, 2, 10, 35),
+                    message_id='late-message')
+        self.conn.record_metering_data(late)
+        resources = list(self.conn.get_resources(resource='resource-id'))
+        assert resources[0]['first_sample_timestamp'] == \
+            datetime.datetime(2012, 7, 2, 10, 35)
+        assert resources[0]['last_sample_timestamp'] == \
+            datetime.datetime(2012, 7, 2, 10, 40)
+
+    def test_get_resources_spanning_timestamps(self):
+        # resource-id reports before and after the range but not
+        # during it, resource-id-2 reports before, during and after.
+        for msg, minute in [(self.msgs[0], 45),
+                            (self.msgs[3], 39),
+                            (self.msgs[3], 44)]:
+            self.conn.record_metering_data(dict(
+                msg,
+                timestamp=datetime.datetime(2012, 7, 2, 10, minute),
+                message_id='%s-%d' % (msg['message_id'], minute)))
+        start_ts = datetime.datetime(2012, 7, 2, 10, 41)
+        end_ts = datetime.datetime(2012, 7, 2, 10, 43)
+        resources = list(self.conn.get_resources(start_timestamp=start_ts,
+                                                 end_timestamp=end_ts))
+        resource_ids = [r['resource_id'] for r in resources]
+        assert set(resource_ids) == set(['resource-id-2',
+                                         'resource-id-alternate'])
+
     def test_get_resources_by_source(self):
         resources = list(self.conn.get_resources(source='test-1'))
         assert len(resources) == 1
@@ -302,6 +342,38 @@ class ResourceTest(DBTestBase):
         #                  self.conn.get_resources,
         #                  metaquery=q)
 
+    def test_get_resources_fields(self):
+        resources = list(self.conn.get_resources(
+            user='user-id', fields=['project_id', 'meter']))
+        assert resources == [{'resource_id': 'resource-id',
+                              'project_id': 'project-id',
+                              'meter': [{'counter_name': 'instance',
+                                         'counter_type': 'cumulative',
+                                         'counter_unit': '',
+                                         }],
+                              }]
+
+    def test_get_resources_limit(self):
+        results = list(self.conn.get_resources(limit=2))
+        assert [r['resource_id'] for r in results] == [
+            'resource-id',
+            'resource-id-2',
+        ]
+        assert results[0]['meter']
+
+    def test_get_resources_marker(self):
+        results = list(self.conn.get_resources(limit=2,
+                                               marker='resource-id-2'))
+        assert [r['resource_id'] for r in results] == [
+            'resource-id-3',
+            'resource-id-alternate',
+        ]
+
+    def test_get_resources_marker_with_resource(self):
+        results = list(self.conn.get_resources(resource='resource-id',
+                                               marker='resource-id'))
+        assert results == []
+
 
 class MeterTest(DBTestBase):
 
@@ -328,6 +400,65 @@ class MeterTest(DBTestBase):
             got_not_imp = True
             self.assertTrue(got_not_imp)
 
+    def test_get_meters_distinct(self):
+        c = counter.Counter(
+            'instance',
+            counter.TYPE_CUMULATIVE,
+            unit='',
+            volume=1,
+            user_id='user-id',
+            project_id='project-id',
+            resource_id='resource-id',
+            timestamp=datetime.datetime(2012, 7, 2, 11, 40),
+            resource_metadata={'display_name': 'test-server'},
+        )
+        msg = meter.meter_message_from_counter(c,
+                                               cfg.CONF.metering_secret,
+                                               'test-1',
+                                               )
+        self.conn.record_metering_data(msg)
+        results = list(self.conn.get_meters(resource='resource-id'))
+        assert len(results) == 1
+        assert results[0]['name'] == 'instance'
+        assert results[0]['type'] == counter.TYPE_CUMULATIVE
+        assert results[0]['user_id'] == 'user-id'
+        assert results[0]['project_id'] == 'project-id'
+
+    def test_get_meters_pages(self):
+        self.conn.record_metering_data(meter.meter_message_from_counter(
+            counter.Counter('cpu',
+                            counter.TYPE_CUMULATIVE,
+                            unit='ns',
+                            volume=1,
+                            user_id='user-id',
+                            project_id='project-id',
+                            resource_id='resource-id',
+                            timestamp=datetime.datetime(2012, 7, 2, 10, 45),
+                            resource_metadata={},
+                            ),
+            cfg.CONF.metering_secret,
+            'test-1',
+        ))
+        pages = []
+        marker = None
+        while True:
+            page = list(self.conn.get_meters(limit=2, marker=marker))
+            if not page:
+                break
+            assert len(page) <= 2
+            pages.append(page)
+            last = page[-1]
+            marker = (last['resource_id'], last['name'], last['type'],
+                      last['unit'])
+        assert len(pages) == 3
+        results = [(m['resource_id'], m['name']) for p in pages for m in p]
+        assert results == [('resource-id', 'cpu'),
+                           ('resource-id', 'instance'),
+                           ('resource-id-2', 'instance'),
+                           ('resource-id-3', 'instance'),
+                           ('resource-id-alternate', 'instance'),
+                           ]
+
 
 class RawEventTest(DBTestBase):
 
@@ -366,6 +497,29 @@ class RawEventTest(DBTestBase):
             got_not_imp = True
             self.assertTrue(got_not_imp)
 
+    def test_get_raw_events_fields(self):
+        f = storage.EventFilter(user='user-id')
+        results = list(self.conn.get_raw_events(
+            f, fields=['counter_volume', 'timestamp']))
+        assert sorted(results) == sorted(
+            {'counter_volume': m['counter_volume'],
+             'timestamp': m['timestamp']}
+            for m in [self.msg1, self.msg2])
+
+    def test_get_raw_events_fields_source(self):
+        f = storage.EventFilter(user='user-id', limit=1)
+        results = list(self.conn.get_raw_events(f, fields=['source']))
+        assert results == [{'source': self.msg1['source']}]
+
+    def test_get_events_by_metaquery_tag(self):
+        q = {'metadata.tag': 'self.counter2'}
+        f = storage.EventFilter(metaquery=q)
+        try:
+            results = list(self.conn.get_raw_events(f))
+        except NotImplementedError:
+            return
+        assert results == [self.msg2]
+
     def test_get_raw_events_by_start_time(self):
         f = storage.EventFilter(
             user='user-id',
@@ -411,6 +565,117 @@ class RawEventTest(DBTestBase):
         assert results
         assert len(results) == 1
 
+    def test_get_raw_events_limit(self):
+        f = storage.EventFilter(limit=2)
+        results = list(self.conn.get_raw_events(f))
+        assert results == [self.msg1, min(self.msg2, self.msg3,
+                                          key=lambda m: m['message_id'])]
+
+    def test_get_raw_events_pages(self):
+        expected = sorted(self.msgs,
+                          key=lambda m: (m['timestamp'], m['message_id']))
+        results = []
+        marker = None
+        while True:
+            f = storage.EventFilter(limit=2, marker=marker)
+            page = list(self.conn.get_raw_events(f))
+            if not page:
+                break
+            assert len(page) <= 2
+            results.extend(page)
+            marker = (page[-1]['timestamp'], page[-1]['message_id'])
+        assert results == expected
+
+
+class ClearExpiredDataTest(DBTestBase):
+
+    def setUp(self):
+        super(ClearExpiredDataTest, self).setUp()
+        timeutils.set_time_override(datetime.datetime(2012, 7, 2, 10, 45))
+        self.addCleanup(timeutils.clear_time_override)
+
+    def test_clear_expired_metering_data(self):
+        self.conn.clear_expired_metering_data(3 * 60)
+        f = storage.EventFilter()
+        results = list(self.conn.get_raw_events(f))
+        assert sorted(r['resource_id'] for r in results) == [
+            'resource-id-2',
+            'resource-id-3',
+        ]
+        results = list(self.conn.get_resources())
+        assert sorted(r['resource_id'] for r in results) == [
+            'resource-id-2',
+            'resource-id-3',
+        ]
+
+    def test_nothing_expired(self):
+        self.conn.clear_expired_metering_data(60 * 60)
+        f = storage.EventFilter()
+        assert len(list(self.conn.get_raw_events(f))) == 5
+        assert len(list(self.conn.get_resources())) == 4
+
+    def test_record_after_clear(self):
+        self.conn.clear_expired_metering_data(3 * 60)
+        self.conn.record_metering_data(self.msg1)
+        results = list(self.conn.get_resources(resource='resource-id'))
+        assert len(results) == 1
+
+
+class RecordBatchTest(DBTestBase):
+
+    def prepare_data(self):
+        self.batch = []
+        for i, (name, source) in enumerate([('cpu', 'batch-1'),
+                                            ('cpu', 'batch-2'),
+                                            ('memory', 'batch-1')]):
+            c = counter.Counter(
+                name,
+                counter.TYPE_GAUGE,
+                unit='',
+                volume=i,
+                user_id='user-batch',
+                project_id='project-batch',
+                resource_id='resource-batch',
+                timestamp=datetime.datetime(2012, 7, 2, 10, 40 + i),
+                resource_metadata={'display_name': 'test-server',
+                                   'tag': 'batch-%s' % i,
+                                   }
+            )
+            msg = meter.meter_message_from_counter(c,
+                                                   cfg.CONF.metering_secret,
+                                                   source)
+            self.batch.append(msg)
+        self.conn.record_metering_data_batch(self.batch)
+
+    def test_raw_events(self):
+        f = storage.EventFilter(resource='resource-batch')
+        results = list(self.conn.get_raw_events(f))
+        assert len(results) == 3
+        for result in results:
+            assert result in self.batch
+
+    def test_user_sources(self):
+        user_sources = self.get_sources_by_user_id('user-batch')
+        assert set(user_sources) == set(['batch-1', 'batch-2'])
+
+    def test_project_sources(self):
+        project_sources = self.get_sources_by_project_id('project-batch')
+        assert set(project_sources) == set(['batch-1', 'batch-2'])
+
+    def test_resource_uses_last_sample(self):
+        resources = list(self.conn.get_resources(resource='resource-batch'))
+        assert len(resources) == 1
+        resource = resources[0]
+        assert resource['metadata']['tag'] == 'batch-2'
+        assert resource['timestamp'] == datetime.datetime(2012, 7, 2, 10, 42)
+        names = set(m['counter_name'] for m in resource['meter'])
+        assert names == set(['cpu', 'memory'])
+
+    def test_empty_batch(self):
+        self.conn.record_metering_data_batch([])
+        f = storage.EventFilter(resource='resource-batch')
+        assert len(list(self.conn.get_raw_events(f))) == 3
+
 
 class SumTest(DBTestBase):
 
@@ -768,13 +1033,24 @@ class StatisticsTest(DBTestBase):
             user='user-5',
             meter='volume.size',
         )
-        results = self.conn.get_meter_statistics(f)
+        results = self.conn.get_meter_statistics(f)[0]
         assert results['count'] == 3
         assert results['min'] == 8
         assert results['max'] == 10
         assert results['sum'] == 27
         assert results['avg'] == 9
 
+    def test_fractional_avg(self):
+        f = storage.EventFilter(
+            meter='volume.size',
+            resource='resource-id',
+            end=datetime.datetime(2012, 9, 25, 12, 0),
+        )
+        results = self.conn.get_meter_statistics(f)[0]
+        assert results['count'] == 2
+        assert results['sum'] == 11
+        assert results['avg'] == 5.5
+
     def test_by_project(self):
         f = storage.EventFilter(
             meter='volume.size',
@@ -782,7 +1058,7 @@ class StatisticsTest(DBTestBase):
             start='2012-09-25T11:30:00',
             end='2012-09-25T11:32:00',
         )
-        results = self.conn.get_meter_statistics(f)
+        results = self.conn.get_meter_statistics(f)[0]
         assert results['count'] == 1
         assert results['min'] == 6
         assert results['max'] == 6
@@ -794,9 +1070,295 @@ class StatisticsTest(DBTestBase):
             user='user-id',
             meter='volume.size',
         )
-        results = self.conn.get_meter_statistics(f)
+        results = self.conn.get_meter_statistics(f)[0]
         assert results['count'] == 3
         assert results['min'] == 5
         assert results['max'] == 7
         assert results['sum'] == 18
         assert results['avg'] == 6
+
+    def test_no_period(self):
+        f = storage.EventFilter(
+            user='user-5',
+            meter='volume.size',
+            start='2012-09-25T10:28:00',
+        )
+        results = self.conn.get_meter_statistics(f)
+        assert len(results) == 1
+        assert results[0]['period'] == 0
+        assert results[0]['period_start'] == datetime.datetime(2012, 9, 25,
+                                                               10, 28)
+        assert results[0]['period_end'] == datetime.datetime(2012, 9, 25,
+                                                             12, 32)
+
+    def test_no_period_empty(self):
+        f = storage.EventFilter(
+            user='user-none',
+            meter='volume.size',
+        )
+        results = self.conn.get_meter_statistics(f)
+        assert len(results) == 1
+        assert results[0]['count'] == 0
+        assert results[0]['sum'] is None
+
+    def test_period(self):
+        f = storage.EventFilter(
+            user='user-5',
+            meter='volume.size',
+            start='2012-09-25T10:28:00',
+        )
+        results = self.conn.get_meter_statistics(f, period=7200)
+        assert len(results) == 2
+        assert [r['period'] for r in results] == [7200, 7200]
+        assert results[0]['period_start'] == datetime.datetime(2012, 9, 25,
+                                                               10, 28)
+        assert results[0]['period_end'] == datetime.datetime(2012, 9, 25,
+                                                             12, 28)
+        assert results[0]['count'] == 2
+        assert results[0]['sum'] == 17
+        assert results[0]['min'] == 8
+        assert results[0]['max'] == 9
+        assert results[0]['duration_start'] == datetime.datetime(2012, 9, 25,
+                                                                 10, 30)
+        assert results[0]['duration_end'] == datetime.datetime(2012, 9, 25,
+                                                               11, 31)
+        assert results[1]['period_start'] == datetime.datetime(2012, 9, 25,
+                                                               12, 28)
+        assert results[1]['count'] == 1
+        assert results[1]['sum'] == 10
+
+    def test_period_without_start(self):
+        f = storage.EventFilter(
+            user='user-5',
+            meter='volume.size',
+        )
+        results = self.conn.get_meter_statistics(f, period=3600)
+        assert [r['period_start'] for r in results] == [
+            datetime.datetime(2012, 9, 25, 10),
+            datetime.datetime(2012, 9, 25, 11),
+            datetime.datetime(2012, 9, 25, 12),
+        ]
+        assert [r['sum'] for r in results] == [8, 9, 10]
+
+    def test_period_empty(self):
+        f = storage.EventFilter(
+            user='user-none',
+            meter='volume.size',
+        )
+        assert self.conn.get_meter_statistics(f, period=3600) == []
+
+
+class RollupTestBase(DBTestBase):
+
+    def setUp(self):
+        cfg.CONF.set_override('enable_rollups', True)
+        self.addCleanup(cfg.CONF.clear_override, 'enable_rollups')
+        super(RollupTestBase, self).setUp()
+
+    def prepare_data(self):
+        # The samples are older than the rollups started now.
+        self.conn._rollups_start = datetime.datetime(2012, 9, 1)
+        msgs = []
+        for i, timestamp in enumerate([
+                datetime.datetime(2012, 9, 24, 23, 30),
+                datetime.datetime(2012, 9, 25, 0, 10),
+                datetime.datetime(2012, 9, 25, 10, 20),
+                datetime.datetime(2012, 9, 25, 10, 50),
+                datetime.datetime(2012, 9, 25, 23, 59),
+                datetime.datetime(2012, 9, 26, 0, 0),
+                datetime.datetime(2012, 9, 26, 1, 30),
+        ]):
+            c = counter.Counter(
+                'volume.size',
+                'gauge',
+                'GiB',
+                i + 1,
+                'user-id',
+                'project1',
+                'resource-%d' % (i % 2),
+                timestamp=timestamp,
+                resource_metadata={},
+            )
+            msgs.append(meter.meter_message_from_counter(c,
+                                                         'not-so-secret',
+                                                         'test'))
+        # Add to the same buckets in a batch and one sample at a time.
+        self.conn.record_metering_data_batch(msgs[:4])
+        for msg in msgs[4:]:
+            self.conn.record_metering_data(msg)
+
+
+class RollupTest(RollupTestBase):
+
+    def setUp(self):
+        super(RollupTest, self).setUp()
+
+        def no_raw_events(event_filter):
+            raise AssertionError('raw events read for %s - %s' %
+                                 (event_filter.start, event_filter.end))
+        self.stubs.Set(self.conn, '_summarize_events', no_raw_events)
+
+    def test_hourly_rollups(self):
+        f = storage.EventFilter(meter='volume.size')
+        results = sorted(self.conn._get_rollups(
+            f, 3600,
+            datetime.datetime(2012, 9, 25, 10),
+            datetime.datetime(2012, 9, 25, 11)))
+        assert results == [
+            ('resource-0', {'count': 1, 'sum': 3, 'min': 3, 'max': 3,
+                            'first': datetime.datetime(2012, 9, 25, 10, 20),
+                            'last': datetime.datetime(2012, 9, 25, 10, 20),
+                            }),
+            ('resource-1', {'count': 1, 'sum': 4, 'min': 4, 'max': 4,
+                            'first': datetime.datetime(2012, 9, 25, 10, 50),
+                            'last': datetime.datetime(2012, 9, 25, 10, 50),
+                            }),
+        ]
+
+    def test_statistics(self):
+        f = storage.EventFilter(
+            meter='volume.size',
+            start=datetime.datetime(2012, 9, 25),
+            end=datetime.datetime(2012, 9, 26),
+        )
+        results = self.conn.get_meter_statistics(f)
+        assert len(results) == 1
+        assert results[0]['count'] == 4
+        assert results[0]['sum'] == 14
+        assert results[0]['min'] == 2
+        assert results[0]['max'] == 5
+        assert results[0]['avg'] == 3.5
+        assert results[0]['duration_start'] == datetime.datetime(2012, 9, 25,
+                                                                 0, 10)
+        assert results[0]['duration_end'] == datetime.datetime(2012, 9, 25,
+                                                               23, 59)
+        assert results[0]['period_start'] == datetime.datetime(2012, 9, 25)
+        assert results[0]['period_end'] == datetime.datetime(2012, 9, 26)
+
+    def test_statistics_empty(self):
+        f = storage.EventFilter(
+            meter='volume.size',
+            start=datetime.datetime(2012, 10, 1),
+            end=datetime.datetime(2012, 10, 2),
+        )
+        results = self.conn.get_meter_statistics(f)
+        assert len(results) == 1
+        assert results[0]['count'] == 0
+        assert results[0]['sum'] is None
+
+    def test_statistics_by_resource(self):
+        f = storage.EventFilter(
+            meter='volume.size',
+            resource='resource-0',
+            start=datetime.datetime(2012, 9, 24),
+            end=datetime.datetime(2012, 9, 27),
+        )
+        results = self.conn.get_meter_statistics(f)
+        assert results[0]['count'] == 4
+        assert results[0]['sum'] == 16
+
+    def test_volume_sum(self):
+        f = storage.EventFilter(
+            meter='volume.size',
+            project='project1',
+            start=datetime.datetime(2012, 9, 25, 10),
+            end=datetime.datetime(2012, 9, 25, 11),
+        )
+        results = sorted((r['resource_id'], r['value'])
+                         for r in self.conn.get_volume_sum(f))
+        assert results == [('resource-0', 3), ('resource-1', 4)]
+
+    def test_volume_max(self):
+        f = storage.EventFilter(
+            meter='volume.size',
+            start=datetime.datetime(2012, 9, 24),
+            end=datetime.datetime(2012, 9, 27),
+        )
+        results = sorted((r['resource_id'], r['value'])
+                         for r in self.conn.get_volume_max(f))
+        assert results == [('resource-0', 7), ('resource-1', 6)]
+
+    def test_not_covered(self):
+        start = datetime.datetime(2012, 9, 24)
+        end = datetime.datetime(2012, 9, 27)
+        for f in [storage.EventFilter(meter='volume.size'),
+                  storage.EventFilter(meter='volume.size', start=start),
+                  storage.EventFilter(user='user-id', meter='volume.size',
+                                      start=start, end=end),
+                  storage.EventFilter(source='test', meter='volume.size',
+                                      start=start, end=end),
+                  ]:
+            assert not self.conn._use_rollups(f)
+
+    def test_rollups_start_stored(self):
+        self.conn._rollups_start = None
+        assert self.conn._read_rollups_start() is None
+        start = self.conn._start_rollups()
+        assert start > timeutils.utcnow()
+        assert self.conn._read_rollups_start() == start
+        assert self.conn._start_rollups() == start
+
+
+class RollupEdgeTest(RollupTestBase):
+
+    def _compare(self, start, end):
+        f = storage.EventFilter(meter='volume.size', start=start, end=end)
+        results = {}
+        for enabled in (True, False):
+            self.conn._rollups_enabled = enabled
+            stats = self.conn.get_meter_statistics(f)[0]
+            results[enabled] = (
+                [stats[k] for k in ('count', 'sum', 'min', 'max',
+                                    'duration_start', 'duration_end',
+                                    'period_start', 'period_end')],
+                sorted((r['resource_id'], r['value'])
+                       for r in self.conn.get_volume_sum(f)),
+                sorted((r['resource_id'], r['value'])
+                       for r in self.conn.get_volume_max(f)),
+            )
+        assert results[True] == results[False]
+        return results[True]
+
+    def test_ragged_days(self):
+        stats, sums, maxes = self._compare(
+            datetime.datetime(2012, 9, 24, 23),
+            datetime.datetime(2012, 9, 26, 0, 45))
+        assert stats[0] == 6
+        assert sums == [('resource-0', 9), ('resource-1', 12)]
+
+    def test_ragged_hours(self):
+        stats, sums, maxes = self._compare(
+            datetime.datetime(2012, 9, 25, 10, 30),
+            datetime.datetime(2012, 9, 25, 23, 59, 30))
+        assert stats[0] == 2
+        assert maxes == [('resource-0', 5), ('resource-1', 4)]
+
+    def test_within_an_hour(self):
+        stats, sums, maxes = self._compare(
+            datetime.datetime(2012, 9, 25, 0, 5),
+            datetime.datetime(2012, 9, 25, 0, 20))
+        assert stats[0] == 1
+
+    def test_before_rollups_start(self):
+        # A sample recorded before the rollups were enabled.
+        self.conn._rollups_enabled = False
+        c = counter.Counter(
+            'volume.size', 'gauge', 'GiB', 10, 'user-id', 'project1',
+            'resource-0',
+            timestamp=datetime.datetime(2012, 9, 25, 5),
+            resource_metadata={},
+        )
+        self.conn.record_metering_data(
+            meter.meter_message_from_counter(c, 'not-so-secret', 'test'))
+        self.conn._rollups_enabled = True
+        self.conn._rollups_start = datetime.datetime(2012, 9, 25, 12)
+
+        f = storage.EventFilter(meter='volume.size',
+                                start=datetime.datetime(2012, 9, 25),
+                                end=datetime.datetime(2012, 9, 26))
+        assert self.conn._use_rollups(f)
+        stats = self.conn.get_meter_statistics(f)[0]
+        assert stats['count'] == 5
+        assert stats['sum'] == 24
+        f.end = datetime.datetime(2012, 9, 25, 12)
+        assert not self.conn._use_rollups(f)
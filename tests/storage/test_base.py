@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/storage/base.py
+"""
+
+import datetime
+
+from ceilometer.storage import base
+from ceilometer.tests import base as test_base
+
+
+class SplitRollupRangeTest(test_base.TestCase):
+
+    def test_aligned_day(self):
+        start = datetime.datetime(2012, 9, 25)
+        end = datetime.datetime(2012, 9, 27)
+        assert base.split_rollup_range(start, end) == (
+            [(86400, start, end)], [])
+
+    def test_ragged(self):
+        buckets, edges = base.split_rollup_range(
+            datetime.datetime(2012, 9, 24, 22, 30),
+            datetime.datetime(2012, 9, 26, 1, 15))
+        assert buckets == [
+            (3600,
+             datetime.datetime(2012, 9, 24, 23),
+             datetime.datetime(2012, 9, 25)),
+            (86400,
+             datetime.datetime(2012, 9, 25),
+             datetime.datetime(2012, 9, 26)),
+            (3600,
+             datetime.datetime(2012, 9, 26),
+             datetime.datetime(2012, 9, 26, 1)),
+        ]
+        assert edges == [
+            (datetime.datetime(2012, 9, 24, 22, 30),
+             datetime.datetime(2012, 9, 24, 23)),
+            (datetime.datetime(2012, 9, 26, 1),
+             datetime.datetime(2012, 9, 26, 1, 15)),
+        ]
+
+    def test_within_an_hour(self):
+        start = datetime.datetime(2012, 9, 25, 10, 5)
+        end = datetime.datetime(2012, 9, 25, 10, 55)
+        assert base.split_rollup_range(start, end) == ([], [(start, end)])
+
+    def test_empty(self):
+        start = datetime.datetime(2012, 9, 25, 10)
+        assert base.split_rollup_range(start, start) == ([], [])
+
+
+class MergeSummariesTest(test_base.TestCase):
+
+    def test_merge(self):
+        a = {'count': 2, 'sum': 3, 'min': 1, 'max': 2,
+             'first': datetime.datetime(2012, 9, 25, 10),
+             'last': datetime.datetime(2012, 9, 25, 11)}
+        b = {'count': 1, 'sum': 5, 'min': 5, 'max': 5,
+             'first': datetime.datetime(2012, 9, 25, 9),
+             'last': datetime.datetime(2012, 9, 25, 9)}
+        assert base.merge_summaries(a, b) == {
+            'count': 3, 'sum': 8, 'min': 1, 'max': 5,
+            'first': datetime.datetime(2012, 9, 25, 9),
+            'last': datetime.datetime(2012, 9, 25, 11)}
+
+    def test_merge_none(self):
+        a = {'count': 1, 'sum': 5, 'min': 5, 'max': 5,
+             'first': datetime.datetime(2012, 9, 25, 9),
+             'last': datetime.datetime(2012, 9, 25, 9)}
+        assert base.merge_summaries(None, a) == a
+        assert base.merge_summaries(a, None) == a
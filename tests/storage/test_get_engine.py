@@ -18,6 +18,7 @@
 """Tests for ceilometer/storage/
 """
 
+import mock
 import mox
 
 from ceilometer import storage
@@ -38,3 +39,60 @@ def test_get_engine_no_such_engine():
         storage.get_engine(conf)
     except RuntimeError as err:
         assert 'no-such-engine' in unicode(err)
+
+
+def _get_shared_connection(interval):
+    conf = mox.Mox().CreateMockAnything()
+    conf.database_connection = 'log://localhost'
+    conf.database_health_check_interval = interval
+    return storage.get_shared_connection(conf)
+
+
+def test_get_shared_connection():
+    storage.clear_shared_connections()
+    try:
+        conn = _get_shared_connection(10)
+        assert isinstance(conn, impl_log.Connection)
+        assert _get_shared_connection(10) is conn
+    finally:
+        storage.clear_shared_connections()
+
+
+def test_get_shared_connection_alive():
+    storage.clear_shared_connections()
+    try:
+        conn = _get_shared_connection(0)
+        with mock.patch.object(impl_log.Connection, 'is_alive',
+                               return_value=True) as is_alive:
+            assert _get_shared_connection(0) is conn
+        assert is_alive.called
+    finally:
+        storage.clear_shared_connections()
+
+
+def test_get_shared_connection_check_unlocked():
+    storage.clear_shared_connections()
+    try:
+        conn = _get_shared_connection(0)
+
+        def is_alive():
+            # Another caller can get the connection during the check.
+            assert _get_shared_connection(10) is conn
+            return True
+        with mock.patch.object(impl_log.Connection, 'is_alive',
+                               side_effect=is_alive) as check:
+            assert _get_shared_connection(0) is conn
+        assert check.call_count == 1
+    finally:
+        storage.clear_shared_connections()
+
+
+def test_get_shared_connection_reconnect():
+    storage.clear_shared_connections()
+    try:
+        conn = _get_shared_connection(0)
+        with mock.patch.object(impl_log.Connection, 'is_alive',
+                               return_value=False):
+            assert _get_shared_connection(0) is not conn
+    finally:
+        storage.clear_shared_connections()
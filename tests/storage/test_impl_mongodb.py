@@ -47,10 +47,17 @@
 """
 
 
+import datetime
+
+import mock
 import mox
 
 from tests.storage import base
+from ceilometer.collector import meter
+from ceilometer import counter
+from ceilometer.openstack.common import cfg
 from ceilometer import storage
+from ceilometer.storage import impl_mongodb
 from ceilometer.tests.db import TestConnection, require_map_reduce
 
 
@@ -95,6 +102,330 @@ class IndexTest(MongoDBEngineTestBase):
                                                      name='meter_idx')
 
 
+class KeyCacheTest(MongoDBEngineTestBase):
+
+    def _make_message(self, resource_id, name='instance'):
+        c = counter.Counter(
+            name,
+            counter.TYPE_CUMULATIVE,
+            unit='',
+            volume=1,
+            user_id='user-id',
+            project_id='project-id',
+            resource_id=resource_id,
+            timestamp=datetime.datetime(2012, 7, 2, 10, 40),
+            resource_metadata={'display_name': 'test-server'},
+        )
+        return meter.meter_message_from_counter(c,
+                                                cfg.CONF.metering_secret,
+                                                'test-1')
+
+    def _count_updates(self, collection):
+        calls = []
+        update = collection.update
+
+        def counting_update(*args, **kwds):
+            calls.append(args)
+            return update(*args, **kwds)
+        self.stubs.Set(collection, 'update', counting_update)
+        return calls
+
+    def test_known_user_and_project_skipped(self):
+        user_calls = self._count_updates(self.engine.db.user)
+        project_calls = self._count_updates(self.engine.db.project)
+        self.conn.record_metering_data(self._make_message('resource-id'))
+        assert user_calls == []
+        assert project_calls == []
+
+    def test_new_source_written(self):
+        user_calls = self._count_updates(self.engine.db.user)
+        msg = self._make_message('resource-id')
+        msg['source'] = 'test-new'
+        self.conn.record_metering_data(msg)
+        assert len(user_calls) == 1
+        assert 'test-new' in self.get_sources_by_user_id('user-id')
+
+    def test_known_resource_meter_skipped(self):
+        resource_calls = self._count_updates(self.engine.db.resource)
+        self.conn.record_metering_data(self._make_message('resource-id'))
+        assert len(resource_calls) == 1
+        assert '$addToSet' not in resource_calls[0][1]
+
+    def test_new_resource_meter_written(self):
+        resource_calls = self._count_updates(self.engine.db.resource)
+        self.conn.record_metering_data(self._make_message('resource-id',
+                                                          'cpu'))
+        assert len(resource_calls) == 1
+        assert '$addToSet' in resource_calls[0][1]
+
+    def test_coalesced_resource_updates(self):
+        cfg.CONF.set_override('mongodb_resource_flush_interval', 3600)
+        self.addCleanup(cfg.CONF.clear_override,
+                        'mongodb_resource_flush_interval')
+        self.conn.record_metering_data(self._make_message('resource-new'))
+        self.conn.record_metering_data(self._make_message('resource-new',
+                                                          'cpu'))
+        assert self.engine.db.resource.find_one('resource-new') is None
+        resources = list(self.conn.get_resources(resource='resource-new'))
+        assert len(resources) == 1
+        names = set(m['counter_name'] for m in resources[0]['meter'])
+        assert names == set(['instance', 'cpu'])
+
+    def test_flush_coalesced_resource_updates(self):
+        cfg.CONF.set_override('mongodb_resource_flush_interval', 3600)
+        self.addCleanup(cfg.CONF.clear_override,
+                        'mongodb_resource_flush_interval')
+        self.conn.record_metering_data(self._make_message('resource-new'))
+        assert self.conn.flush_interval == 3600
+        self.conn.flush()
+        assert self.engine.db.resource.find_one('resource-new') is not None
+
+
+class SampleRangeTest(MongoDBEngineTestBase):
+
+    def test_min_max_update(self):
+        self.conn._min_max_supported = True
+        with mock.patch.object(self.conn.db.resource, 'update') as update:
+            self.conn.record_metering_data(self.msg1)
+        update.assert_called_once_with({'_id': 'resource-id'}, mock.ANY,
+                                       upsert=True)
+        doc = update.call_args[0][1]
+        assert doc['$min'] == {'first_sample_timestamp': self.msg1[
+            'timestamp']}
+        assert doc['$max'] == {'last_sample_timestamp': self.msg1[
+            'timestamp']}
+
+    def test_upgrade(self):
+        self.engine.db.resource.update(
+            {}, {'$unset': {'first_sample_timestamp': 1,
+                            'last_sample_timestamp': 1}},
+            multi=True)
+        resource = self.engine.db.resource.find_one('resource-id-alternate')
+        assert 'first_sample_timestamp' not in resource
+        self.conn._known_keys.clear()
+        self.conn.upgrade()
+        resource = self.engine.db.resource.find_one('resource-id-alternate')
+        assert resource['first_sample_timestamp'] == datetime.datetime(
+            2012, 7, 2, 10, 41)
+        assert resource['last_sample_timestamp'] == datetime.datetime(
+            2012, 7, 2, 10, 41)
+
+
+class MetaqueryStatsTest(MongoDBEngineTestBase):
+
+    def setUp(self):
+        super(MetaqueryStatsTest, self).setUp()
+        cfg.CONF.set_override('mongodb_record_metaqueries', True)
+        self.addCleanup(cfg.CONF.clear_override,
+                        'mongodb_record_metaqueries')
+        # The in-memory implementation keeps the indexes of the
+        # collections it clears.
+        self.addCleanup(self.conn.ensure_metaquery_indexes, 0)
+
+    def _query(self):
+        for tag in ['self.counter', 'self.counter2']:
+            f = storage.EventFilter(metaquery={'metadata.tag': tag})
+            list(self.conn.get_raw_events(f))
+        f = storage.EventFilter(metaquery={
+            'metadata.display_name': 'test-server',
+            'metadata.tag': 'self.counter',
+        })
+        list(self.conn.get_raw_events(f))
+        q = {'metadata.display_name': 'test-server'}
+        list(self.conn.get_resources(metaquery=q))
+
+    def test_report(self):
+        self._query()
+        report = self.conn.get_metaquery_report()
+        shapes = [(r['collection'], r['keys'], r['count']) for r in report]
+        assert shapes[0] == ('meter', ['resource_metadata.tag'], 2)
+        assert sorted(shapes[1:]) == [
+            ('meter', ['resource_metadata.display_name',
+                       'resource_metadata.tag'], 1),
+            ('resource', ['metadata.display_name'], 1),
+        ]
+        assert report[0]['index'] is None
+
+    def test_no_metaquery_not_recorded(self):
+        list(self.conn.get_raw_events(storage.EventFilter(user='user-id')))
+        list(self.conn.get_resources(user='user-id'))
+        assert self.conn.get_metaquery_report() == []
+
+    def test_metaquery_not_recorded_by_default(self):
+        cfg.CONF.clear_override('mongodb_record_metaqueries')
+        self._query()
+        assert self.conn.get_metaquery_report() == []
+
+    def test_ensure_indexes(self):
+        self._query()
+        created = self.conn.ensure_metaquery_indexes(1)
+        assert len(created) == 1
+        index = self.engine.db.meter.index_information()[created[0]]
+        assert index['sparse']
+        report = self.conn.get_metaquery_report()
+        assert report[0]['index'] == created[0]
+        assert self.conn.ensure_metaquery_indexes(1) == []
+
+    def test_ensure_indexes_bounded(self):
+        self._query()
+        assert len(self.conn.ensure_metaquery_indexes(3)) == 3
+        for i in range(3):
+            list(self.conn.get_resources(
+                metaquery={'metadata.display_name': 'test-server'}))
+        created = self.conn.ensure_metaquery_indexes(1)
+        assert len(created) == 0
+        prefix = impl_mongodb.Connection.METAQUERY_INDEX_PREFIX
+        indexes = [name
+                   for collection in ['meter', 'resource']
+                   for name in self.engine.db[collection].index_information()
+                   if name.startswith(prefix)]
+        assert indexes == [self.conn.get_metaquery_report()[0]['index']]
+        assert self.conn.ensure_metaquery_indexes(0) == []
+        assert not self.conn.get_metaquery_report()[0]['index']
+
+
+class AggregateTest(MongoDBEngineTestBase):
+
+    def _check_version(self, version, period=False):
+        self.conn._aggregate_supported = None
+        with mock.patch.object(self.conn, 'conn') as server:
+            server.server_info.return_value = {'versionArray': version}
+            return self.conn._use_aggregate(period)
+
+    def test_version_supported(self):
+        assert self._check_version([2, 2, 3, 0])
+        assert self._check_version([2, 4, 1, 0])
+
+    def test_version_not_supported(self):
+        assert not self._check_version([2, 0, 7, 0])
+
+    def test_period_version_supported(self):
+        assert self._check_version([2, 4, 0, 0], period=60)
+
+    def test_period_version_not_supported(self):
+        assert not self._check_version([2, 2, 3, 0], period=60)
+
+    def test_no_version(self):
+        self.conn._aggregate_supported = None
+        with mock.patch.object(self.conn, 'conn') as server:
+            server.server_info.side_effect = AttributeError()
+            assert not self.conn._use_aggregate()
+
+    def _aggregate(self, result):
+        self.conn._aggregate_supported = True
+        self.conn._aggregate_period_supported = True
+        return mock.patch.object(self.conn.db.meter, 'aggregate',
+                                 create=True,
+                                 return_value={'result': result, 'ok': 1.0})
+
+    def test_volume_sum_pipeline(self):
+        f = storage.EventFilter(meter='instance', resource='resource-id')
+        with self._aggregate([{'_id': 'resource-id', 'value': 5}]) as agg:
+            results = list(self.conn.get_volume_sum(f))
+        agg.assert_called_once_with([
+            {'$match': impl_mongodb.make_query_from_filter(f)},
+            {'$group': {'_id': '$resource_id',
+                        'value': {'$sum': '$counter_volume'}}},
+        ])
+        assert results == [{'resource_id': 'resource-id', 'value': 5}]
+
+    def test_volume_max_pipeline(self):
+        f = storage.EventFilter(meter='instance', project='project-id')
+        with self._aggregate([{'_id': 'resource-id', 'value': 7}]) as agg:
+            results = list(self.conn.get_volume_max(f))
+        pipeline = agg.call_args[0][0]
+        assert pipeline[1] == {'$group': {'_id': '$resource_id',
+                                          'value': {'$max':
+                                                    '$counter_volume'}}}
+        assert results == [{'resource_id': 'resource-id', 'value': 7}]
+
+    def test_event_interval(self):
+        start = datetime.datetime(2012, 7, 2, 10, 40)
+        end = datetime.datetime(2012, 7, 2, 12, 40)
+        f = storage.EventFilter(meter='instance')
+        with self._aggregate([{'_id': None, 'min': start, 'max': end}]):
+            assert self.conn.get_event_interval(f) == (start, end)
+
+    def test_event_interval_empty(self):
+        f = storage.EventFilter(meter='instance')
+        with self._aggregate([]):
+            assert self.conn.get_event_interval(f) == (None, None)
+
+    def test_statistics(self):
+        start = datetime.datetime(2012, 7, 2, 10, 40)
+        end = datetime.datetime(2012, 7, 2, 12, 40)
+        f = storage.EventFilter(meter='instance')
+        with self._aggregate([{'_id': None,
+                               'min': 1,
+                               'max': 3,
+                               'qty': 6,
+                               'count': 3,
+                               'timestamp_min': start,
+                               'timestamp_max': end,
+                               }]):
+            results = self.conn.get_meter_statistics(f)[0]
+        assert results['min'] == 1
+        assert results['max'] == 3
+        assert results['sum'] == 6
+        assert results['count'] == 3
+        assert results['avg'] == 2
+        assert results['duration_start'] == start
+        assert results['duration_end'] == end
+        assert results['period'] == 0
+        assert results['period_start'] == start
+        assert results['period_end'] == end
+
+    def _check_fractional_avg(self, aggregate):
+        start = datetime.datetime(2012, 7, 2, 10, 40)
+        r = {'min': 1,
+             'max': 2,
+             'qty': 3,
+             'count': 2,
+             'timestamp_min': start,
+             'timestamp_max': start,
+             }
+        f = storage.EventFilter(meter='instance')
+        self.conn._aggregate_supported = aggregate
+        if aggregate:
+            with self._aggregate([dict(r, _id=None)]):
+                results = self.conn.get_meter_statistics(f)[0]
+        else:
+            with mock.patch.object(self.conn, '_map_reduce',
+                                   return_value=[{'_id': None,
+                                                  'value': r}]):
+                results = self.conn.get_meter_statistics(f)[0]
+        assert results['avg'] == 1.5
+
+    def test_statistics_fractional_avg_aggregate(self):
+        self._check_fractional_avg(True)
+
+    def test_statistics_fractional_avg_map_reduce(self):
+        self._check_fractional_avg(False)
+
+    def test_statistics_period(self):
+        start = datetime.datetime(2012, 7, 2, 10, 40)
+        f = storage.EventFilter(meter='instance', start=start)
+        with self._aggregate([{'_id': 3600000,
+                               'min': 1,
+                               'max': 1,
+                               'qty': 1,
+                               'count': 1,
+                               'timestamp_min': start,
+                               'timestamp_max': start,
+                               }]) as agg:
+            results = self.conn.get_meter_statistics(f, period=3600)
+        offset = {'$subtract': ['$timestamp', start]}
+        group = agg.call_args[0][0][1]['$group']
+        assert group['_id'] == {'$subtract': [offset,
+                                              {'$mod': [offset, 3600000]}]}
+        assert len(results) == 1
+        assert results[0]['period'] == 3600
+        assert results[0]['period_start'] == datetime.datetime(2012, 7, 2,
+                                                               11, 40)
+        assert results[0]['period_end'] == datetime.datetime(2012, 7, 2,
+                                                             12, 40)
+
+
 class UserTest(base.UserTest, MongoDBEngineTestBase):
     pass
 
@@ -104,7 +435,64 @@ class ProjectTest(base.ProjectTest, MongoDBEngineTestBase):
 
 
 class ResourceTest(base.ResourceTest, MongoDBEngineTestBase):
-    pass
+
+    def test_get_resources_spanning_in_batches(self):
+        self.conn.SAMPLE_LOOKUP_BATCH_SIZE = 1
+        self.test_get_resources_spanning_timestamps()
+
+
+class ShardedResourceTest(base.ResourceTest, MongoDBEngineTestBase):
+
+    def setUp(self):
+        super(ShardedResourceTest, self).setUp()
+        self.conn._sharded = True
+
+    def test_get_resources_spanning_in_batches(self):
+        self.conn.SAMPLE_LOOKUP_BATCH_SIZE = 1
+        self.test_get_resources_spanning_timestamps()
+
+
+class ShardingTest(MongoDBEngineTestBase):
+
+    def setUp(self):
+        super(ShardingTest, self).setUp()
+        self.mongos = mock.MagicMock()
+        self.mongos.admin.command.return_value = {'msg': 'isdbgrid'}
+        self.mongos.config.databases.find_one.return_value = None
+        self.mongos.config.collections.find_one.return_value = None
+        self.conn.conn = self.mongos
+        self.conn.db = mock.MagicMock()
+
+    def test_shard_collections(self):
+        self.conn._shard_collections('testdb')
+        self.mongos.admin.command.assert_has_calls([
+            mock.call('ismaster'),
+            mock.call('enableSharding', 'testdb'),
+            mock.call('shardCollection', 'testdb.meter',
+                      key={'resource_id': 'hashed'}),
+            mock.call('shardCollection', 'testdb.resource',
+                      key={'_id': 'hashed'}),
+        ], any_order=True)
+        self.conn.db['meter'].ensure_index.assert_any_call(
+            [('resource_id', 'hashed')], name='meter_shard_idx')
+        self.conn.db['resource'].ensure_index.assert_any_call(
+            [('_id', 'hashed')], name='resource_shard_idx')
+        self.conn.db.meter.ensure_index.assert_any_call(
+            [('resource_id', 1), ('timestamp', 1)], name='meter_rid_ts_idx')
+
+    def test_already_sharded(self):
+        self.mongos.config.databases.find_one.return_value = {
+            '_id': 'testdb', 'partitioned': True}
+        self.mongos.config.collections.find_one.return_value = {
+            '_id': 'testdb.meter', 'dropped': False}
+        self.conn._shard_collections('testdb')
+        self.mongos.admin.command.assert_called_once_with('ismaster')
+
+    def test_not_mongos(self):
+        self.mongos.admin.command.return_value = {'ismaster': True}
+        self.conn._shard_collections('testdb')
+        self.mongos.admin.command.assert_called_once_with('ismaster')
+        assert self.conn.db['meter'].ensure_index.called
 
 
 class MeterTest(base.MeterTest, MongoDBEngineTestBase):
@@ -115,6 +503,54 @@ class RawEventTest(base.RawEventTest, MongoDBEngineTestBase):
     pass
 
 
+class ClearExpiredDataTest(base.ClearExpiredDataTest, MongoDBEngineTestBase):
+
+    def test_ttl_index_absent_by_default(self):
+        indexes = self.engine.db.meter.index_information()
+        assert 'meter_ttl' not in indexes
+
+    def test_ttl_index_kept_by_new_connection(self):
+        self.conn._ensure_ttl_index(600)
+        self.addCleanup(self.conn._ensure_ttl_index, -1)
+        conf = mox.Mox().CreateMockAnything()
+        conf.database_connection = 'mongodb://localhost/%s' % (
+            MongoDBEngine.DBNAME)
+        TestConnection(conf)
+        indexes = self.engine.db.meter.index_information()
+        assert indexes['meter_ttl']['expireAfterSeconds'] == 600
+
+    def test_ttl_index_created_by_expirer(self):
+        self.addCleanup(self.conn._ensure_ttl_index, -1)
+        self.conn.clear_expired_metering_data(600)
+        index = self.engine.db.meter.index_information()['meter_ttl']
+        assert index['expireAfterSeconds'] == 600
+
+    def test_ttl_index_created_by_upgrade(self):
+        cfg.CONF.set_override('time_to_live', 600)
+        self.addCleanup(cfg.CONF.clear_override, 'time_to_live')
+        self.addCleanup(self.conn._ensure_ttl_index, -1)
+        self.conn.upgrade()
+        index = self.engine.db.meter.index_information()['meter_ttl']
+        assert index['expireAfterSeconds'] == 600
+
+    def test_ttl_index(self):
+        cfg.CONF.set_override('time_to_live', 600)
+        self.addCleanup(cfg.CONF.clear_override, 'time_to_live')
+        self.conn._ensure_ttl_index(cfg.CONF.time_to_live)
+        index = self.engine.db.meter.index_information()['meter_ttl']
+        assert index['expireAfterSeconds'] == 600
+        self.conn._ensure_ttl_index(60)
+        index = self.engine.db.meter.index_information()['meter_ttl']
+        assert index['expireAfterSeconds'] == 60
+        self.conn._ensure_ttl_index(-1)
+        indexes = self.engine.db.meter.index_information()
+        assert 'meter_ttl' not in indexes
+
+
+class RecordBatchTest(base.RecordBatchTest, MongoDBEngineTestBase):
+    pass
+
+
 class SumTest(base.SumTest, MongoDBEngineTestBase):
 
     def setUp(self):
@@ -148,3 +584,14 @@ class StatisticsTest(base.StatisticsTest, MongoDBEngineTestBase):
     def setUp(self):
         super(StatisticsTest, self).setUp()
         require_map_reduce(self.conn)
+
+
+class RollupTest(base.RollupTest, MongoDBEngineTestBase):
+    pass
+
+
+class RollupEdgeTest(base.RollupEdgeTest, MongoDBEngineTestBase):
+
+    def setUp(self):
+        super(RollupEdgeTest, self).setUp()
+        require_map_reduce(self.conn)
@@ -16,17 +16,24 @@
 """Tests for ceilometer/storage/impl_sqlalchemy.py
 """
 
+import datetime
 import logging
 import os
 import sqlalchemy
 import re
 
 from tests.storage import base
+from ceilometer.collector import meter
+from ceilometer import counter
 from ceilometer.openstack.common import cfg
+from ceilometer.openstack.common import timeutils
 from ceilometer import storage
 from ceilometer.storage import impl_sqlalchemy
 from ceilometer.storage.sqlalchemy.models import Meter, Project, Resource, User
-from ceilometer.storage.sqlalchemy.models import table_args
+from ceilometer.storage.sqlalchemy.models import MeterPartition, MeterRollup
+from ceilometer.storage.sqlalchemy.models import MetaBool, MetaFloat
+from ceilometer.storage.sqlalchemy.models import MetaInt, MetaText
+from ceilometer.storage.sqlalchemy.models import sourceassoc, table_args
 
 
 LOG = logging.getLogger(__name__)
@@ -81,11 +88,11 @@ class SQLAlchemyEngine(base.DBEngineBase):
         return self.conn
 
     def get_sources_by_project_id(self, id):
-        project = self.session.query(Project).get('project-id')
+        project = self.session.query(Project).get(id)
         return map(lambda x: x.id, project.sources)
 
     def get_sources_by_user_id(self, id):
-        user = self.session.query(User).get('user-id')
+        user = self.session.query(User).get(id)
         return map(lambda x: x.id, user.sources)
 
 
@@ -95,6 +102,18 @@ class SQLAlchemyEngineTestBase(base.DBTestBase):
         return SQLAlchemyEngine()
 
 
+class ConnectionTest(SQLAlchemyEngineTestBase):
+
+    def test_is_alive(self):
+        assert self.conn.is_alive()
+
+    def test_close_session(self):
+        session = self.conn.session()
+        self.conn.close_session()
+        assert self.conn.session() is not session
+        assert self.conn.is_alive()
+
+
 class UserTest(base.UserTest, SQLAlchemyEngineTestBase):
     pass
 
@@ -112,7 +131,260 @@ class MeterTest(base.MeterTest, SQLAlchemyEngineTestBase):
 
 
 class RawEventTest(base.RawEventTest, SQLAlchemyEngineTestBase):
-    pass
+
+    def test_get_raw_events_plain_dicts(self):
+        f = storage.EventFilter(user='user-id')
+        for e in self.conn.get_raw_events(f):
+            assert type(e) is dict
+            assert set(e.keys()) == set(['counter_name', 'counter_type',
+                                         'counter_unit', 'counter_volume',
+                                         'user_id', 'project_id',
+                                         'resource_id', 'resource_metadata',
+                                         'timestamp', 'message_id',
+                                         'message_signature', 'source'])
+
+    def test_get_raw_events_fields_selected(self):
+        engine = self.conn.session.get_bind()
+        statements = []
+        do_execute = engine.dialect.do_execute
+
+        def capture(cursor, statement, parameters, context=None):
+            statements.append(statement)
+            return do_execute(cursor, statement, parameters, context)
+        self.stubs.Set(engine.dialect, 'do_execute', capture)
+        f = storage.EventFilter(user='user-id')
+        list(self.conn.get_raw_events(f, fields=['counter_volume']))
+        self.stubs.UnsetAll()
+        assert len(statements) == 1
+        assert 'resource_metadata' not in statements[0]
+        assert 'sourceassoc' not in statements[0]
+
+    def test_get_raw_events_in_batches(self):
+        f = storage.EventFilter(project='project-id')
+        expected = list(self.conn.get_raw_events(f))
+        self.stubs.Set(impl_sqlalchemy, 'STREAM_BATCH_SIZE', 1)
+        results = list(self.conn.get_raw_events(f))
+        assert len(results) > 1
+        assert results == expected
+
+
+class ClearExpiredDataTest(base.ClearExpiredDataTest,
+                           SQLAlchemyEngineTestBase):
+
+    def test_clear_in_batches(self):
+        self.stubs.Set(impl_sqlalchemy, 'EXPIRE_BATCH_SIZE', 1)
+        self.conn.clear_expired_metering_data(180)
+        meter_ids = set(m.id for m in self.conn.session.query(Meter))
+        assert len(meter_ids) == 2
+        rows = self.conn.session.execute(
+            'SELECT meter_id, resource_id FROM sourceassoc').fetchall()
+        for meter_id, resource_id in rows:
+            assert meter_id is None or meter_id in meter_ids
+            assert resource_id in (None, 'resource-id-2', 'resource-id-3')
+
+
+class RecordBatchTest(base.RecordBatchTest, SQLAlchemyEngineTestBase):
+
+    def test_known_keys(self):
+        known = self.conn._known_keys
+        assert ('source', 'batch-1') in known
+        assert ('user', 'user-batch') in known
+        assert ('project', 'project-batch') in known
+        assert ('resource', 'resource-batch') in known
+        assert ('user_id', 'user-batch', 'batch-2') in known
+
+    def test_known_resource_recreated(self):
+        self.conn.session.execute(Resource.__table__.delete())
+        self.conn.record_metering_data(self.batch[0])
+        resources = list(self.conn.get_resources(resource='resource-batch'))
+        assert len(resources) == 1
+        assert resources[0]['metadata']['tag'] == 'batch-0'
+
+    def _count_meter_inserts(self, after_max_id=None):
+        """Count the statements inserting meter rows, calling
+        `after_max_id` once the last meter id has been read.
+        """
+        table = Meter.__table__
+        execute = self.conn.session.execute
+        inserts = []
+
+        def counting_execute(statement, *args, **kwds):
+            result = execute(statement, *args, **kwds)
+            if (isinstance(statement, sqlalchemy.sql.Insert)
+                    and statement.table is table):
+                inserts.append(statement)
+            elif (after_max_id is not None
+                  and 'max(meter.id)' in str(statement)):
+                after_max_id(execute)
+            return result
+        self.stubs.Set(self.conn.session, 'execute', counting_execute)
+        return inserts
+
+    def test_single_meter_insert(self):
+        inserts = self._count_meter_inserts()
+        batch = [dict(msg, message_id='bulk-%d' % i,
+                      resource_metadata={'tag': 'bulk-%d' % i})
+                 for i, msg in enumerate(self.batch)]
+        self.conn.record_metering_data_batch(batch)
+        self.stubs.UnsetAll()
+        assert len(inserts) == 1
+        for msg in batch:
+            f = storage.EventFilter(resource='resource-batch',
+                                    source=msg['source'],
+                                    metaquery={'metadata.tag':
+                                               msg['resource_metadata']
+                                               ['tag']})
+            events = list(self.conn.get_raw_events(f))
+            assert [e['message_id'] for e in events] == [msg['message_id']]
+
+    def test_duplicate_message_id_inserted_concurrently(self):
+        # Another collector stores a redelivered copy of the message
+        # while this batch is written.
+        msg = dict(self.batch[0], resource_metadata={'tag': 'mine'},
+                   message_id='redelivered')
+        table = Meter.__table__
+
+        def insert_copy(execute):
+            execute(table.insert(), {
+                'counter_name': msg['counter_name'],
+                'counter_type': msg['counter_type'],
+                'resource_id': msg['resource_id'],
+                'resource_metadata': {'tag': 'theirs'},
+                'message_id': msg['message_id'],
+            })
+        inserts = self._count_meter_inserts(insert_copy)
+        self.conn.record_metering_data_batch([msg])
+        self.stubs.UnsetAll()
+        # The bulk insert was rolled back for one row at a time.
+        assert len(inserts) == 2
+
+        execute = self.conn.session.execute
+        rows = execute(sqlalchemy.select(
+            [table.c.id, table.c.resource_metadata],
+            table.c.message_id == msg['message_id'])).fetchall()
+        assert len(rows) == 2
+        for meter_id, metadata in rows:
+            tags = execute(sqlalchemy.select(
+                [MetaText.__table__.c.value],
+                MetaText.__table__.c.id == meter_id)).fetchall()
+            sources = execute(sqlalchemy.select(
+                [sourceassoc.c.source_id],
+                sourceassoc.c.meter_id == meter_id)).fetchall()
+            if metadata['tag'] == 'mine':
+                assert tags == [('mine',)]
+                assert sources == [(msg['source'],)]
+            else:
+                assert tags == []
+                assert sources == []
+
+    def test_failed_batch_not_remembered(self):
+        def fail(samples):
+            raise RuntimeError('meter insert failed')
+        self.stubs.Set(self.conn, '_insert_meters', fail)
+        msg = dict(self.batch[0], user_id='user-failed')
+        self.assertRaises(RuntimeError,
+                          self.conn.record_metering_data, msg)
+        assert ('user', 'user-failed') not in self.conn._known_keys
+        assert 'user-failed' not in list(self.conn.get_users())
+
+
+class MetaQueryTest(SQLAlchemyEngineTestBase):
+
+    def prepare_data(self):
+        super(MetaQueryTest, self).prepare_data()
+        c = counter.Counter(
+            'instance',
+            counter.TYPE_CUMULATIVE,
+            unit='instance',
+            volume=1,
+            user_id='user-id',
+            project_id='project-id',
+            resource_id='resource-id-meta',
+            timestamp=datetime.datetime(2012, 7, 2, 10, 44),
+            resource_metadata={'display_name': 'meta-server',
+                               'memory_mb': 512,
+                               'load': 0.5,
+                               'public': True,
+                               'image': {'name': 'ubuntu'},
+                               'description': 'x' * 300,
+                               'tags': ['a', 'b'],
+                               },
+        )
+        self.meta_msg = meter.meter_message_from_counter(
+            c, cfg.CONF.metering_secret, 'test-meta')
+        self.conn.record_metering_data(self.meta_msg)
+
+    def _get_events(self, **metaquery):
+        f = storage.EventFilter(metaquery=dict(
+            ('metadata.%s' % k, v) for k, v in metaquery.iteritems()))
+        return list(self.conn.get_raw_events(f))
+
+    def test_typed_values(self):
+        for key, value in [('memory_mb', 512),
+                           ('load', 0.5),
+                           ('public', True),
+                           ('image.name', 'ubuntu'),
+                           ]:
+            assert self._get_events(**{key: value}) == [self.meta_msg], key
+
+    def test_type_mismatch(self):
+        assert self._get_events(memory_mb='512') == []
+        assert self._get_events(public=False) == []
+
+    def test_all_keys_match(self):
+        assert self._get_events(display_name='meta-server',
+                                memory_mb=512) == [self.meta_msg]
+        assert self._get_events(display_name='test-server',
+                                memory_mb=512) == []
+
+    def test_not_indexed(self):
+        for model in (MetaText, MetaInt, MetaFloat, MetaBool):
+            keys = set(row.meta_key
+                       for row in self.conn.session.query(model))
+            assert 'description' not in keys
+            assert 'tags' not in keys
+
+    def test_colliding_keys(self):
+        c = counter.Counter(
+            'instance',
+            counter.TYPE_CUMULATIVE,
+            unit='instance',
+            volume=1,
+            user_id='user-id',
+            project_id='project-id',
+            resource_id='resource-id-collide',
+            timestamp=datetime.datetime(2012, 7, 2, 10, 45),
+            resource_metadata={'a.b': 1, 'a': {'b': 2}},
+        )
+        msgs = [self.meta_msg,
+                meter.meter_message_from_counter(
+                    c, cfg.CONF.metering_secret, 'test-meta')]
+        msgs[0] = dict(msgs[0], message_id='another-message')
+        self.conn.record_metering_data_batch(msgs)
+        events = self._get_events(**{'a.b': 2})
+        assert [e['resource_id'] for e in events] == ['resource-id-collide']
+        assert len(self._get_events(display_name='meta-server')) == 2
+
+    def test_unsupported_value(self):
+        self.assertRaises(NotImplementedError, self._get_events,
+                          tags=['a', 'b'])
+
+    def test_get_resources(self):
+        q = {'metadata.memory_mb': 512}
+        resources = list(self.conn.get_resources(metaquery=q))
+        assert [r['resource_id'] for r in resources] == ['resource-id-meta']
+
+    def test_get_meters(self):
+        q = {'metadata.image.name': 'ubuntu'}
+        meters = list(self.conn.get_meters(metaquery=q))
+        assert [m['resource_id'] for m in meters] == ['resource-id-meta']
+
+    def test_expired_metadata_deleted(self):
+        timeutils.set_time_override(datetime.datetime(2013, 1, 1))
+        self.addCleanup(timeutils.clear_time_override)
+        self.conn.clear_expired_metering_data(60)
+        for model in (MetaText, MetaInt, MetaFloat, MetaBool):
+            assert self.conn.session.query(model).count() == 0
 
 
 class TestGetEventInterval(base.TestGetEventInterval,
@@ -136,6 +408,279 @@ class StatisticsTest(base.StatisticsTest, SQLAlchemyEngineTestBase):
     pass
 
 
+class RollupTest(base.RollupTest, SQLAlchemyEngineTestBase):
+    pass
+
+
+class RollupEdgeTest(base.RollupEdgeTest, SQLAlchemyEngineTestBase):
+    pass
+
+
+class RollupRaceTest(base.RollupTestBase, SQLAlchemyEngineTestBase):
+
+    def test_create_existing_rollups(self):
+        # A concurrent writer created one of the rollups between the
+        # lookup and the insert.
+        existing = (3600, datetime.datetime(2012, 9, 25, 10),
+                    'volume.size', 'resource-0', 'project1')
+        missing = (3600, datetime.datetime(2012, 9, 27, 10),
+                   'volume.size', 'resource-0', 'project1')
+        with self.conn.session.begin():
+            self.conn._create_rollups(set([existing, missing]))
+        rows = self.conn.session.query(MeterRollup).filter(
+            MeterRollup.resource_id == 'resource-0').filter(
+                MeterRollup.period == 3600).filter(
+                    MeterRollup.bucket >= datetime.datetime(2012, 9, 25, 10))
+        counts = dict((r.bucket, r.sample_count) for r in rows
+                      if r.bucket.hour == 10)
+        assert counts == {datetime.datetime(2012, 9, 25, 10): 1,
+                          datetime.datetime(2012, 9, 27, 10): 0}
+
+
 def test_model_table_args():
     cfg.CONF.database_connection = 'mysql://localhost'
     assert table_args()
+
+
+class QueryPlanTest(SQLAlchemyEngineTestBase):
+    """Check that the SQLite query planner uses the meter indexes for
+    the queries generated from event filters.
+    """
+
+    def _get_plans(self, func, *args):
+        """Call func and return the query plan details of the SELECT
+        statements it runs.
+        """
+        engine = self.conn.session.get_bind()
+        statements = []
+        do_execute = engine.dialect.do_execute
+
+        def capture(cursor, statement, parameters, context=None):
+            if statement.lstrip().startswith('SELECT'):
+                statements.append((statement, parameters))
+            return do_execute(cursor, statement, parameters, context)
+        self.stubs.Set(engine.dialect, 'do_execute', capture)
+        list(func(*args))
+        self.stubs.UnsetAll()
+
+        plans = []
+        for statement, parameters in statements:
+            plan = engine.execute('EXPLAIN QUERY PLAN ' + statement,
+                                  parameters)
+            plans.append([row[3] for row in plan])
+        assert plans
+        return plans
+
+    def _assert_no_full_scan(self, plans):
+        full_scan = re.compile(r'^SCAN (TABLE )?(meter|sourceassoc)\b')
+        for plan in plans:
+            for detail in plan:
+                assert 'INDEX' in detail or not full_scan.match(detail), \
+                    'full scan in query plan %r' % plan
+
+    def test_statistics(self):
+        f = storage.EventFilter(meter='instance',
+                                start='2012-07-02T10:00:00',
+                                end='2012-07-02T11:00:00')
+        self._assert_no_full_scan(
+            self._get_plans(self.conn.get_meter_statistics, f))
+
+    def test_statistics_by_resource(self):
+        f = storage.EventFilter(meter='instance', resource='resource-id')
+        plans = self._get_plans(self.conn.get_meter_statistics, f)
+        self._assert_no_full_scan(plans)
+        assert 'idx_meter_rid_cn_ts' in ' '.join(plans[0])
+
+    def test_statistics_by_project_period(self):
+        f = storage.EventFilter(meter='instance', project='project-id')
+        plans = self._get_plans(self.conn.get_meter_statistics, f, 60)
+        self._assert_no_full_scan(plans)
+        assert 'idx_meter_pid_cn_ts' in ' '.join(plans[0])
+
+    def test_raw_events_by_meter(self):
+        f = storage.EventFilter(meter='instance')
+        self._assert_no_full_scan(
+            self._get_plans(self.conn.get_raw_events, f))
+
+    def test_raw_events_by_user(self):
+        f = storage.EventFilter(user='user-id', meter='instance')
+        plans = self._get_plans(self.conn.get_raw_events, f)
+        self._assert_no_full_scan(plans)
+        assert 'idx_meter_uid_cn_ts' in ' '.join(plans[0])
+
+    def test_raw_events_by_metaquery(self):
+        f = storage.EventFilter(meter='instance',
+                                metaquery={'metadata.tag': 'self.counter'})
+        plans = self._get_plans(self.conn.get_raw_events, f)
+        self._assert_no_full_scan(plans)
+        assert 'ix_meta_text_key' in ' '.join(plans[0])
+
+
+def test_get_partition_range():
+    ts = datetime.datetime(2012, 12, 15, 10, 40)
+    assert impl_sqlalchemy.get_partition_range(ts, 'day') == (
+        'meter_p20121215',
+        datetime.datetime(2012, 12, 15),
+        datetime.datetime(2012, 12, 16))
+    assert impl_sqlalchemy.get_partition_range(ts, 'month') == (
+        'meter_p201212',
+        datetime.datetime(2012, 12, 1),
+        datetime.datetime(2013, 1, 1))
+
+
+class PartitionTest(SQLAlchemyEngineTestBase):
+
+    def setUp(self):
+        super(PartitionTest, self).setUp()
+        cfg.CONF.set_override('sql_partition_period', 'day')
+        self.addCleanup(cfg.CONF.clear_override, 'sql_partition_period')
+        timeutils.set_time_override(datetime.datetime(2012, 7, 3, 12, 0))
+        self.addCleanup(timeutils.clear_time_override)
+
+    def prepare_data(self):
+        super(PartitionTest, self).prepare_data()
+        # A sample of the current day, which stays in the meter table.
+        c = counter.Counter(
+            'instance',
+            counter.TYPE_CUMULATIVE,
+            unit='',
+            volume=3,
+            user_id='user-id',
+            project_id='project-id',
+            resource_id='resource-id-4',
+            timestamp=datetime.datetime(2012, 7, 3, 1, 0),
+            resource_metadata={'display_name': 'test-server',
+                               'tag': 'counter-4'},
+        )
+        msg = meter.meter_message_from_counter(c, cfg.CONF.metering_secret,
+                                               'test-4')
+        self.conn.record_metering_data(msg)
+        self.msgs.append(msg)
+
+    def _get_statements(self, func, *args):
+        """Call func and return the SELECT statements it runs.
+        """
+        engine = self.conn.session.get_bind()
+        statements = []
+        do_execute = engine.dialect.do_execute
+
+        def capture(cursor, statement, parameters, context=None):
+            if statement.lstrip().startswith('SELECT'):
+                statements.append(statement)
+            return do_execute(cursor, statement, parameters, context)
+        self.stubs.Set(engine.dialect, 'do_execute', capture)
+        list(func(*args))
+        self.stubs.UnsetAll()
+        return statements
+
+    def _query_all(self):
+        def by_timestamp(events):
+            return sorted(events, key=lambda e: (e['timestamp'],
+                                                 e['message_id']))
+        instance = storage.EventFilter(meter='instance')
+        return [
+            by_timestamp(self.conn.get_raw_events(storage.EventFilter())),
+            by_timestamp(self.conn.get_raw_events(
+                storage.EventFilter(source='test-1'))),
+            by_timestamp(self.conn.get_raw_events(
+                storage.EventFilter(user='user-id',
+                                    start=datetime.datetime(2012, 7, 2),
+                                    end=datetime.datetime(2012, 7, 4)))),
+            self.conn.get_meter_statistics(instance),
+            self.conn.get_meter_statistics(instance, 3600),
+            self.conn.get_event_interval(instance),
+            sorted(self.conn.get_volume_sum(instance)),
+            sorted(self.conn.get_volume_max(instance)),
+            sorted(self.conn.get_meters()),
+            sorted((r['resource_id'], r['meter'])
+                   for r in self.conn.get_resources()),
+            by_timestamp(self.conn.get_raw_events(
+                storage.EventFilter(metaquery={'metadata.tag': 'counter-4'}))),
+            sorted(r['resource_id'] for r in self.conn.get_resources(
+                metaquery={'metadata.tag': 'self.counter'})),
+        ]
+
+    def test_rotate(self):
+        names = self.conn.rotate_partitions()
+        assert names == ['meter_p20120702']
+        partition = self.conn.session.query(MeterPartition).one()
+        assert partition.start_timestamp == datetime.datetime(2012, 7, 2)
+        assert partition.end_timestamp == datetime.datetime(2012, 7, 3)
+        meters = self.conn.session.query(Meter).all()
+        assert [m.resource_id for m in meters] == ['resource-id-4']
+        rows = self.conn.session.execute(
+            'SELECT resource_id, source_id FROM meter_p20120702').fetchall()
+        assert sorted(tuple(row) for row in rows) == [
+            ('resource-id', 'test-1'),
+            ('resource-id-2', 'test'),
+            ('resource-id-3', 'test'),
+            ('resource-id-alternate', 'test-2'),
+            ('resource-id-alternate', 'test-3'),
+        ]
+        rows = self.conn.session.execute(
+            sourceassoc.select().where(sourceassoc.c.meter_id.isnot(None)))
+        assert [row['meter_id'] for row in rows] == [meters[0].id]
+
+    def test_rotate_in_batches(self):
+        self.stubs.Set(impl_sqlalchemy, 'PARTITION_BATCH_SIZE', 2)
+        self.conn.rotate_partitions()
+        count = self.conn.session.execute(
+            'SELECT COUNT(*) FROM meter_p20120702').scalar()
+        assert count == 5
+
+    def test_queries_unchanged(self):
+        expected = self._query_all()
+        self.conn.rotate_partitions()
+        assert self._query_all() == expected
+
+    def test_partitions_pruned(self):
+        self.conn.rotate_partitions()
+        f = storage.EventFilter(meter='instance',
+                                start=datetime.datetime(2012, 7, 3),
+                                end=datetime.datetime(2012, 7, 4))
+        statements = self._get_statements(self.conn.get_raw_events, f)
+        assert 'meter_p20120702' not in ' '.join(statements)
+        assert len(list(self.conn.get_raw_events(f))) == 1
+        f = storage.EventFilter(meter='instance',
+                                start=datetime.datetime(2012, 7, 2),
+                                end=datetime.datetime(2012, 7, 3))
+        statements = self._get_statements(self.conn.get_raw_events, f)
+        assert 'meter_p20120702' in ' '.join(statements)
+        assert len(list(self.conn.get_raw_events(f))) == 5
+
+    def test_late_sample(self):
+        self.conn.rotate_partitions()
+        late = dict(self.msg1,
+                    timestamp=datetime.datetime(2012, 7, 2, 23, 0),
+                    message_id='late-message')
+        self.conn.record_metering_data(late)
+        assert self.conn.rotate_partitions() == ['meter_p20120702']
+        count = self.conn.session.execute(
+            'SELECT COUNT(*) FROM meter_p20120702').scalar()
+        assert count == 6
+
+    def test_expire_drops_partition(self):
+        self.conn.rotate_partitions()
+        self.conn.clear_expired_metering_data(12 * 60 * 60)
+        engine = self.conn.session.get_bind()
+        assert not engine.has_table('meter_p20120702')
+        assert self.conn.session.query(MeterPartition).count() == 0
+        assert self.conn.session.query(MetaText).filter(
+            MetaText.value == 'self.counter').count() == 0
+        resources = list(self.conn.get_resources())
+        assert [r['resource_id'] for r in resources] == ['resource-id-4']
+
+    def test_expire_keeps_partition(self):
+        self.conn.rotate_partitions()
+        self.conn.clear_expired_metering_data(25 * 60 * 60 + 17 * 60)
+        f = storage.EventFilter(meter='instance')
+        results = list(self.conn.get_raw_events(f))
+        assert sorted(r['resource_id'] for r in results) == [
+            'resource-id-3',
+            'resource-id-4',
+        ]
+        resources = list(self.conn.get_resources())
+        assert sorted(r['resource_id'] for r in resources) == [
+            'resource-id-3',
+            'resource-id-4',
+        ]
@@ -20,6 +20,8 @@
 
 import datetime
 
+from ceilometer.collector import meter
+from ceilometer.openstack.common import cfg
 from ceilometer.openstack.common import rpc
 from ceilometer.tests import base
 
@@ -61,3 +63,103 @@ class TestPublish(base.TestCase):
     def test_notify_topics(self):
         topics = [n[0] for n in self.notifications]
         assert topics == ['metering', 'metering.test']
+
+
+class TestPublishCounters(base.TestCase):
+
+    test_data = [
+        counter.Counter(
+            name=name,
+            type=counter.TYPE_CUMULATIVE,
+            unit='',
+            volume=1,
+            user_id='test',
+            project_id='test',
+            resource_id=resource_id,
+            timestamp=datetime.datetime.utcnow().isoformat(),
+            resource_metadata={'name': 'TestPublish'},
+        )
+        for name, resource_id in [('test', 'a'),
+                                  ('test2', 'a'),
+                                  ('test', 'b'),
+                                  ]]
+
+    def faux_notify(self, context, topic, msg):
+        self.notifications.append((topic, msg))
+
+    def setUp(self):
+        super(TestPublishCounters, self).setUp()
+        self.notifications = []
+        self.stubs.Set(rpc, 'cast', self.faux_notify)
+        cfg.CONF.set_override('publish_batch_size', 2)
+        self.addCleanup(cfg.CONF.clear_override, 'publish_batch_size')
+        publish.publish_counters(None,
+                                 self.test_data,
+                                 'metering',
+                                 'not-so-secret',
+                                 'test',
+                                 )
+
+    def test_notify_topics(self):
+        topics = [n[0] for n in self.notifications]
+        assert topics == ['metering', 'metering',
+                          'metering.test', 'metering.test2']
+
+    def test_batch_messages(self):
+        msgs = [msg for topic, msg in self.notifications
+                if topic == 'metering']
+        for msg in msgs:
+            assert msg['method'] == 'record_metering_data_batch'
+            assert msg['version'] == '1.1'
+        batches = [[s['resource_id'] for s in msg['args']['data']]
+                   for msg in msgs]
+        assert batches == [['a', 'a'], ['b']]
+        for msg in msgs:
+            for s in msg['args']['data']:
+                assert meter.verify_signature(s, 'not-so-secret')
+
+    def test_batch_messages_per_name(self):
+        for topic, msg in self.notifications[2:]:
+            assert msg['method'] == 'record_metering_data_batch'
+            assert msg['version'] == '1.1'
+            for s in msg['args']['data']:
+                assert topic == 'metering.' + s['counter_name']
+        batches = [[s['resource_id'] for s in msg['args']['data']]
+                   for topic, msg in self.notifications[2:]]
+        assert batches == [['a', 'b'], ['a']]
+
+    def test_batch_messages_per_name_size(self):
+        self.notifications = []
+        publish.publish_counters(None, self.test_data * 2, 'metering',
+                                 'not-so-secret', 'test')
+        batches = [(topic, len(msg['args']['data']))
+                   for topic, msg in self.notifications
+                   if topic != 'metering']
+        assert batches == [('metering.test', 2), ('metering.test', 2),
+                           ('metering.test2', 2)]
+
+    def test_batch_by_default(self):
+        cfg.CONF.clear_override('publish_batch_size')
+        self.notifications = []
+        publish.publish_counters(None, self.test_data, 'metering',
+                                 'not-so-secret', 'test')
+        topics = [n[0] for n in self.notifications]
+        assert topics == ['metering', 'metering.test', 'metering.test2']
+
+    def test_no_batch(self):
+        cfg.CONF.set_override('publish_batch_size', 1)
+        self.notifications = []
+        publish.publish_counters(None, self.test_data, 'metering',
+                                 'not-so-secret', 'test')
+        topics = [n[0] for n in self.notifications]
+        assert topics == ['metering', 'metering.test',
+                          'metering', 'metering.test2',
+                          'metering', 'metering.test']
+        for topic, msg in self.notifications:
+            assert msg['method'] == 'record_metering_data'
+
+    def test_no_counters(self):
+        self.notifications = []
+        publish.publish_counters(None, [], 'metering', 'not-so-secret',
+                                 'test')
+        assert self.notifications == []
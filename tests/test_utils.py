@@ -0,0 +1,93 @@
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/utils.py
+"""
+
+import time
+
+from ceilometer.tests import base
+from ceilometer import utils
+
+
+class TestLRUCache(base.TestCase):
+
+    def test_add(self):
+        cache = utils.LRUCache(10)
+        cache.add('a')
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+
+    def test_bounded_size(self):
+        cache = utils.LRUCache(4)
+        for i in range(10):
+            cache.add(i)
+        self.assertTrue(len(cache) <= 4)
+        self.assertTrue(9 in cache)
+        self.assertFalse(0 in cache)
+
+    def test_recently_used_kept(self):
+        cache = utils.LRUCache(4)
+        cache.add('a')
+        for i in range(3):
+            cache.add(i)
+            self.assertTrue('a' in cache)
+        self.assertTrue('a' in cache)
+
+    def test_ttl(self):
+        cache = utils.LRUCache(10, ttl=60)
+        cache.add('a')
+        self.stubs.Set(time, 'time', lambda: 1e12)
+        self.assertFalse('a' in cache)
+
+    def test_disabled(self):
+        cache = utils.LRUCache(0)
+        cache.add('a')
+        self.assertFalse('a' in cache)
+
+    def test_discard(self):
+        cache = utils.LRUCache(10)
+        cache.add('a')
+        cache.discard('a')
+        self.assertFalse('a' in cache)
+        cache.discard('a')
+
+    def test_clear(self):
+        cache = utils.LRUCache(10)
+        cache.add('a')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+class TestUtils(base.TestCase):
+
+    def test_flatten_dict(self):
+        data = {'a': 'A',
+                'b': 'B',
+                'nested': {'a': 'A',
+                           'b': 'B',
+                           'nested': {'a': 'A'},
+                           },
+                }
+        pairs = list(utils.flatten_dict(data))
+        self.assertEqual(pairs, [('a', 'A'),
+                                 ('b', 'B'),
+                                 ('nested.a', 'A'),
+                                 ('nested.b', 'B'),
+                                 ('nested.nested.a', 'A'),
+                                 ])
+
+    def test_flatten_dict_colliding_keys(self):
+        data = {'a.b': 1, 'a': {'b': 2}}
+        pairs = list(utils.flatten_dict(data))
+        self.assertEqual(pairs, [('a.b', 2)])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare the cost of finding the handlers of a notification by
+asking each handler for its event types and with the event type index
+of the collector.
+
+The handlers are the ones installed in the ceilometer.collector
+namespace, and the notifications a mix of the event types seen on a
+busy cloud, handled or not::
+
+  python tools/benchmark_notifications.py --notifications 100000
+"""
+
+import argparse
+import random
+import time
+
+from stevedore import extension
+
+from ceilometer.collector import dispatch
+
+# Relative frequency of the event types sent to the collector.
+EVENT_TYPES = [
+    ('compute.instance.exists', 30),
+    ('compute.instance.update', 30),
+    ('compute.instance.create.start', 3),
+    ('compute.instance.create.end', 3),
+    ('compute.instance.delete.start', 3),
+    ('compute.instance.delete.end', 3),
+    ('scheduler.run_instance.start', 3),
+    ('scheduler.run_instance.end', 3),
+    ('volume.exists', 8),
+    ('volume.create.end', 1),
+    ('image.send', 5),
+    ('image.update', 1),
+    ('port.create.end', 2),
+    ('port.exists', 4),
+    ('floatingip.update.end', 1),
+    ('network.exists', 1),
+]
+
+
+def linear_handlers(extensions, event_type):
+    """Return the handlers of the event type the way the collector
+    used to find them, asking each handler for its event types.
+    """
+    return [ext for ext in extensions
+            if event_type in ext.obj.get_event_types()]
+
+
+def timed(func, repeat):
+    """Return the best wall-clock time of `repeat` calls to func."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the dispatch of notifications to handlers',
+    )
+    parser.add_argument(
+        '--notifications',
+        default=100000,
+        type=int,
+        help='the number of notifications dispatched',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=3,
+        type=int,
+        help='the number of times the notifications are dispatched',
+    )
+    args = parser.parse_args()
+
+    extensions = list(extension.ExtensionManager(
+        namespace='ceilometer.collector',
+        invoke_on_load=True,
+    ))
+    population = []
+    for event_type, weight in EVENT_TYPES:
+        population.extend([event_type] * weight)
+    rand = random.Random(42)
+    events = [rand.choice(population) for i in xrange(args.notifications)]
+    print '%d handlers, %d notifications' % (len(extensions), len(events))
+
+    index = dispatch.EventTypeIndex(extensions)
+    for event_type in set(events):
+        assert (index.get_handlers(event_type) ==
+                linear_handlers(extensions, event_type)), event_type
+
+    def linear():
+        for event_type in events:
+            linear_handlers(extensions, event_type)
+
+    def indexed():
+        for event_type in events:
+            index.get_handlers(event_type)
+
+    for name, func in [('linear', linear), ('index', indexed)]:
+        elapsed = timed(func, args.repeat)
+        print '%-8s %8.3f seconds  %6.2f us/notification' % (
+            name, elapsed, elapsed * 1e6 / len(events))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare the cost of signing metering messages one key and value at
+a time with the single buffer used by compute_signature().
+
+The messages are built from an instance counter whose metadata looks
+like the payload of a compute notification::
+
+  python tools/benchmark_signature.py --messages 100000
+"""
+
+import argparse
+import datetime
+import hashlib
+import hmac
+import time
+
+from ceilometer.collector import meter
+from ceilometer import counter
+
+SECRET = 'not-so-secret'
+
+METADATA = {
+    'display_name': u'testme',
+    'host': 'compute-host-name',
+    'instance_type': u'm1.tiny',
+    'instance_type_id': 2,
+    'memory_mb': 512,
+    'vcpus': 1,
+    'root_gb': 0,
+    'ephemeral_gb': 0,
+    'state': u'active',
+    'image_ref_url': u'http://10.0.2.15:9292/images/UUID',
+    'reservation_id': u'1e3ce043029547f1a61c1996d1a531a3',
+    'availability_zone': None,
+    'image': {'id': u'UUID', 'name': u'ubuntu-12.04'},
+    'flavor': {'id': 2, 'name': u'm1.tiny', 'ram': 512, 'disk': 0},
+}
+
+
+def update_per_pair(message, secret):
+    """Sign the message the way compute_signature() used to, with one
+    hmac update per key and value.
+    """
+    digest_maker = hmac.new(secret, '', hashlib.sha256)
+    for name, value in meter.recursive_keypairs(message):
+        if name == 'message_signature':
+            continue
+        digest_maker.update(name)
+        digest_maker.update(unicode(value).encode('utf-8'))
+    return digest_maker.hexdigest()
+
+
+def timed(func, repeat):
+    """Return the best wall-clock time of `repeat` calls to func."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the signature of metering messages',
+    )
+    parser.add_argument(
+        '--messages',
+        default=100000,
+        type=int,
+        help='the number of messages signed',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=3,
+        type=int,
+        help='the number of times the messages are signed',
+    )
+    args = parser.parse_args()
+
+    messages = []
+    for i in xrange(args.messages):
+        c = counter.Counter(name='instance',
+                            type=counter.TYPE_GAUGE,
+                            unit='instance',
+                            volume=1,
+                            user_id='user-%d' % (i % 50),
+                            project_id='project-%d' % (i % 10),
+                            resource_id='resource-%d' % i,
+                            timestamp=datetime.datetime.utcnow().isoformat(),
+                            resource_metadata=METADATA,
+                            )
+        messages.append(meter.meter_message_from_counter(c, SECRET, 'src'))
+    print '%d messages' % len(messages)
+
+    for msg in messages[:1000]:
+        assert (meter.compute_signature(msg, SECRET) ==
+                update_per_pair(msg, SECRET)), msg
+
+    def per_pair():
+        for msg in messages:
+            update_per_pair(msg, SECRET)
+
+    def joined():
+        for msg in messages:
+            meter.compute_signature(msg, SECRET)
+
+    for name, func in [('per pair', per_pair), ('joined', joined)]:
+        elapsed = timed(func, args.repeat)
+        print '%-8s %8.3f seconds  %6.2f us/message' % (
+            name, elapsed, elapsed * 1e6 / len(messages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare the map-reduce and aggregation framework implementations of
+the MongoDB statistics queries.
+
+The tool fills a scratch database with generated samples and then
+times each statistics query with both implementations. Point it at a
+throw-away database, since it writes directly into the meter
+collection::
+
+  python tools/benchmark_statistics.py \
+      --database-connection mongodb://localhost:27017/ceilometer_bench \
+      --samples 3000000
+"""
+
+import argparse
+import datetime
+import sys
+import time
+
+from ceilometer.openstack.common import cfg
+from ceilometer import storage
+from ceilometer.storage import impl_mongodb
+
+
+def generate(conn, samples, resources, batch_size):
+    """Insert `samples` raw events spread over `resources` resources
+    and 5 projects, one minute apart.
+    """
+    start = datetime.datetime(2012, 1, 1)
+    batch = []
+    for i in xrange(samples):
+        resource = i % resources
+        batch.append({'counter_name': 'instance',
+                      'counter_type': 'cumulative',
+                      'counter_unit': 'instance',
+                      'counter_volume': i % 100,
+                      'user_id': 'user-%d' % (resource % 10),
+                      'project_id': 'project-%d' % (resource % 5),
+                      'resource_id': 'resource-%d' % resource,
+                      'timestamp': start + datetime.timedelta(minutes=i),
+                      'resource_metadata': {},
+                      'source': 'benchmark',
+                      'message_id': str(i),
+                      'message_signature': '',
+                      })
+        if len(batch) >= batch_size:
+            conn.db.meter.insert(batch)
+            batch = []
+    if batch:
+        conn.db.meter.insert(batch)
+
+
+def timed(func, repeat):
+    """Return the best wall-clock time of `repeat` calls to func."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='benchmark the MongoDB statistics queries',
+    )
+    parser.add_argument(
+        '--database-connection',
+        default='mongodb://localhost:27017/ceilometer_bench',
+        help='MongoDB database to fill with generated samples',
+    )
+    parser.add_argument(
+        '--samples',
+        default=3000000,
+        type=int,
+        help='the number of samples to generate',
+    )
+    parser.add_argument(
+        '--resources',
+        default=1000,
+        type=int,
+        help='the number of resources the samples are spread over',
+    )
+    parser.add_argument(
+        '--batch-size',
+        default=1000,
+        type=int,
+        help='the number of samples inserted per round trip',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=3,
+        type=int,
+        help='the number of times each query is run',
+    )
+    parser.add_argument(
+        '--skip-load',
+        default=False,
+        action='store_true',
+        help='reuse the samples already in the database',
+    )
+    args = parser.parse_args()
+
+    cfg.CONF([], project='ceilometer')
+    conf = cfg.CONF
+    conf.set_override('database_connection', args.database_connection)
+    conn = impl_mongodb.Connection(conf)
+
+    if not args.skip_load:
+        conn.db.meter.remove()
+        start = time.time()
+        generate(conn, args.samples, args.resources, args.batch_size)
+        print 'Inserted %d samples in %.1f seconds' % (
+            args.samples, time.time() - start)
+
+    if not conn._use_aggregate():
+        print >>sys.stderr, 'The server does not support aggregate'
+        return 1
+
+    queries = [
+        ('get_meter_statistics (all)',
+         conn.get_meter_statistics,
+         storage.EventFilter(meter='instance')),
+        ('get_meter_statistics (project)',
+         conn.get_meter_statistics,
+         storage.EventFilter(meter='instance', project='project-1')),
+        ('get_volume_sum (project)',
+         lambda f: list(conn.get_volume_sum(f)),
+         storage.EventFilter(meter='instance', project='project-1')),
+        ('get_volume_max (project)',
+         lambda f: list(conn.get_volume_max(f)),
+         storage.EventFilter(meter='instance', project='project-1')),
+        ('get_event_interval (all)',
+         conn.get_event_interval,
+         storage.EventFilter(meter='instance')),
+    ]
+
+    print '%-32s %12s %12s %8s' % ('query', 'map-reduce', 'aggregate',
+                                   'speedup')
+    for name, func, event_filter in queries:
+        conn._aggregate_supported = False
+        map_reduce = timed(lambda: func(event_filter), args.repeat)
+        conn._aggregate_supported = True
+        aggregate = timed(lambda: func(event_filter), args.repeat)
+        speedup = map_reduce / aggregate
+        print '%-32s %11.3fs %11.3fs %7.1fx' % (name, map_reduce, aggregate,
+                                                speedup)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())